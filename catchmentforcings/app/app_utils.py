@@ -51,8 +51,10 @@ def process_var_with_area_as_unit(
         gage_dict["grid_count"] * unit_grid_area
     ) / gage_dict["area_gages2"]
 
-    for gage_id in tqdm(gage_dict[gage_key]):
-        huc_id = gage_dict[gage_dict[gage_key] == gage_id][huc02_key].values[0]
+    for gage_id, huc_id, conversion_ratio in tqdm(
+        zip(gage_dict[gage_key], gage_dict[huc02_key], gage_dict["conversion_ratio"]),
+        total=gage_dict.shape[0],
+    ):
         output_huc_dir = os.path.join(output_dir, huc_id)
         the_file = os.path.join(output_huc_dir, f"{gage_id}_lump_{file_name}.txt")
 
@@ -60,9 +62,6 @@ def process_var_with_area_as_unit(
         the_data = pd.read_csv(the_file, sep=table_sep)
 
         # Apply conversion ratio to specified variables
-        conversion_ratio = gage_dict[gage_dict[gage_key] == gage_id][
-            "conversion_ratio"
-        ].values[0]
         the_data[var_lst] = the_data[var_lst].multiply(conversion_ratio, axis="index")
 
         # Save the processed data back to the file
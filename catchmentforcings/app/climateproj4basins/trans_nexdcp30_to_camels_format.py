@@ -11,8 +11,6 @@ import argparse
 import os
 import sys
 
-from tqdm import tqdm
-
 from pathlib import Path
 
 sys.path.append(os.path.dirname(Path(os.path.abspath(__file__)).parent.parent.parent))
@@ -49,12 +47,17 @@ def main(args):
     ]
     gages = Gages(os.path.join(definitions.DATASET_DIR, "gages"))
 
-    for i in tqdm(range(len(years)), leave=False):
-        for region in regions:
-            gage_dict = gages.sites_in_one_region(region)
-            trans_month_nex_dcp30to_camels_format(
-                input_dir, output_dir, gage_dict, region, years[i]
-            )
+    for region in regions:
+        gage_dict = gages.sites_in_one_region(region)
+        trans_month_nex_dcp30to_camels_format(
+            input_dir,
+            output_dir,
+            gage_dict,
+            region,
+            years,
+            output_format=args.output_format,
+            workers=args.workers,
+        )
 
     print("Trans finished")
 
@@ -85,5 +88,20 @@ if __name__ == "__main__":
         default=[2004, 2008],
         nargs="+",
     )
+    parser.add_argument(
+        "--output_format",
+        dest="output_format",
+        help="txt: a text file for each basin; zarr: a forcing store of all basins; both: both of them",
+        default="txt",
+        choices=["txt", "zarr", "both"],
+        type=str,
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of processes to read the files of years; outputs are still written in the order of years",
+        default=1,
+        type=int,
+    )
     the_args = parser.parse_args()
     main(the_args)
@@ -18,8 +18,10 @@ from catchmentforcings.utils.hydro_utils import (
     unserialize_geopandas,
     hydro_logger,
     t_range_days,
+    year_month_day_hour,
 )
 from catchmentforcings.daymet4basins.basin_daymet_process import calculate_basin_mean
+from catchmentforcings.utils.basin_weights import BasinWeights
 
 
 def main(args):
@@ -77,6 +79,8 @@ def main(args):
             huc02dir, basins_id[i] + "_lump_cida_forcing_leap_pet.txt"
         )
         frames_basin = []
+        # the grid of a basin is same for all years, so its weights are built only once
+        weights = None
         for j in tqdm(range(len(years)), leave=False):
             nc_path = os.path.join(
                 data_dir,
@@ -86,18 +90,15 @@ def main(args):
             if not os.path.isfile(nc_path):
                 raise FileNotFoundError("This file has not been downloaded.")
             ds = xr.open_dataset(nc_path)
-            daily_mean = calculate_basin_mean(ds, basins.geometry[i])
+            if weights is None or not weights.fit_grid(ds):
+                weights = BasinWeights.from_dataset(ds, [basins.geometry[i]])
+            daily_mean = calculate_basin_mean(ds, basins.geometry[i], weights=weights)
             df = daily_mean.to_dataframe()
             # interpolation for the 12.31 data in leap year
             t_range = [str(years[j]) + "-01-01", str(years[j] + 1) + "-01-01"]
             t_range_list = t_range_days(t_range)
             [c, ind1, ind2] = np.intersect1d(
-                pd.to_datetime(
-                    [
-                        str(dt.year) + "-" + str(dt.month) + "-" + str(dt.day)
-                        for dt in df.index
-                    ]
-                ),
+                pd.to_datetime(df.index).normalize().values,
                 t_range_list,
                 return_indices=True,
             )
@@ -105,13 +106,8 @@ def main(args):
             out = np.full([nt, len(var)], np.nan)
             out[ind2, :] = df[var].values[ind1]
             x = pd.DataFrame(out, columns=camels_index[4:])
-            csv_date = pd.to_datetime(t_range_list)
-            year_month_day_hour = pd.DataFrame(
-                [[dt.year, dt.month, dt.day, 12] for dt in csv_date],
-                columns=camels_index[0:4],
-            )
             # concat
-            new_data_df = pd.concat([year_month_day_hour, x], axis=1)
+            new_data_df = pd.concat([year_month_day_hour(t_range_list), x], axis=1)
             frames_basin.append(new_data_df)
 
         df_i = pd.concat(frames_basin)
@@ -22,7 +22,7 @@ from hydrodataset.camels import Camels
 from catchmentforcings.utils.hydro_utils import unserialize_geopandas, hydro_logger
 from catchmentforcings.daymet4basins.basin_daymet_process import (
     generate_boundary_dataset,
-    calculate_basin_grids_pet,
+    calculate_basin_grids_pet_of_years,
 )
 
 
@@ -60,6 +60,8 @@ def main(args):
         save_one_basin_dir = os.path.join(save_dir, basins_id[i])
         if not os.path.isdir(save_one_basin_dir):
             os.makedirs(save_one_basin_dir)
+        save_paths = []
+        ds_bounds = []
         for j in tqdm(range(len(years)), leave=False):
             save_path = os.path.join(
                 save_one_basin_dir, basins_id[i] + "_" + str(years[j]) + "_boundary.nc"
@@ -76,10 +78,13 @@ def main(args):
                 if not os.path.isfile(nc_path):
                     raise FileNotFoundError("This file has not been downloaded.")
             ds = xr.open_dataset(nc_path)
-            ds_bound = generate_boundary_dataset(ds, basins.geometry[i])
-            ds_bound_with_pet = calculate_basin_grids_pet(
-                ds_bound, ["priestley_taylor", "pm_fao56"]
-            )
+            ds_bounds.append(generate_boundary_dataset(ds, basins.geometry[i]))
+            save_paths.append(save_path)
+        # PET of all years of a basin is calculated in one pass, and the elevation is fetched only once
+        ds_bounds_with_pet = calculate_basin_grids_pet_of_years(
+            ds_bounds, ["priestley_taylor", "pm_fao56"]
+        )
+        for ds_bound_with_pet, save_path in zip(ds_bounds_with_pet, save_paths):
             ds_bound_with_pet.to_netcdf(save_path)
 
     hydro_logger.info("\n Finished!")
@@ -0,0 +1,325 @@
+"""
+Run the Daymet pipeline for CAMELS basins in parallel:
+cut nc files to basin bounds and add PET -> (optional) regrid -> basin mean forcings
+
+Tasks whose outputs already exist are skipped, so the script could be run again after an interruption. A task whose
+input file is missing is recorded as failed in the summary, and other tasks still run.
+"""
+
+import argparse
+import os
+import sys
+from functools import partial
+from pathlib import Path
+
+sys.path.append(os.path.dirname(Path(os.path.abspath(__file__)).parent.parent.parent))
+import definitions
+from hydrodataset.camels import Camels
+from catchmentforcings.utils.hydro_utils import unserialize_geopandas, hydro_logger
+from catchmentforcings.utils.forcing_store import ForcingStore, forcing_store_path
+from catchmentforcings.utils.gridded_store import (
+    GriddedStore,
+    gridded_store_path,
+    valid_store_group,
+)
+from catchmentforcings.daymet4basins.basin_daymet_pipeline import (
+    basin_mean_task,
+    cut_and_add_pet,
+    cut_and_add_pet_task,
+    make_task,
+    regrid_task,
+    run_pipeline,
+    store_years_task,
+    valid_nc,
+    valid_txt,
+)
+from catchmentforcings.daymet4basins.basin_daymet_process import resample_nc
+
+
+def find_nc_file(dirs, basin_id, year, file_name):
+    """
+    find the nc file of a basin in a year from the candidate directories
+
+    If a directory has no such file but the GriddedStore of the directory has the year, the basin's group is returned
+    """
+    for a_dir in dirs:
+        nc_path = os.path.join(a_dir, basin_id, basin_id + "_" + str(year) + file_name)
+        if os.path.isfile(nc_path):
+            return nc_path
+    for a_dir in dirs:
+        store = GriddedStore(gridded_store_path(a_dir))
+        if year in store.years(basin_id):
+            return store.group_path(basin_id)
+    raise FileNotFoundError(
+        "This file has not been downloaded: " + basin_id + "_" + str(year) + file_name
+    )
+
+
+def main(args):
+    hydro_logger.info("Start the Daymet pipeline:\n")
+    camels = Camels(os.path.join(definitions.DATASET_DIR, "camels", "camels_us"))
+    camels_shp_file = camels.dataset_description["CAMELS_BASINS_SHP_FILE"]
+    camels_shp = unserialize_geopandas(camels_shp_file)
+    # transform the geographic coordinates to wgs84 i.e. epsg4326  it seems NAD83 is equal to WGS1984 in geopandas
+    basins = camels_shp.to_crs(epsg=4326)
+    assert all(
+        x < y for x, y in zip(basins["hru_id"].values, basins["hru_id"].values[1:])
+    )
+    basins_id = camels.camels_sites["gauge_id"].values.tolist()
+    huc02s = camels.camels_sites["huc_02"].values.tolist()
+    if args.year_range is not None:
+        assert int(args.year_range[0]) < int(args.year_range[1])
+        years = list(range(int(args.year_range[0]), int(args.year_range[1])))
+    else:
+        raise NotImplementedError(
+            "Please enter the time range (Start year and end year)"
+        )
+    unmask_dirs = [
+        os.path.join(definitions.DATASET_DIR, a_dir, "daymet_camels_671_unmask")
+        for a_dir in ["daymet4camels", "daymet4basins"]
+    ]
+    bound_dir = os.path.join(
+        definitions.DATASET_DIR, "daymet4camels", "daymet_camels_671_bound"
+    )
+    resample_dir = os.path.join(
+        definitions.DATASET_DIR, "daymet4camels", "daymet_camels_671_bound_resample"
+    )
+    mean_dir = os.path.join(
+        definitions.DATASET_DIR, "daymet4camels", "basin_mean_forcing", "daymet"
+    )
+    run_kwargs = dict(
+        workers=args.workers,
+        max_tasks_per_child=args.max_tasks_per_child,
+        memory_limit=args.memory_limit,
+    )
+
+    if args.zarr > 0:
+        # all years of a basin are written to its group in a store rather than to yearly nc files
+        bound_store = GriddedStore(gridded_store_path(bound_dir))
+        resample_store = GriddedStore(gridded_store_path(resample_dir, str(args.rs)))
+        store_kwargs = dict(
+            validate=lambda group_path: valid_store_group(group_path, years),
+            **run_kwargs
+        )
+        if "cut" in args.stages:
+            hydro_logger.info("Stage: cut to basin bounds and add PET to a store")
+            bound_store.create()
+            tasks = [
+                make_task(
+                    basins_id[i],
+                    store_years_task,
+                    lambda i=i: (
+                        [
+                            find_nc_file(unmask_dirs, basins_id[i], year, "_nomask.nc")
+                            for year in years
+                        ],
+                        years,
+                        bound_store.group_path(basins_id[i]),
+                        cut_and_add_pet,
+                        (basins.geometry[i],),
+                    ),
+                )
+                for i in range(len(basins_id))
+            ]
+            outputs = [bound_store.group_path(basin_id) for basin_id in basins_id]
+            run_pipeline(
+                tasks,
+                outputs,
+                summary_file=bound_store.store_path + "_pipeline_summary_cut.csv",
+                **store_kwargs
+            )
+        if "regrid" in args.stages:
+            hydro_logger.info("Stage: regrid to a store")
+            resample_store.create()
+            tasks = [
+                make_task(
+                    basin_id,
+                    store_years_task,
+                    lambda basin_id=basin_id: (
+                        [
+                            find_nc_file([bound_dir], basin_id, year, "_boundary.nc")
+                            for year in years
+                        ],
+                        years,
+                        resample_store.group_path(basin_id),
+                        resample_nc,
+                        (args.rs,),
+                    ),
+                )
+                for basin_id in basins_id
+            ]
+            outputs = [resample_store.group_path(basin_id) for basin_id in basins_id]
+            run_pipeline(
+                tasks,
+                outputs,
+                summary_file=resample_store.store_path + "_pipeline_summary_regrid.csv",
+                **store_kwargs
+            )
+
+    if "cut" in args.stages and args.zarr <= 0:
+        hydro_logger.info("Stage: cut to basin bounds and add PET")
+        tasks, outputs = [], []
+        for i in range(len(basins_id)):
+            save_one_basin_dir = os.path.join(bound_dir, basins_id[i])
+            if not os.path.isdir(save_one_basin_dir):
+                os.makedirs(save_one_basin_dir)
+            for year in years:
+                save_path = os.path.join(
+                    save_one_basin_dir, basins_id[i] + "_" + str(year) + "_boundary.nc"
+                )
+                tasks.append(
+                    make_task(
+                        basins_id[i] + "_" + str(year),
+                        cut_and_add_pet_task,
+                        lambda i=i, year=year, save_path=save_path: (
+                            find_nc_file(unmask_dirs, basins_id[i], year, "_nomask.nc"),
+                            save_path,
+                            basins.geometry[i],
+                        ),
+                    )
+                )
+                outputs.append(save_path)
+        run_pipeline(
+            tasks,
+            outputs,
+            validate=valid_nc,
+            summary_file=os.path.join(bound_dir, "pipeline_summary_cut.csv"),
+            **run_kwargs
+        )
+
+    if "regrid" in args.stages and args.zarr <= 0:
+        hydro_logger.info("Stage: regrid")
+        tasks, outputs = [], []
+        for i in range(len(basins_id)):
+            save_one_basin_dir = os.path.join(resample_dir, basins_id[i])
+            if not os.path.isdir(save_one_basin_dir):
+                os.makedirs(save_one_basin_dir)
+            for year in years:
+                save_path = os.path.join(
+                    save_one_basin_dir,
+                    basins_id[i]
+                    + "_"
+                    + str(year)
+                    + "_resample_"
+                    + str(args.rs)
+                    + ".nc",
+                )
+                tasks.append(
+                    make_task(
+                        basins_id[i] + "_" + str(year),
+                        regrid_task,
+                        lambda i=i, year=year, save_path=save_path: (
+                            find_nc_file(
+                                [bound_dir], basins_id[i], year, "_boundary.nc"
+                            ),
+                            save_path,
+                            args.rs,
+                        ),
+                    )
+                )
+                outputs.append(save_path)
+        run_pipeline(
+            tasks,
+            outputs,
+            validate=valid_nc,
+            summary_file=os.path.join(resample_dir, "pipeline_summary_regrid.csv"),
+            **run_kwargs
+        )
+
+    if "mean" in args.stages:
+        hydro_logger.info("Stage: basin mean forcings")
+        tasks, outputs = [], []
+        for i in range(len(basins_id)):
+            huc02dir = os.path.join(mean_dir, huc02s[i])
+            if not os.path.isdir(huc02dir):
+                os.makedirs(huc02dir)
+            save_path = os.path.join(
+                huc02dir, basins_id[i] + "_lump_cida_forcing_leap_pet.txt"
+            )
+            tasks.append(
+                make_task(
+                    basins_id[i],
+                    basin_mean_task,
+                    lambda i=i, save_path=save_path: (
+                        [
+                            find_nc_file(
+                                [bound_dir], basins_id[i], year, "_boundary.nc"
+                            )
+                            for year in years
+                        ],
+                        years,
+                        basins.geometry[i],
+                        save_path,
+                    ),
+                )
+            )
+            outputs.append(save_path)
+        run_pipeline(
+            tasks,
+            outputs,
+            validate=partial(valid_txt, years=years),
+            summary_file=os.path.join(mean_dir, "pipeline_summary_mean.csv"),
+            **run_kwargs
+        )
+        if args.store > 0:
+            hydro_logger.info("Collect basin mean forcings into a forcing store")
+            file_suffix = "_lump_cida_forcing_leap_pet.txt"
+            store = ForcingStore(forcing_store_path(mean_dir, file_suffix))
+            store.import_camels_txt(mean_dir, file_suffix, basins_id, huc02s)
+
+    hydro_logger.info("\n Finished!")
+
+
+# python run_daymet_pipeline.py --year_range 1990 2020 --stages cut mean --workers 32 --memory_limit 4
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the Daymet pipeline for basins in parallel."
+    )
+    parser.add_argument(
+        "--year_range",
+        dest="year_range",
+        help="The start and end years (right open interval)",
+        default=[1990, 1992],
+        nargs="+",
+    )
+    parser.add_argument(
+        "--stages",
+        dest="stages",
+        help="stages to run: cut (cut to bounds and add PET), regrid, mean",
+        default=["cut", "mean"],
+        nargs="+",
+    )
+    parser.add_argument(
+        "--workers", dest="workers", help="number of processes", default=1, type=int
+    )
+    parser.add_argument(
+        "--max_tasks_per_child",
+        dest="max_tasks_per_child",
+        help="a worker process is restarted after this number of tasks",
+        default=20,
+        type=int,
+    )
+    parser.add_argument(
+        "--memory_limit",
+        dest="memory_limit",
+        help="max memory (GB) of each worker process",
+        default=None,
+        type=float,
+    )
+    parser.add_argument("--rs", dest="rs", help="resample size", default=10, type=int)
+    parser.add_argument(
+        "--zarr",
+        dest="zarr",
+        help="if 1, the cut and regrid stages write to Zarr stores with a group for each basin rather than nc files",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--store",
+        dest="store",
+        help="if 1, basin mean forcings are also saved in a forcing store of all basins",
+        default=0,
+        type=int,
+    )
+    the_args = parser.parse_args()
+    main(the_args)
@@ -60,10 +60,16 @@ def trans_daymet(args):
     gage_dict = gages.gages_sites
     chosen_gage_dict = choose_gages_in_dict(gage_dict, gage_ids_chosen)
     region = "NorthEast"
-    for year in years:
-        trans_daymet_to_camels_format(
-            daymet_dir, output_dir, chosen_gage_dict, region, year
-        )
+    trans_daymet_to_camels_format(
+        daymet_dir,
+        output_dir,
+        chosen_gage_dict,
+        region,
+        years,
+        output_format=args.output_format,
+        workers=args.workers,
+        chunksize=args.chunksize,
+    )
     insert_daymet_value_in_leap_year(
         output_dir,
         t_range=[f"{str(years[0])}-01-01", f"{str(years[-1]+1)}-01-01"],
@@ -110,5 +116,27 @@ if __name__ == "__main__":
         default=[1980, 2020],
         nargs="+",
     )
+    parser.add_argument(
+        "--output_format",
+        dest="output_format",
+        help="txt: a text file for each basin; zarr: a forcing store of all basins; both: both of them",
+        default="txt",
+        choices=["txt", "zarr", "both"],
+        type=str,
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of processes to read the files of years; outputs are still written in the order of years",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        help="If given, stream the downloaded files in chunks of so many rows to bound the memory",
+        default=None,
+        type=int,
+    )
     the_args = parser.parse_args()
     trans_daymet(the_args)
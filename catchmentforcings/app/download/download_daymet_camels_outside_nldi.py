@@ -20,6 +20,11 @@ from hydrodataset.camels import Camels
 from catchmentforcings.daymet4basins.basin_daymet_process import (
     download_daymet_by_geom_bound,
 )
+from catchmentforcings.daymet4basins.daymet_bulk_download import (
+    download_daymet_bulk,
+    open_daymet_files,
+)
+from catchmentforcings.utils.gridded_store import GriddedStore, gridded_store_path
 from catchmentforcings.utils.hydro_utils import (
     unserialize_geopandas,
     hydro_logger,
@@ -134,6 +139,58 @@ def main(args):
                     need_download_year_index_lst.append(j)
             need_download_index[basins_id[i]] = need_download_year_index_lst
         serialize_json(need_download_index, need_download_index_file)
+    # if zarr > 0, all years of a basin are written to its group in a store rather than to yearly nc files
+    store = GriddedStore(gridded_store_path(save_dir)) if args.zarr > 0 else None
+
+    def downloaded(basin_id, year):
+        if store is not None:
+            return year in store.years(basin_id)
+        return os.path.isfile(
+            os.path.join(save_dir, basin_id, basin_id + "_" + str(year) + "_nomask.nc")
+        )
+
+    if args.bulk > 0:
+        # all subsets are downloaded asynchronously in one session, and then saved for each basin and year
+        jobs = []
+        job_basins = []
+        for i in range(len(basins_id)):
+            job_years = [
+                years[j]
+                for j in need_download_index[basins_id[i]]
+                if not downloaded(basins_id[i], years[j])
+            ]
+            if len(job_years) > 0:
+                jobs.append((basins.geometry[i], job_years))
+                job_basins.append(basins_id[i])
+        job_files = download_daymet_bulk(
+            jobs,
+            os.path.join(save_dir, "bulk_download"),
+            variables=var,
+            max_concurrency=args.bulk,
+        )
+        for basin_id, year_files in zip(job_basins, job_files):
+            if store is not None:
+                store.write(
+                    basin_id,
+                    xr.concat(
+                        [open_daymet_files(files) for files in year_files.values()],
+                        dim="time",
+                        data_vars="minimal",
+                        coords="minimal",
+                        compat="override",
+                    ),
+                )
+                continue
+            save_one_basin_dir = os.path.join(save_dir, basin_id)
+            if not os.path.isdir(save_one_basin_dir):
+                os.makedirs(save_one_basin_dir)
+            for year, files in year_files.items():
+                save_path = os.path.join(
+                    save_one_basin_dir, basin_id + "_" + str(year) + "_nomask.nc"
+                )
+                open_daymet_files(files).to_netcdf(save_path)
+        hydro_logger.info("\n Finished!")
+        return
     #  Download data
     for i in tqdm(range(len(basins_id))):
         save_one_basin_dir = os.path.join(save_dir, basins_id[i])
@@ -144,19 +201,24 @@ def main(args):
             save_path = os.path.join(
                 save_one_basin_dir, basins_id[i] + "_" + str(years[j]) + "_nomask.nc"
             )
-            if os.path.isfile(save_path):
+            if downloaded(basins_id[i], years[j]):
                 print(save_path + " has been downloaded.")
             else:
                 # download from url directly, no mask of geometry or geometry's boundary
                 daily = download_daymet_by_geom_bound(
                     basins.geometry[i], dates, variables=var, boundary=False
                 )
-                daily.to_netcdf(save_path)
+                if store is not None:
+                    store.write(basins_id[i], daily)
+                else:
+                    daily.to_netcdf(save_path)
 
     hydro_logger.info("\n Finished!")
 
 
 # python download_daymet_camels_outside_nldi.py --year_range 1990 1991
+# python download_daymet_camels_outside_nldi.py --year_range 1990 1991 --bulk 8
+# python download_daymet_camels_outside_nldi.py --year_range 1990 1991 --bulk 8 --zarr 1
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Download Daymet within the boundary of each basin in CAMELS"
@@ -168,5 +230,19 @@ if __name__ == "__main__":
         default=[1993, 1994],
         nargs="+",
     )
+    parser.add_argument(
+        "--bulk",
+        dest="bulk",
+        help="If > 0, download all subsets asynchronously with this number of concurrent requests",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--zarr",
+        dest="zarr",
+        help="if 1, write to a Zarr store with a group for each basin rather than nc files",
+        default=0,
+        type=int,
+    )
     the_args = parser.parse_args()
     main(the_args)
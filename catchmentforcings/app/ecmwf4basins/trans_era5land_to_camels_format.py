@@ -10,7 +10,6 @@ Copyright (c) 2021-2022 Wenyu Ouyang. All rights reserved.
 import argparse
 import os
 import sys
-from tqdm import tqdm
 from pathlib import Path
 
 from hydrodataset import Camels
@@ -51,10 +50,17 @@ def main(args):
         )
     gage_dict = camels.camels_sites.to_dict(orient="list")
 
-    for i in tqdm(range(len(years)), leave=False):
-        trans_era5_land_to_camels_format(
-            nldas_dir, output_dir, gage_dict, region, years[i], time_zone
-        )
+    trans_era5_land_to_camels_format(
+        nldas_dir,
+        output_dir,
+        gage_dict,
+        region,
+        years,
+        time_zone,
+        output_format=args.output_format,
+        workers=args.workers,
+        chunksize=args.chunksize,
+    )
     print("Trans finished")
 
 
@@ -117,6 +123,28 @@ if __name__ == "__main__":
         default=0,
         type=int,
     )
+    parser.add_argument(
+        "--output_format",
+        dest="output_format",
+        help="txt: a text file for each basin; zarr: a forcing store of all basins; both: both of them",
+        default="txt",
+        choices=["txt", "zarr", "both"],
+        type=str,
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of processes to read the files of years; outputs are still written in the order of years",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        help="If given, stream the downloaded files in chunks of so many rows to bound the memory",
+        default=None,
+        type=int,
+    )
     the_args = parser.parse_args()
     if the_args.move > 0:
         process_camels_us(the_args)
@@ -11,7 +11,6 @@ Copyright (c) 2021-2022 Wenyu Ouyang. All rights reserved.
 import argparse
 import os
 import sys
-from tqdm import tqdm
 from pathlib import Path
 
 sys.path.append(os.path.dirname(Path(os.path.abspath(__file__)).parent.parent.parent))
@@ -49,31 +48,47 @@ def main(args):
     )
     gage_dict = camels.sites.to_dict(orient="list")
 
-    for i in tqdm(range(len(years)), leave=False):
-        region_param = "camels" if camels_region == "US" else camels_name
-        if dataset_name == "PML_V2":
-            trans_8day_pmlv2_to_camels_format(
-                modis_et_dir, output_dir, gage_dict, region_param, years[i]
-            )
-        elif dataset_name == "MOD16A2_105":
-            trans_8day_modis16a2v105_to_camels_format(
-                modis_et_dir, output_dir, gage_dict, region_param, years[i]
-            )
-        elif dataset_name in ["MOD16A2_006", "MOD16A2GF_061"]:
-            version = "006" if dataset_name == "MOD16A2_006" else "gf061"
-            trans_8day_modis16a2_to_camels_format(
-                modis_et_dir,
-                output_dir,
-                gage_dict,
-                region_param,
-                years[i],
-                version=version,
-            )
-        else:
-            raise FileNotFoundError(
-                "No such data! Please check if you have chosen correctly. "
-                "We only provide PML_V2 and MOD16A2_105 now!"
-            )
+    region_param = "camels" if camels_region == "US" else camels_name
+    if dataset_name == "PML_V2":
+        trans_8day_pmlv2_to_camels_format(
+            modis_et_dir,
+            output_dir,
+            gage_dict,
+            region_param,
+            years,
+            output_format=args.output_format,
+            workers=args.workers,
+            chunksize=args.chunksize,
+        )
+    elif dataset_name == "MOD16A2_105":
+        trans_8day_modis16a2v105_to_camels_format(
+            modis_et_dir,
+            output_dir,
+            gage_dict,
+            region_param,
+            years,
+            output_format=args.output_format,
+            workers=args.workers,
+            chunksize=args.chunksize,
+        )
+    elif dataset_name in ["MOD16A2_006", "MOD16A2GF_061"]:
+        version = "006" if dataset_name == "MOD16A2_006" else "gf061"
+        trans_8day_modis16a2_to_camels_format(
+            modis_et_dir,
+            output_dir,
+            gage_dict,
+            region_param,
+            years,
+            version=version,
+            output_format=args.output_format,
+            workers=args.workers,
+            chunksize=args.chunksize,
+        )
+    else:
+        raise FileNotFoundError(
+            "No such data! Please check if you have chosen correctly. "
+            "We only provide PML_V2 and MOD16A2_105 now!"
+        )
 
     print("Trans finished")
 
@@ -127,5 +142,27 @@ if __name__ == "__main__":
         default=[2001, 2024],
         nargs="+",
     )
+    parser.add_argument(
+        "--output_format",
+        dest="output_format",
+        help="txt: a text file for each basin; zarr: a forcing store of all basins; both: both of them",
+        default="txt",
+        choices=["txt", "zarr", "both"],
+        type=str,
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of processes to read the files of years; outputs are still written in the order of years",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        help="If given, stream the downloaded files in chunks of so many rows to bound the memory",
+        default=None,
+        type=int,
+    )
     the_args = parser.parse_args()
     main(the_args)
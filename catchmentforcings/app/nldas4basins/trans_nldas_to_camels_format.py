@@ -7,7 +7,6 @@ import os
 import sys
 
 import pandas as pd
-from tqdm import tqdm
 
 from pathlib import Path
 from hydrodataset.camels import Camels
@@ -43,10 +42,16 @@ def main(args):
         gage_dict = pd.read_csv(gage_file, dtype={sta_id_str: str, huc_str: str})
     else:
         raise FileNotFoundError("Please give it a gage_dict file")
-    for i in tqdm(range(len(years)), leave=False):
-        trans_daily_nldas_to_camels_format(
-            nldas_dir, output_dir, gage_dict, region, years[i]
-        )
+    trans_daily_nldas_to_camels_format(
+        nldas_dir,
+        output_dir,
+        gage_dict,
+        region,
+        years,
+        output_format=args.output_format,
+        workers=args.workers,
+        chunksize=args.chunksize,
+    )
     _2ndprocess(
         camels,
         gage_dict["gauge_id"].values,
@@ -122,5 +127,27 @@ if __name__ == "__main__":
         default=[1990, 1992],
         nargs="+",
     )
+    parser.add_argument(
+        "--output_format",
+        dest="output_format",
+        help="txt: a text file for each basin; zarr: a forcing store of all basins; both: both of them",
+        default="txt",
+        choices=["txt", "zarr", "both"],
+        type=str,
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of processes to read the files of years; outputs are still written in the order of years",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        help="If given, stream the downloaded files in chunks of so many rows to bound the memory",
+        default=None,
+        type=int,
+    )
     the_args = parser.parse_args()
     main(the_args)
@@ -12,7 +12,6 @@ import argparse
 import os
 import sys
 import pandas as pd
-from tqdm import tqdm
 from pathlib import Path
 from hydrodataset.camels import Camels
 
@@ -55,20 +54,33 @@ def main(args):
         gage_dict = gage_dict.set_index("gauge_id").loc[camels591id].reset_index()
     if dataset_name == "SMAP":
         _2ndprocess(camels, camels591id, gage_dict, output_dir)
-    for i in tqdm(range(len(years)), leave=False):
-        if dataset_name == "NASA_USDA_SMAP":
-            trans_nasa_usda_smap_to_camels_format(
-                smap_dir, output_dir, gage_dict, region, years[i]
-            )
-        elif dataset_name == "SMAP":
-            trans_smap_to_camels_format(
-                smap_dir, output_dir, gage_dict, region, years[i]
-            )
-        else:
-            raise FileNotFoundError(
-                "No such data! Please check if you have chosen correctly. "
-                "We only provide PML_V2 and MOD16A2_105 now!"
-            )
+    if dataset_name == "NASA_USDA_SMAP":
+        trans_nasa_usda_smap_to_camels_format(
+            smap_dir,
+            output_dir,
+            gage_dict,
+            region,
+            years,
+            output_format=args.output_format,
+            workers=args.workers,
+            chunksize=args.chunksize,
+        )
+    elif dataset_name == "SMAP":
+        trans_smap_to_camels_format(
+            smap_dir,
+            output_dir,
+            gage_dict,
+            region,
+            years,
+            output_format=args.output_format,
+            workers=args.workers,
+            chunksize=args.chunksize,
+        )
+    else:
+        raise FileNotFoundError(
+            "No such data! Please check if you have chosen correctly. "
+            "We only provide PML_V2 and MOD16A2_105 now!"
+        )
 
     print("Trans finished")
 
@@ -113,5 +125,27 @@ if __name__ == "__main__":
         default="camels591",
         type=str,
     )
+    parser.add_argument(
+        "--output_format",
+        dest="output_format",
+        help="txt: a text file for each basin; zarr: a forcing store of all basins; both: both of them",
+        default="txt",
+        choices=["txt", "zarr", "both"],
+        type=str,
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of processes to read the files of years; outputs are still written in the order of years",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        help="If given, stream the downloaded files in chunks of so many rows to bound the memory",
+        default=None,
+        type=int,
+    )
     the_args = parser.parse_args()
     main(the_args)
@@ -1,61 +1,44 @@
 """
 Process MODIS16A2V105 ET data for basins
 """
-import fnmatch
 import logging
 import os
-import numpy as np
-import pandas as pd
 
+from catchmentforcings.utils.forcing_store import (
+    OUTPUT_FORMATS,
+    ForcingStore,
+    forcing_store_path,
+)
+from catchmentforcings.utils.gage_splitter import GageSplitter
+from catchmentforcings.utils.gee_transformer import (
+    GeeProductSpec,
+    gage_huc_keys,
+    iter_gee_years,
+    spec_for_output_format,
+)
+from catchmentforcings.utils.year_manifest import append_year_to_txt
 
-def trans_month_nex_dcp30to_camels_format(
-    nexdcp30_dir, output_dir, gage_dict, region, year
-):
-    """
-    Transform NEX-DCP30 data downloaded from GEE to the format in CAMELS.
-    https://code.earthengine.google.com/5edfca6263bea36f5c093fc6b80a68aa
-
-    Parameters
-    ----------
-    nexdcp30_dir
-        the original data's directory
-    output_dir
-        the transformed data's directory
-    gage_dict
-        a dict containing gage's ids and the correspond HUC02 ids
-    region
-        we named the file downloaded from GEE as daymet_<region>_mean_<year>.csv,
-        because we use GEE code to generate data for each year for each shape file (region) containing some basins.
-        For example, if we use the basins' shpfile in CAMELS, the region is "camels".
-    year
-        we use GEE code to generate data for each year, so each year for each region has one data file.
-    Returns
-    -------
-    None
-
-    """
-    # you can add features or delete features, or change the order, which depends on your txt content
-    nexdcp30_dataset = [
-        "gage_id",
-        "time_start",
-        "pr_mean",
-        "pr_quartile25",
-        "pr_median",
-        "pr_quartile75",
-        "tasmin_mean",
-        "tasmin_quartile25",
-        "tasmin_median",
-        "tasmin_quartile75",
-        "tasmax_mean",
-        "tasmax_quartile25",
-        "tasmax_median",
-        "tasmax_quartile75",
-    ]
-    camels_format_index = [
-        "Year",
-        "Mnth",
-        "Day",
-        "Hr",
+# you can add features or delete features, or change the order, which depends on your txt content
+NEXDCP30_GEE_SPEC = GeeProductSpec(
+    "nexdcp30",
+    ["nex_dcp30_{region}_mean_{year}*.csv"],
+    [
+        [
+            "pr_mean",
+            "pr_quartile25",
+            "pr_median",
+            "pr_quartile75",
+            "tasmin_mean",
+            "tasmin_quartile25",
+            "tasmin_median",
+            "tasmin_quartile75",
+            "tasmax_mean",
+            "tasmax_quartile25",
+            "tasmax_median",
+            "tasmax_quartile75",
+        ]
+    ],
+    [
         "pr_mean(kg/(m^2*s))",
         "pr_quartile25(kg/(m^2*s))",
         "pr_median(kg/(m^2*s))",
@@ -68,54 +51,29 @@ def trans_month_nex_dcp30to_camels_format(
         "tasmax_quartile25(K)",
         "tasmax_median(K)",
         "tasmax_quartile75(K)",
-    ]
-
-    if "STAID" in gage_dict.keys():
-        gage_id_key = "STAID"
-    elif "gauge_id" in gage_dict.keys():
-        gage_id_key = "gauge_id"
-    elif "gage_id" in gage_dict.keys():
-        gage_id_key = "gage_id"
-    else:
-        raise NotImplementedError("No such gage id name")
-
-    if "HUC02" in gage_dict.keys():
-        huc02_key = "HUC02"
-    elif "huc_02" in gage_dict.keys():
-        huc02_key = "huc_02"
-    else:
-        raise NotImplementedError("No such huc02 id")
+    ],
+    "_lump_nexdcp30.txt",
+)
 
-    # because this function only work for one year and one region, it's better to chose avg and sum files at first
-    for f_name in os.listdir(nexdcp30_dir):
-        if fnmatch.fnmatch(
-            f_name, "nex_dcp30_" + region + "_mean_" + str(year) + "*.csv"
-        ):
-            nexdcp30_data_file = os.path.join(nexdcp30_dir, f_name)
 
-    data_temp = pd.read_csv(
-        nexdcp30_data_file, sep=",", dtype={nexdcp30_data_file[0]: str}
-    )
+def _write_nexdcp30_year(
+    data_by_gage: GageSplitter,
+    year: int,
+    output_dir: str,
+    gage_dict,
+    gage_id_key: str,
+    huc02_key: str,
+    output_format: str,
+):
+    store_frames = {}
     for i_basin in range(len(gage_dict[gage_id_key])):
-        basin_data = data_temp[
-            data_temp[nexdcp30_dataset[0]].values.astype(int)
-            == int(gage_dict[gage_id_key][i_basin])
-        ]
+        basin_data = data_by_gage.get(gage_dict[gage_id_key][i_basin])
         if basin_data.shape[0] == 0:
             logging.warning("No data for basin %s", gage_dict[gage_id_key][i_basin])
             continue
-        # get Year,Month,Day,Hour info
-        csv_date = pd.to_datetime(basin_data[nexdcp30_dataset[1]])
-        # the hour is set to 12, as 12 is the average hour of a day
-        year_month_day_hour = pd.DataFrame(
-            [[dt.year, dt.month, dt.day, 12] for dt in csv_date],
-            columns=camels_format_index[0:4],
+        new_data_df = basin_data.drop(columns=NEXDCP30_GEE_SPEC.id_col).reset_index(
+            drop=True
         )
-        data_df = pd.DataFrame(
-            basin_data.iloc[:, 2:].values, columns=camels_format_index[4:]
-        )
-        # concat
-        new_data_df = pd.concat([year_month_day_hour, data_df], axis=1)
         # output the result
         huc_id = gage_dict[huc02_key][i_basin]
         output_huc_dir = os.path.join(output_dir, huc_id)
@@ -139,6 +97,12 @@ def trans_month_nex_dcp30to_camels_format(
             out_file_name_lst = ["historical"]
         for i in range(len(new_data_df_lst)):
             _data_df = new_data_df_lst[i]
+            if output_format != "txt":
+                store_frames.setdefault(out_file_name_lst[i], {})[
+                    gage_dict[gage_id_key][i_basin]
+                ] = _data_df.reset_index(drop=True)
+                if output_format == "zarr":
+                    continue
             output_file = os.path.join(
                 output_huc_dir,
                 gage_dict[gage_id_key][i_basin]
@@ -152,14 +116,63 @@ def trans_month_nex_dcp30to_camels_format(
                 "year",
                 str(year),
             )
-            if os.path.isfile(output_file):
-                data_old = pd.read_csv(output_file, sep=" ")
-                years = np.unique(data_old[camels_format_index[0]].values)
-                if year in years:
-                    continue
-                else:
-                    os.remove(output_file)
-                    _data_df = pd.concat([data_old, _data_df]).sort_values(
-                        by=camels_format_index[0:3]
-                    )
-            _data_df.to_csv(output_file, header=True, index=False, sep=" ")
+            append_year_to_txt(output_file, _data_df, year, sep=" ")
+    huc02 = dict(zip(gage_dict[gage_id_key], gage_dict[huc02_key]))
+    for projection, frames in store_frames.items():
+        store = ForcingStore(
+            forcing_store_path(output_dir, "_lump_nexdcp30_" + projection + ".txt")
+        )
+        store.write_camels_frames(frames, huc02)
+
+
+def trans_month_nex_dcp30to_camels_format(
+    nexdcp30_dir, output_dir, gage_dict, region, year, output_format="txt", workers=1
+):
+    """
+    Transform NEX-DCP30 data downloaded from GEE to the format in CAMELS.
+    https://code.earthengine.google.com/5edfca6263bea36f5c093fc6b80a68aa
+
+    Parameters
+    ----------
+    nexdcp30_dir
+        the original data's directory
+    output_dir
+        the transformed data's directory
+    gage_dict
+        a dict containing gage's ids and the correspond HUC02 ids
+    region
+        we named the file downloaded from GEE as daymet_<region>_mean_<year>.csv,
+        because we use GEE code to generate data for each year for each shape file (region) containing some basins.
+        For example, if we use the basins' shpfile in CAMELS, the region is "camels".
+    year
+        we use GEE code to generate data for each year, so each year for each region has one data file.
+        It could also be a list of years.
+    output_format
+        "txt": a text file for each basin; "zarr": a ForcingStore for all basins in output_dir; "both": both of them;
+        each projection ("historical", "rcp26", ...) has its own store
+    workers
+        number of processes to read the files of years when year is a list of years
+    Returns
+    -------
+    None
+
+    """
+    assert output_format in OUTPUT_FORMATS
+    gage_id_key, huc02_key = gage_huc_keys(gage_dict)
+    if huc02_key is None:
+        raise NotImplementedError("No such huc02 id")
+
+    years = [year] if isinstance(year, int) else list(year)
+    spec = spec_for_output_format(NEXDCP30_GEE_SPEC, output_format)
+    for a_year, data_by_gage in iter_gee_years(
+        spec, nexdcp30_dir, region, years, workers
+    ):
+        _write_nexdcp30_year(
+            data_by_gage,
+            a_year,
+            output_dir,
+            gage_dict,
+            gage_id_key,
+            huc02_key,
+            output_format,
+        )
@@ -1,5 +1,4 @@
 import collections
-import glob
 import logging
 import os
 from typing import Union, List
@@ -11,6 +10,18 @@ import xarray as xr
 from hydrodataset import Camels, HydroDataset
 from hydroutils import hydro_time
 
+from catchmentforcings.utils.forcing_store import (
+    CAMELS_TIME_COLS,
+    FORCING_DTYPE,
+    ForcingStore,
+    forcing_store_path,
+)
+from catchmentforcings.utils.forcing_cube import ForcingCube, forcing_cube_path
+from catchmentforcings.utils.gridded_store import GriddedStore, gridded_store_path
+from catchmentforcings.utils.hydro_utils import CAMELS_DATE_DTYPE
+from catchmentforcings.utils.nc_file_index import NcFileIndex, open_basin_datasets
+from catchmentforcings.utils.site_index import SiteIndex
+
 
 class Daymet4Camels(HydroDataset):
     """
@@ -39,6 +50,13 @@ class Daymet4Camels(HydroDataset):
         if download:
             self.download_data_source()
         self.camels671_sites = self.read_site_info()
+        # id -> (row, HUC02) of all basins, so no lookup compares the whole id column
+        self.site_index = SiteIndex(
+            self.camels671_sites["gauge_id"].values,
+            self.camels671_sites["huc_02"].values,
+        )
+        # the cube of basin mean data, kept for later calls so its sources are checked once
+        self._basin_mean_cube = None
 
     def get_name(self):
         return "DAYMET4CAMELS"
@@ -58,6 +76,13 @@ class Daymet4Camels(HydroDataset):
             daymet_db, "daymet_camels_671_bound_resample"
         )
         forcing_basin_mean_dir = os.path.join(daymet_db, "basin_mean_forcing")
+        # all basins' mean forcings in one store, see catchmentforcings.utils.forcing_store
+        forcing_basin_mean_store = forcing_store_path(
+            os.path.join(forcing_basin_mean_dir, "daymet"),
+            "_lump_cida_forcing_leap_pet.txt",
+        )
+        # a memory-mapped cube of the store (or text files), see catchmentforcings.utils.forcing_cube
+        forcing_basin_mean_cube = forcing_cube_path(forcing_basin_mean_store)
 
         return collections.OrderedDict(
             DAYMET4BASINS_DIR=daymet_db,
@@ -67,6 +92,8 @@ class Daymet4Camels(HydroDataset):
             DAYMET4_DIR=forcing_dir,
             DAYMET4_RESAMPLE_DIR=forcing_resample_dir,
             DAYMET4_BASIN_MEAN_DIR=forcing_basin_mean_dir,
+            DAYMET4_BASIN_MEAN_STORE=forcing_basin_mean_store,
+            DAYMET4_BASIN_MEAN_CUBE=forcing_basin_mean_cube,
         )
 
     def download_data_source(self):
@@ -99,16 +126,25 @@ class Daymet4Camels(HydroDataset):
     ):
         return self.camels.read_target_cols(usgs_id_lst, t_range, target_cols)
 
-    def read_basin_mean_daymet4(self, usgs_id, var_lst, t_range_list):
-        print("reading %s forcing data", usgs_id)
-        gage_id_df = self.camels671_sites
-        huc = gage_id_df[gage_id_df["gauge_id"] == usgs_id]["huc_02"].values[0]
-
+    def _basin_mean_file(self, usgs_id) -> str:
+        huc = self.site_index.huc02(usgs_id)
         data_folder = self.data_source_description["DAYMET4_BASIN_MEAN_DIR"]
-        data_file = os.path.join(
+        return os.path.join(
             data_folder, "daymet", huc, f"{usgs_id}_lump_cida_forcing_leap_pet.txt"
         )
-        data_temp = pd.read_csv(data_file, sep=r"\s+", header=None, skiprows=1)
+
+    def read_basin_mean_daymet4(
+        self, usgs_id, var_lst, t_range_list, dtype: str = FORCING_DTYPE
+    ):
+        print("reading %s forcing data", usgs_id)
+        data_file = self._basin_mean_file(usgs_id)
+        data_temp = pd.read_csv(
+            data_file,
+            sep=r"\s+",
+            header=None,
+            skiprows=1,
+            dtype={i: CAMELS_DATE_DTYPE for i in range(len(CAMELS_TIME_COLS))},
+        )
         forcing_lst = [
             "Year",
             "Mnth",
@@ -131,7 +167,7 @@ class Daymet4Camels(HydroDataset):
         nf = len(var_lst)
         [c, ind1, ind2] = np.intersect1d(date, t_range_list, return_indices=True)
         nt = c.shape[0]
-        out = np.empty([nt, nf])
+        out = np.empty([nt, nf], dtype=dtype)
 
         for k in range(nf):
             ind = forcing_lst.index(var_lst[k])
@@ -145,6 +181,7 @@ class Daymet4Camels(HydroDataset):
         var_lst: list = None,
         concat: bool = False,
         resample: Union[int, float] = 1,
+        dtype: str = FORCING_DTYPE,
     ) -> Union[xr.Dataset, List[xr.Dataset], np.array]:
         """
         Read forcing data.
@@ -164,6 +201,13 @@ class Daymet4Camels(HydroDataset):
             resample==0: average data in a basin;
             resample==other ints: coarse the original data with resample times;
             resample==floats: interpolate the original data with resample times;
+            gridded data are read from the Zarr store of their directory if it has all basins (see
+            catchmentforcings.utils.gridded_store), otherwise from the nc files;
+            when resample==0, the data are read from DAYMET4_BASIN_MEAN_CUBE if it has been built
+            (see build_basin_mean_cube), covers all basins and days and is newer than its source,
+            else from DAYMET4_BASIN_MEAN_STORE if it exists, otherwise from the text file of each basin
+        dtype
+            data type of the basin mean data; float32 by default, "float64" for the full precision
 
         Returns
         -------
@@ -177,13 +221,81 @@ class Daymet4Camels(HydroDataset):
         if resample > 0:
             return self.read_xr_forcing_data(t_range, resample, usgs_id_lst, concat)
         t_range_list = hydro_time.t_range_days(t_range)
+        cube = self.basin_mean_cube()
+        if cube.can_read(
+            usgs_id_lst,
+            t_range_list,
+            var_lst,
+            self._basin_mean_sources(usgs_id_lst),
+        ):
+            return cube.read(usgs_id_lst, t_range_list, var_lst, dtype=dtype)
+        return self.read_basin_mean_forcings(
+            usgs_id_lst, t_range_list, var_lst, dtype=dtype
+        )
+
+    def basin_mean_cube(self) -> ForcingCube:
+        """the cube in DAYMET4_BASIN_MEAN_CUBE; the same instance is returned by later calls"""
+        if self._basin_mean_cube is None:
+            self._basin_mean_cube = ForcingCube(
+                self.data_source_description["DAYMET4_BASIN_MEAN_CUBE"]
+            )
+        return self._basin_mean_cube
+
+    def _basin_mean_sources(self, usgs_id_lst) -> List[str]:
+        """the store of basin mean data if it exists, otherwise the text files of the basins"""
+        store = ForcingStore(self.data_source_description["DAYMET4_BASIN_MEAN_STORE"])
+        if store.exists():
+            return [store.store_path]
+        return [self._basin_mean_file(usgs_id) for usgs_id in usgs_id_lst]
+
+    def read_basin_mean_forcings(
+        self, usgs_id_lst, t_range_list, var_lst, dtype: str = FORCING_DTYPE
+    ) -> np.array:
+        """read basin mean data from DAYMET4_BASIN_MEAN_STORE if it exists, otherwise from the text files"""
+        store = ForcingStore(self.data_source_description["DAYMET4_BASIN_MEAN_STORE"])
+        if store.exists():
+            return store.read(usgs_id_lst, t_range_list, var_lst, dtype=dtype)
         nt = t_range_list.shape[0]
-        x = np.empty([len(usgs_id_lst), nt, len(var_lst)])
+        x = np.empty([len(usgs_id_lst), nt, len(var_lst)], dtype=dtype)
         for k in range(len(usgs_id_lst)):
-            data = self.read_basin_mean_daymet4(usgs_id_lst[k], var_lst, t_range_list)
+            data = self.read_basin_mean_daymet4(
+                usgs_id_lst[k], var_lst, t_range_list, dtype=dtype
+            )
             x[k, :, :] = data
         return x
 
+    def build_basin_mean_cube(
+        self, t_range: list, var_lst: list = None, dtype: str = FORCING_DTYPE
+    ) -> None:
+        """
+        Materialize the basin mean data of all basins in CAMELS to DAYMET4_BASIN_MEAN_CUBE
+
+        After it is built, read_relevant_cols with resample==0 reads the memory-mapped cube instead of the store or
+        the text files, until the store or the text files are changed; they are checked once by this instance.
+
+        Parameters
+        ----------
+        t_range
+            the start and end periods of the cube
+        var_lst
+            the forcing var types; all of get_relevant_cols() by default
+        dtype
+            data type of the cube
+        """
+        if var_lst is None:
+            var_lst = self.get_relevant_cols().tolist()
+        t_range_list = hydro_time.t_range_days(t_range)
+        cube = self.basin_mean_cube()
+        cube.build(
+            self.camels671_sites["gauge_id"].values,
+            t_range_list,
+            var_lst,
+            lambda usgs_ids: self.read_basin_mean_forcings(
+                usgs_ids, t_range_list, var_lst, dtype=dtype
+            ),
+            dtype=dtype,
+        )
+
     def read_xr_forcing_data(self, t_range, resample, usgs_id_lst, concat):
         t_years = hydro_time.t_range_years(t_range)
         # our range is a left open left close range, the default range in xarray slice is close interval, so -1 day
@@ -194,20 +306,24 @@ class Daymet4Camels(HydroDataset):
         else:
             data_folder = self.data_source_description["DAYMET4_RESAMPLE_DIR"]
             resample_str = str(resample)
-        ens_list = []
-        for item in usgs_id_lst:
-            ens = item
-            name_lst = [
-                name
-                for name in glob.glob(
-                    os.path.join(data_folder, ens, f"*{resample_str}.nc")
-                )
-                if int(name.split("/")[-1].split("_")[1]) in t_years
-            ]
-            name_lst_sorted = np.sort(name_lst).tolist()
-            ens_list.append(
-                xr.open_mfdataset(name_lst_sorted).sel(time=slice(t_days[0], t_days[1]))
+        # read the groups of basins if the data were saved in a store, see catchmentforcings.utils.gridded_store
+        store = GriddedStore(gridded_store_path(data_folder, resample_str))
+        if all(usgs_id in store for usgs_id in usgs_id_lst):
+            basin_datasets = {
+                usgs_id: store.open_basin(usgs_id) for usgs_id in usgs_id_lst
+            }
+        else:
+            # the index of files is saved in data_folder, and only changed basins' directories are listed again
+            file_index = NcFileIndex(data_folder, resample_str)
+            file_index.refresh(usgs_id_lst)
+            # all files are opened in one batch, and data are loaded only when they are accessed
+            basin_datasets = open_basin_datasets(
+                {usgs_id: file_index.paths(usgs_id, t_years) for usgs_id in usgs_id_lst}
             )
+        ens_list = [
+            basin_datasets[usgs_id].sel(time=slice(t_days[0], t_days[1]))
+            for usgs_id in usgs_id_lst
+        ]
 
         if not concat:
             return ens_list
@@ -3,7 +3,7 @@ import os
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import Dict, Union
+from typing import Dict, List, Optional, Tuple, Union
 from pandas.core.dtypes.common import is_string_dtype, is_numeric_dtype
 
 from hydrodataset import HydroDataset
@@ -14,14 +14,48 @@ from hydroutils import (
     hydro_logger,
 )
 
+from catchmentforcings.utils.attr_cache import AttrMatrix, source_mtimes
+from catchmentforcings.utils.forcing_store import (
+    CAMELS_TIME_COLS,
+    FORCING_DTYPE,
+    ForcingStore,
+    forcing_store_path,
+)
+from catchmentforcings.utils.flow_cache import (
+    FLOW_DTYPE,
+    QUALIFIER_DTYPE,
+    USGS_FLOW_QUALIFIERS,
+    FlowCache,
+    best_flow_column,
+    mask_flow_qualifiers,
+)
+from catchmentforcings.utils.forcing_cube import ForcingCube, forcing_cube_path
+from catchmentforcings.utils.hydro_utils import CAMELS_DATE_DTYPE
+from catchmentforcings.utils.site_index import SiteIndex, common_rows
+
 
 class Gages(HydroDataset):
+    # values in USGS flow files which are qualifiers rather than flow; they are set to NaN when flow data are read
+    flow_qualifiers = USGS_FLOW_QUALIFIERS
+
     def __init__(self, data_path, download=False):
         super().__init__(data_path)
         self.data_source_description = self.set_data_source_describe()
         if download:
             self.download_data_source()
         self.gages_sites = self.read_site_info()
+        # id -> (row, HUC02) of all sites, so no lookup compares the whole id column
+        self.site_index = SiteIndex(
+            self.gages_sites["STAID"], self.gages_sites["HUC02"]
+        )
+        # all attrs of all sites, read by read_attr_matrix when they are needed
+        self._attr_matrix = None
+        self._attr_mtimes = None
+        # streamflow of all sites, read by read_flow_cache when it has been built; its flow files are checked once
+        self._flow_cache = None
+        self._flow_cache_checked = False
+        # the cube of forcing data, kept for later calls so its sources are checked once
+        self._forcing_cube = None
 
     def get_name(self):
         return "GAGES"
@@ -70,6 +104,8 @@ class Gages(HydroDataset):
 
         # config of flow data
         flow_dir = os.path.join(gages_db, "gages_streamflow", "gages_streamflow")
+        # streamflow of all sites parsed once, see catchmentforcings.utils.flow_cache
+        flow_cache_file = os.path.join(gages_db, "gages_streamflow_cache.npz")
         # forcing
         forcing_dir = os.path.join(gages_db, "basin_mean_forcing", "basin_mean_forcing")
         forcing_types = ["daymet"]
@@ -78,6 +114,8 @@ class Gages(HydroDataset):
             gages_db, "basinchar_and_report_sept_2011", "spreadsheets-in-csv-format"
         )
         gauge_id_file = os.path.join(attr_dir, "conterm_basinid.txt")
+        # all attrs of all sites parsed once, see catchmentforcings.utils.attr_cache
+        attr_cache_file = os.path.join(attr_dir, "conterm_attr_cache.npz")
 
         download_url_lst = [
             "https://water.usgs.gov/GIS/dsdl/basinchar_and_report_sept_2011.zip",
@@ -103,9 +141,11 @@ class Gages(HydroDataset):
         return collections.OrderedDict(
             GAGES_DIR=gages_db,
             GAGES_FLOW_DIR=flow_dir,
+            GAGES_FLOW_CACHE=flow_cache_file,
             GAGES_FORCING_DIR=forcing_dir,
             GAGES_FORCING_TYPE=forcing_types,
             GAGES_ATTR_DIR=attr_dir,
+            GAGES_ATTR_CACHE=attr_cache_file,
             GAGES_GAUGE_FILE=gauge_id_file,
             GAGES_DOWNLOAD_URL_LST=download_url_lst,
             GAGES_REGIONS_SHP_DIR=gage_region_dir,
@@ -146,6 +186,8 @@ class Gages(HydroDataset):
         read all attr data for some sites in GAGES-II
         TODO: now it is not same as functions in CAMELS where read_attr_all has no "gages_ids" parameter
 
+        The attr data of all sites are parsed once and cached (see read_attr_matrix), so this is a slice of the cache
+
         Parameters
         ----------
         gages_ids : Union[list, np.ndarray]
@@ -156,14 +198,12 @@ class Gages(HydroDataset):
         ndarray
             all attr data for gages_ids
         """
+        attr_matrix = self.read_attr_matrix()
+        out, f_dict = attr_matrix.select(self.site_index.rows(gages_ids))
+        return out, attr_matrix.var_lst, attr_matrix.var_dict, f_dict
+
+    def _attr_keys(self) -> List[str]:
         dir_gage_attr = self.data_source_description["GAGES_ATTR_DIR"]
-        f_dict = {}  # factorize dict
-        # each key-value pair for atts in a file (list）
-        var_dict = {}
-        # all attrs
-        var_lst = []
-        out_lst = []
-        # read all attrs
         var_des = pd.read_csv(
             os.path.join(dir_gage_attr, "variable_descriptions.txt"), sep=","
         )
@@ -175,11 +215,56 @@ class Gages(HydroDataset):
         key_lst.sort(key=var_des_map_values.index)
         # remove x_region_names
         key_lst.remove("x_region_names")
+        # in "spreadsheets-in-csv-format" directory, the name of "flow_record" file is conterm_flowrec.txt
+        return ["flowrec" if key == "flow_record" else key for key in key_lst]
 
-        for key in key_lst:
-            # in "spreadsheets-in-csv-format" directory, the name of "flow_record" file is conterm_flowrec.txt
-            if key == "flow_record":
-                key = "flowrec"
+    def _attr_source_files(self) -> List[str]:
+        dir_gage_attr = self.data_source_description["GAGES_ATTR_DIR"]
+        return [os.path.join(dir_gage_attr, "variable_descriptions.txt")] + [
+            os.path.join(dir_gage_attr, "conterm_" + key + ".txt")
+            for key in self._attr_keys()
+        ]
+
+    def read_attr_matrix(self) -> AttrMatrix:
+        """
+        The attr data of all sites in GAGES-II
+
+        They are read from GAGES_ATTR_CACHE, which is built by build_attr_cache when it does not exist or any
+        attr file is newer than it; the matrix is also kept in memory for later calls.
+        """
+        source_files = self._attr_source_files()
+        mtimes = source_mtimes(source_files)
+        if self._attr_matrix is not None and self._attr_mtimes == mtimes:
+            return self._attr_matrix
+        attr_matrix = AttrMatrix.load(
+            self.data_source_description["GAGES_ATTR_CACHE"], source_files
+        )
+        if attr_matrix is None or not np.array_equal(
+            attr_matrix.ids, np.asarray(self.gages_sites["STAID"], dtype=str)
+        ):
+            attr_matrix = self.build_attr_cache()
+        self._attr_matrix = attr_matrix
+        self._attr_mtimes = mtimes
+        return attr_matrix
+
+    def build_attr_cache(self) -> AttrMatrix:
+        """
+        Parse all attr files for all sites once, and save the matrix to GAGES_ATTR_CACHE if it could be written
+
+        Returns
+        -------
+        AttrMatrix
+            all attr data; str attrs are factorized over all sites
+        """
+        dir_gage_attr = self.data_source_description["GAGES_ATTR_DIR"]
+        all_ids = np.asarray(self.gages_sites["STAID"], dtype=str)
+        f_dict = {}  # factorize dict
+        # each key-value pair for atts in a file (list）
+        var_dict = {}
+        # all attrs
+        var_lst = []
+        out_lst = []
+        for key in self._attr_keys():
             data_file = os.path.join(dir_gage_attr, "conterm_" + key + ".txt")
             # remove some unused atttrs in bas_classif
             if key == "bas_classif":
@@ -200,28 +285,30 @@ class Gages(HydroDataset):
             var_lst_temp = list(data_temp.columns[1:])
             var_dict[key] = var_lst_temp
             var_lst.extend(var_lst_temp)
-            k = 0
-            n_gage = len(gages_ids)
-            out_temp = np.full(
-                [n_gage, len(var_lst_temp)], np.nan
-            )  # 1d:sites，2d: attrs in current data_file
-            # sites intersection，ind2 is the index of sites in conterm_ files，set them in out_temp
-            range1 = gages_ids
-            range2 = data_temp.iloc[:, 0].astype(str).tolist()
-            assert all(x < y for x, y in zip(range2, range2[1:]))
+            # 1d:sites，2d: attrs in current data_file
+            out_temp = np.full([all_ids.size, len(var_lst_temp)], np.nan)
             # Notice the sequence of station ids ! Some id_lst_all are not sorted, so don't use np.intersect1d
-            ind2 = [range2.index(tmp) for tmp in range1]
-            for field in var_lst_temp:
+            ind1, ind2 = common_rows(all_ids, data_temp.iloc[:, 0].astype(str))
+            for k, field in enumerate(var_lst_temp):
                 if is_string_dtype(data_temp[field]):  # str vars -> categorical vars
                     value, ref = pd.factorize(data_temp.loc[ind2, field], sort=True)
-                    out_temp[:, k] = value
+                    out_temp[ind1, k] = value
                     f_dict[field] = ref.tolist()
                 elif is_numeric_dtype(data_temp[field]):
-                    out_temp[:, k] = data_temp.loc[ind2, field].values
-                k = k + 1
+                    out_temp[ind1, k] = data_temp.loc[ind2, field].values
             out_lst.append(out_temp)
-        out = np.concatenate(out_lst, 1)
-        return out, var_lst, var_dict, f_dict
+        attr_matrix = AttrMatrix(
+            all_ids, np.concatenate(out_lst, 1), var_lst, var_dict, f_dict
+        )
+        try:
+            attr_matrix.save(
+                self.data_source_description["GAGES_ATTR_CACHE"],
+                self._attr_source_files(),
+            )
+        except OSError as e:
+            # e.g. the dataset directory is read-only; read_attr_matrix still keeps the matrix in memory
+            hydro_logger.warning(f"The attr cache could not be saved: {e}")
+        return attr_matrix
 
     def read_constant_cols(
         self, object_ids=None, constant_cols: list = None, **kwargs
@@ -242,11 +329,9 @@ class Gages(HydroDataset):
             attr data for object_ids
         """
         # assert all(x < y for x, y in zip(object_ids, object_ids[1:]))
-        attr_all, var_lst_all, var_dict, f_dict = self.read_attr_all(object_ids)
-        ind_var = list()
-        for var in constant_cols:
-            ind_var.append(var_lst_all.index(var))
-        out = attr_all[:, ind_var]
+        out, _ = self.read_attr_matrix().select(
+            self.site_index.rows(object_ids), constant_cols
+        )
         return out
 
     def read_attr_origin(self, gages_ids, attr_lst) -> np.ndarray:
@@ -278,13 +363,8 @@ class Gages(HydroDataset):
         out_lst = []
         for i in range(len(attr_lst)):
             out_lst.append([])
-        range1 = gages_ids
-        gage_id_file = self.data_source_description["GAGES_GAUGE_FILE"]
-        data_all = pd.read_csv(gage_id_file, sep=",", dtype={0: str})
-        range2 = data_all["STAID"].values.tolist()
-        assert all(x < y for x, y in zip(range2, range2[1:]))
-        # Notice the sequence of station ids ! Some id_lst_all are not sorted, so don't use np.intersect1d
-        ind2 = [range2.index(tmp) for tmp in range1]
+        # rows of the gage file are the rows of gages_sites
+        ind2 = self.site_index.rows(gages_ids)
 
         for key in key_lst:
             # in "spreadsheets-in-csv-format" directory, the name of "flow_record" file is conterm_flowrec.txt
@@ -337,21 +417,34 @@ class Gages(HydroDataset):
         out = np.array(out_lst)
         return out
 
-    def read_forcing_gage(self, usgs_id, var_lst, t_range_list, forcing_type="daymet"):
-        gage_dict = self.gages_sites
-        ind = np.argwhere(gage_dict["STAID"] == usgs_id)[0][0]
-        huc = gage_dict["HUC02"][ind]
-
+    def _forcing_file(self, usgs_id, forcing_type="daymet") -> str:
+        huc = self.site_index.huc02(usgs_id)
         data_folder = os.path.join(
             self.data_source_description["GAGES_FORCING_DIR"], forcing_type
         )
         # original daymet file not for leap year, there is no data in 12.31 in leap year,
         # so files which have been interpolated for nan value have name "_leap"
-        data_file = os.path.join(
+        return os.path.join(
             data_folder, huc, f"{usgs_id}_lump_{forcing_type}_forcing_leap.txt"
         )
+
+    def read_forcing_gage(
+        self,
+        usgs_id,
+        var_lst,
+        t_range_list,
+        forcing_type="daymet",
+        dtype: str = FORCING_DTYPE,
+    ):
+        data_file = self._forcing_file(usgs_id, forcing_type)
         print("reading", forcing_type, "forcing data ", usgs_id)
-        data_temp = pd.read_csv(data_file, sep=r"\s+", header=None, skiprows=1)
+        data_temp = pd.read_csv(
+            data_file,
+            sep=r"\s+",
+            header=None,
+            skiprows=1,
+            dtype={i: CAMELS_DATE_DTYPE for i in range(len(CAMELS_TIME_COLS))},
+        )
 
         df_date = data_temp[[0, 1, 2]]
         df_date.columns = ["year", "month", "day"]
@@ -361,7 +454,7 @@ class Gages(HydroDataset):
         [c, ind1, ind2] = np.intersect1d(date, t_range_list, return_indices=True)
         assert date[0] <= t_range_list[0] and date[-1] >= t_range_list[-1]
         nt = t_range_list.size
-        out = np.empty([nt, nf])
+        out = np.empty([nt, nf], dtype=dtype)
         var_lst_in_file = [
             "dayl(s)",
             "prcp(mm/day)",
@@ -382,24 +475,108 @@ class Gages(HydroDataset):
         return out
 
     def read_relevant_cols(
-        self, object_ids=None, t_range_list=None, var_lst=None, **kwargs
+        self,
+        object_ids=None,
+        t_range_list=None,
+        var_lst=None,
+        dtype: str = FORCING_DTYPE,
+        **kwargs,
     ) -> np.array:
+        """
+        Read forcing data of gages; the output is float32 by default, and dtype="float64" keeps the full precision
+        """
         assert all(x < y for x, y in zip(object_ids, object_ids[1:]))
         assert all(x < y for x, y in zip(t_range_list, t_range_list[1:]))
         print("reading formatted data:")
         t_lst = hydro_time.t_range_days(t_range_list)
+        # read the memory-mapped cube if it has been built by build_forcing_cube, covers all gages and days,
+        # and is newer than the forcing store or text files
+        cube = self.forcing_cube()
+        if cube.can_read(object_ids, t_lst, var_lst, self._forcing_sources(object_ids)):
+            return cube.read(object_ids, t_lst, var_lst, dtype=dtype)
+        return self.read_forcing_gages(object_ids, t_lst, var_lst, dtype=dtype)
+
+    def forcing_cube(self) -> ForcingCube:
+        """the cube beside the forcing store; the same instance is returned by later calls"""
+        if self._forcing_cube is None:
+            self._forcing_cube = ForcingCube(
+                forcing_cube_path(self._forcing_store().store_path)
+            )
+        return self._forcing_cube
+
+    def _forcing_store(self) -> ForcingStore:
+        forcing_type = self.data_source_description["GAGES_FORCING_TYPE"][0]
+        return ForcingStore(
+            forcing_store_path(
+                os.path.join(
+                    self.data_source_description["GAGES_FORCING_DIR"], forcing_type
+                ),
+                f"_lump_{forcing_type}_forcing_leap.txt",
+            )
+        )
+
+    def _forcing_sources(self, object_ids) -> List[str]:
+        """the forcing store if it exists, otherwise the text files of the gages"""
+        store = self._forcing_store()
+        if store.exists():
+            return [store.store_path]
+        forcing_type = self.data_source_description["GAGES_FORCING_TYPE"][0]
+        return [self._forcing_file(usgs_id, forcing_type) for usgs_id in object_ids]
+
+    def read_forcing_gages(
+        self, object_ids, t_lst, var_lst, dtype: str = FORCING_DTYPE
+    ) -> np.array:
+        """read forcing data of gages at days t_lst from the store if it exists, otherwise from the text files"""
+        forcing_type = self.data_source_description["GAGES_FORCING_TYPE"][0]
+        # read all basins from the store if the transformed data were saved in it
+        store = self._forcing_store()
+        if store.exists():
+            return store.read(object_ids, t_lst, var_lst, dtype=dtype)
         nt = t_lst.shape[0]
-        x = np.empty([len(object_ids), nt, len(var_lst)])
+        x = np.empty([len(object_ids), nt, len(var_lst)], dtype=dtype)
         for k in range(len(object_ids)):
             data = self.read_forcing_gage(
                 object_ids[k],
                 var_lst,
                 t_lst,
-                forcing_type=self.data_source_description["GAGES_FORCING_TYPE"][0],
+                forcing_type=forcing_type,
+                dtype=dtype,
             )
             x[k, :, :] = data
         return x
 
+    def build_forcing_cube(
+        self, t_range_list: list, var_lst: list = None, dtype: str = FORCING_DTYPE
+    ) -> None:
+        """
+        Materialize forcing data of all gages to a memory-mapped cube beside the forcing store
+
+        After it is built, read_relevant_cols reads the cube instead of the store or the text files, until the store
+        or the text files are changed; they are checked once by this instance.
+
+        Parameters
+        ----------
+        t_range_list
+            the start and end periods of the cube
+        var_lst
+            the forcing var types; all of get_relevant_cols() by default
+        dtype
+            data type of the cube
+        """
+        if var_lst is None:
+            var_lst = self.get_relevant_cols().tolist()
+        t_lst = hydro_time.t_range_days(t_range_list)
+        cube = self.forcing_cube()
+        cube.build(
+            self.gages_sites["STAID"],
+            t_lst,
+            var_lst,
+            lambda object_ids: self.read_forcing_gages(
+                object_ids, t_lst, var_lst, dtype=dtype
+            ),
+            dtype=dtype,
+        )
+
     def read_target_cols(
         self, usgs_id_lst=None, t_range_list=None, target_cols=None, **kwargs
     ) -> np.array:
@@ -425,11 +602,79 @@ class Gages(HydroDataset):
         t_lst = hydro_time.t_range_days(t_range_list)
         nt = t_lst.shape[0]
         y = np.empty([len(usgs_id_lst), nt, 1])
+        # read the cache if it has been built by build_flow_cache and has all gages and days
+        flow_cache = self.read_flow_cache()
+        if flow_cache is not None and flow_cache.covers(usgs_id_lst, t_lst):
+            y[:, :, 0] = flow_cache.read(usgs_id_lst, t_lst)[0]
+            return y
         for k in range(len(usgs_id_lst)):
             data_obs = self.read_usgs_gage(usgs_id_lst[k], t_lst)
             y[k, :, 0] = data_obs
         return y
 
+    def _flow_source_files(self) -> List[str]:
+        dir_gage_flow = self.data_source_description["GAGES_FLOW_DIR"]
+        return [
+            os.path.join(
+                dir_gage_flow, str(self.site_index.huc02(usgs_id)), usgs_id + ".txt"
+            )
+            for usgs_id in self.gages_sites["STAID"]
+        ]
+
+    def read_flow_cache(self, refresh: bool = False) -> Optional[FlowCache]:
+        """
+        The cache of streamflow of all gages in GAGES_FLOW_CACHE
+
+        It is loaded and checked against the flow files once, and kept in memory for later calls; None if it has not
+        been built or any flow file is newer than it. Use refresh=True to check it again after flow files are changed.
+        """
+        if self._flow_cache_checked and not refresh:
+            return self._flow_cache
+        cache_file = self.data_source_description["GAGES_FLOW_CACHE"]
+        self._flow_cache = None
+        if os.path.isfile(cache_file):
+            self._flow_cache = FlowCache.load(cache_file, self._flow_source_files())
+        self._flow_cache_checked = True
+        return self._flow_cache
+
+    def build_flow_cache(self, t_range_list: list) -> FlowCache:
+        """
+        Parse the streamflow files of all gages once, and save them to GAGES_FLOW_CACHE
+
+        Parameters
+        ----------
+        t_range_list
+            the start and end periods of the cache; read_target_cols reads the cache only in this period
+
+        Returns
+        -------
+        FlowCache
+            streamflow (float32) and codes of qualifiers of all gages
+        """
+        t_lst = hydro_time.t_range_days(t_range_list)
+        usgs_ids = np.asarray(self.gages_sites["STAID"], dtype=str)
+        flow = np.full([usgs_ids.size, t_lst.size], np.nan, dtype=FLOW_DTYPE)
+        qualifier_codes = np.full(
+            [usgs_ids.size, t_lst.size], -1, dtype=QUALIFIER_DTYPE
+        )
+        qualifiers = {}
+        for k, usgs_id in enumerate(usgs_ids):
+            flow[k], modes = self._read_usgs_gage(usgs_id, t_lst)
+            codes, uniques = pd.factorize(modes)
+            # codes of a gage -> codes of all gages
+            global_codes = np.array(
+                [qualifiers.setdefault(mode, len(qualifiers)) for mode in uniques]
+                + [-1],
+                dtype=QUALIFIER_DTYPE,
+            )
+            qualifier_codes[k] = global_codes[codes]
+        flow_cache = FlowCache(usgs_ids, t_lst, flow, qualifier_codes, list(qualifiers))
+        cache_file = self.data_source_description["GAGES_FLOW_CACHE"]
+        flow_cache.save(cache_file, self._flow_source_files())
+        self._flow_cache = flow_cache
+        self._flow_cache_checked = True
+        return flow_cache
+
     def read_usgs_gage(self, usgs_id, t_lst):
         """
         read data for one gage
@@ -446,10 +691,13 @@ class Gages(HydroDataset):
         [type]
             [description]
         """
+        return self._read_usgs_gage(usgs_id, t_lst)[0]
+
+    def _read_usgs_gage(self, usgs_id, t_lst) -> Tuple[np.ndarray, np.ndarray]:
+        """flow and qualifiers ("mode", e.g. "A" or "P") of a gage at days t_lst; days without data are NaN"""
         print(usgs_id)
         dir_gage_flow = self.data_source_description["GAGES_FLOW_DIR"]
-        gage_id_df = pd.DataFrame(self.gages_sites)
-        huc = gage_id_df[gage_id_df["STAID"] == usgs_id]["HUC02"].values[0]
+        huc = self.site_index.huc02(usgs_id)
         usgs_file = os.path.join(dir_gage_flow, str(huc), usgs_id + ".txt")
         # ignore the comment lines and the first non-value row
         df_flow = pd.read_csv(
@@ -498,45 +746,26 @@ class Gages(HydroDataset):
         # time range intersection. set points without data nan values
         nt = len(t_lst)
         out = np.full([nt], np.nan)
+        modes = np.full([nt], np.nan, dtype=object)
         # date in df is str，so transform them to datetime
         df_date = data_temp["datetime"]
         date = pd.to_datetime(df_date).values.astype("datetime64[D]")
         c, ind1, ind2 = np.intersect1d(date, t_lst, return_indices=True)
         out[ind2] = obs[ind1]
-        return out
+        modes[ind2] = data_temp["mode"].values[ind1]
+        return out, modes
 
     def _format_flow_data(self, df_flow, t_lst, columns_flow, columns_flow_cd):
         print("there are some columns for flow, choose one\n")
-        df_date_temp = df_flow["datetime"]
-        date_temp = pd.to_datetime(df_date_temp).values.astype("datetime64[D]")
-        c_temp, ind1_temp, ind2_temp = np.intersect1d(
-            date_temp, t_lst, return_indices=True
-        )
-        num_nan_lst = []
-        for item in columns_flow:
-            out_temp = np.full([len(t_lst)], np.nan)
-
-            self._check_flow_data(df_flow, item)
-            df_flow_temp = df_flow[item].copy()
-            out_temp[ind2_temp] = df_flow_temp[ind1_temp]
-            num_nan = np.isnan(out_temp).sum()
-            num_nan_lst.append(num_nan)
-        num_nan_np = np.array(num_nan_lst)
-        index_flow_num = np.argmin(num_nan_np)
+        self._check_flow_data(df_flow, columns_flow)
+        # choose the column with the most values in t_lst; all columns are scored at once
+        index_flow_num = best_flow_column(df_flow, t_lst, columns_flow)
         df_flow.rename(columns={columns_flow[index_flow_num]: "flow"}, inplace=True)
         df_flow.rename(columns={columns_flow_cd[index_flow_num]: "mode"}, inplace=True)
 
     def _check_flow_data(self, arg0, arg1):
-        arg0.loc[arg0[arg1] == "Ice", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "Ssn", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "Tst", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "Eqp", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "Rat", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "Dis", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "Bkw", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "***", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "Mnt", arg1] = np.nan
-        arg0.loc[arg0[arg1] == "ZFL", arg1] = np.nan
+        """set values which are qualifiers in self.flow_qualifiers (e.g. "Ice") to NaN; arg1 is a column or columns"""
+        mask_flow_qualifiers(arg0, arg1, self.flow_qualifiers)
 
     def read_object_ids(self, object_params=None) -> np.array:
         return self.gages_sites["STAID"]
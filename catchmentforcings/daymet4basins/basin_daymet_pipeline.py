@@ -0,0 +1,361 @@
+"""
+A parallel runner for the Daymet basin pipeline: cut to basin bounds + PET, regrid, and basin mean
+
+Each (basin, year) file is an independent task, so tasks are scheduled on a process pool. Outputs are written to a
+temporary file first and then renamed, so an interrupted run can be resumed: outputs which already exist and
+can be read are skipped. When outputs are saved in a GriddedStore, a task writes all years of a basin to its group.
+"""
+import os
+import time
+import traceback
+from multiprocessing import Pool
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from shapely.geometry import MultiPolygon, Polygon
+from tqdm import tqdm
+
+from catchmentforcings.daymet4basins.basin_daymet_process import (
+    calculate_basin_grids_pet,
+    calculate_basin_mean,
+    generate_boundary_dataset,
+    resample_nc,
+)
+from catchmentforcings.utils.basin_weights import BasinWeights
+from catchmentforcings.utils.gridded_store import GriddedStore, open_basin_year
+from catchmentforcings.utils.hydro_utils import (
+    hydro_logger,
+    t_range_days,
+    year_month_day_hour,
+)
+
+DAYMET_VARS = ["dayl", "prcp", "srad", "swe", "tmax", "tmin", "vp"]
+DAYMET_CAMELS_INDEX = [
+    "Year",
+    "Mnth",
+    "Day",
+    "Hr",
+    "dayl(s/day)",
+    "prcp(mm/day)",
+    "srad(W/m2)",
+    "swe(kg/m2)",
+    "tmax(C)",
+    "tmin(C)",
+    "vp(Pa)",
+]
+PET_VARS = ["pet_pt", "pet_fao56"]
+PET_CAMELS_INDEX = ["petpt(mm/day)", "petfao56(mm/day)"]
+
+
+def valid_nc(nc_file: str) -> bool:
+    """An output nc file is valid if it could be opened and it has some time steps"""
+    if not os.path.isfile(nc_file) or os.path.getsize(nc_file) == 0:
+        return False
+    try:
+        with xr.open_dataset(nc_file) as ds:
+            return ds.sizes.get("time", 0) > 0
+    except Exception:
+        return False
+
+
+def valid_txt(txt_file: str, years: Optional[List[int]] = None) -> bool:
+    """
+    An output txt file is valid if it has the header and at least one line of data
+
+    If years is not None, the file must also have data of all these years, so a run with more years is not skipped
+    """
+    if not os.path.isfile(txt_file) or os.path.getsize(txt_file) == 0:
+        return False
+    with open(txt_file) as f:
+        if not (f.readline().startswith("Year") and f.readline() != ""):
+            return False
+    if years is None:
+        return True
+    try:
+        txt_years = pd.read_csv(txt_file, sep=r"\s+", usecols=["Year"])["Year"]
+    except Exception:
+        return False
+    return set(years) <= set(txt_years.unique().tolist())
+
+
+def _tmp_path(save_path: str) -> str:
+    root, ext = os.path.splitext(save_path)
+    return root + ".tmp" + str(os.getpid()) + ext
+
+
+def _save_nc(ds: xr.Dataset, save_path: str) -> None:
+    tmp_path = _tmp_path(save_path)
+    ds.to_netcdf(tmp_path)
+    os.replace(tmp_path, save_path)
+
+
+def cut_and_add_pet(
+    ds: xr.Dataset,
+    geometry: Union[Polygon, MultiPolygon],
+    pet_method: Union[str, list] = ("priestley_taylor", "pm_fao56"),
+) -> xr.Dataset:
+    """Cut a dataset to the bound of the basin and add PET to it"""
+    ds_bound = generate_boundary_dataset(ds, geometry)
+    return calculate_basin_grids_pet(ds_bound, list(pet_method))
+
+
+def cut_and_add_pet_task(
+    nc_path: str,
+    save_path: str,
+    geometry: Union[Polygon, MultiPolygon],
+    pet_method: Union[str, list] = ("priestley_taylor", "pm_fao56"),
+) -> None:
+    """Cut a yearly nc file to the bound of the basin and add PET to it"""
+    with xr.open_dataset(nc_path) as ds:
+        _save_nc(cut_and_add_pet(ds, geometry, pet_method), save_path)
+
+
+def regrid_task(nc_path: str, save_path: str, resample_size: Union[int, float]) -> None:
+    """Regrid a yearly nc file"""
+    with xr.open_dataset(nc_path) as ds:
+        _save_nc(resample_nc(ds, resample_size), save_path)
+
+
+def store_years_task(
+    sources: List[str],
+    years: List[int],
+    group_path: str,
+    transform: Callable[..., xr.Dataset],
+    args: tuple = (),
+) -> None:
+    """
+    Transform the yearly data of a basin and write them to the basin's group in a GriddedStore
+
+    All years of a basin are in one group, so this task is for a basin, not a (basin, year); years already in the
+    group are skipped, so an interrupted task could be resumed.
+
+    Parameters
+    ----------
+    sources
+        the source of each year: a yearly nc file or the basin's group in another GriddedStore
+    years
+        the years
+    group_path
+        the basin's group in the GriddedStore, see GriddedStore.group_path
+    transform
+        a function which transforms the data of a year, e.g. cut_and_add_pet or resample_nc
+    args
+        other arguments of transform
+    """
+    store_path, basin_id = os.path.split(group_path.rstrip(os.sep))
+    store = GriddedStore(store_path)
+    done = set(store.years(basin_id))
+    for source, year in zip(sources, years):
+        if year in done:
+            continue
+        with open_basin_year(source, year) as ds:
+            store.write(basin_id, transform(ds, *args).load())
+
+
+def basin_mean_task(
+    nc_paths: List[str],
+    years: List[int],
+    geometry: Union[Polygon, MultiPolygon],
+    save_path: str,
+    var: Optional[List[str]] = None,
+    camels_index: Optional[List[str]] = None,
+) -> None:
+    """
+    Calculate basin mean forcings of all years for one basin and save them in the format of CAMELS
+
+    All yearly files of a basin go to one txt file, so this task is for a basin, not a (basin, year);
+    nc_paths could also be the basin's group in a GriddedStore for each year
+    """
+    if var is None:
+        var = DAYMET_VARS + PET_VARS
+    if camels_index is None:
+        camels_index = DAYMET_CAMELS_INDEX + PET_CAMELS_INDEX
+    frames_basin = []
+    weights = None
+    for nc_path, year in zip(nc_paths, years):
+        with open_basin_year(nc_path, year) as ds:
+            if weights is None or not weights.fit_grid(ds):
+                weights = BasinWeights.from_dataset(ds, [geometry])
+            df = calculate_basin_mean(ds, geometry, weights=weights).to_dataframe()
+        # interpolation for the 12.31 data in leap year
+        t_range_list = t_range_days([str(year) + "-01-01", str(year + 1) + "-01-01"])
+        [c, ind1, ind2] = np.intersect1d(
+            pd.to_datetime(df.index).normalize().values,
+            t_range_list,
+            return_indices=True,
+        )
+        out = np.full([t_range_list.size, len(var)], np.nan)
+        out[ind2, :] = df[var].values[ind1]
+        x = pd.DataFrame(out, columns=camels_index[4:])
+        frames_basin.append(pd.concat([year_month_day_hour(t_range_list), x], axis=1))
+    df_i = pd.concat(frames_basin)
+    df_i_intepolate = df_i.interpolate(
+        method="linear", limit_direction="forward", axis=0
+    )
+    tmp_path = _tmp_path(save_path)
+    df_i_intepolate.to_csv(
+        tmp_path, header=True, index=False, sep=" ", float_format="%.2f"
+    )
+    os.replace(tmp_path, save_path)
+
+
+def missing_input_task(error: str) -> None:
+    """a task whose input is missing; it fails, so it is recorded in the summary rather than stopping the run"""
+    raise FileNotFoundError(error)
+
+
+def make_task(
+    key: str, func: Callable, make_args: Callable[[], tuple]
+) -> Tuple[str, Callable, tuple, dict]:
+    """
+    A task of run_pipeline; its arguments are made by make_args, which looks up its input files
+
+    If an input file is missing (make_args raises FileNotFoundError), the task becomes a missing_input_task
+    """
+    try:
+        return key, func, make_args(), {}
+    except FileNotFoundError as e:
+        return key, missing_input_task, (str(e),), {}
+
+
+def _limit_memory(memory_limit: Optional[float]) -> None:
+    """initializer of workers: bound the memory (in GB) of each worker process"""
+    if memory_limit is None:
+        return
+    try:
+        import resource
+    except ImportError:
+        # not available on Windows
+        hydro_logger.warning("Memory limit of workers is not supported on this OS")
+        return
+    limit = int(memory_limit * 1024**3)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _run_task(task: Tuple[str, Callable, tuple, dict]) -> Dict:
+    key, func, args, kwargs = task
+    start = time.time()
+    try:
+        func(*args, **kwargs)
+        status, error = "done", ""
+    except MemoryError:
+        status, error = "failed", "MemoryError: exceeded the memory limit of the worker"
+    except Exception:
+        status, error = "failed", traceback.format_exc()
+    return {
+        "task": key,
+        "status": status,
+        "seconds": time.time() - start,
+        "pid": os.getpid(),
+        "error": error,
+    }
+
+
+def run_pipeline(
+    tasks: List[Tuple[str, Callable, tuple, dict]],
+    outputs: List[str],
+    validate: Optional[Callable[[str], bool]] = valid_nc,
+    workers: int = 1,
+    max_tasks_per_child: Optional[int] = 20,
+    memory_limit: Optional[float] = None,
+    summary_file: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Run tasks on a process pool, skipping those whose outputs already exist and are valid
+
+    Parameters
+    ----------
+    tasks
+        each task is (key, function, args, kwargs); function must be importable at the module level
+    outputs
+        output file (or group of a store) of each task
+    validate
+        function to check if an output exists and is valid; if None, an existing output file is always valid
+    workers
+        number of worker processes; if 1, tasks are run in the current process
+    max_tasks_per_child
+        a worker is replaced after this number of tasks, so that memory leaked by netCDF/HDF5 is released
+    memory_limit
+        the max virtual memory (GB) of each worker; only supported on Unix-like systems
+    summary_file
+        if not None, save the summary to this csv file
+
+    Returns
+    -------
+    pd.DataFrame
+        summary of all tasks: task, status ("done", "skipped" or "failed"), seconds, pid and error
+    """
+    assert len(tasks) == len(outputs)
+    records = []
+    todo = []
+    for task, output in zip(tasks, outputs):
+        # an output could be a file or a group in a store, so a validate function checks whether it exists
+        if validate(output) if validate is not None else os.path.isfile(output):
+            records.append(
+                {
+                    "task": task[0],
+                    "status": "skipped",
+                    "seconds": 0.0,
+                    "pid": None,
+                    "error": "",
+                }
+            )
+        else:
+            todo.append(task)
+    hydro_logger.info(
+        "%d tasks in total, %d done before, %d to run with %d workers",
+        len(tasks),
+        len(tasks) - len(todo),
+        len(todo),
+        workers,
+    )
+    start = time.time()
+    if workers > 1:
+        with Pool(
+            processes=workers,
+            initializer=_limit_memory,
+            initargs=(memory_limit,),
+            maxtasksperchild=max_tasks_per_child,
+        ) as pool:
+            for record in tqdm(
+                pool.imap_unordered(_run_task, todo, chunksize=1), total=len(todo)
+            ):
+                records.append(record)
+    else:
+        for task in tqdm(todo):
+            records.append(_run_task(task))
+    wall_time = time.time() - start
+    summary = pd.DataFrame(
+        records, columns=["task", "status", "seconds", "pid", "error"]
+    )
+    _log_summary(summary, wall_time)
+    if summary_file is not None:
+        summary.to_csv(summary_file, index=False)
+    return summary
+
+
+def _log_summary(summary: pd.DataFrame, wall_time: float) -> None:
+    counts = summary["status"].value_counts()
+    run = summary[summary["status"] != "skipped"]
+    hydro_logger.info(
+        "Finished in %.1f s: %d done, %d skipped, %d failed",
+        wall_time,
+        counts.get("done", 0),
+        counts.get("skipped", 0),
+        counts.get("failed", 0),
+    )
+    if run.shape[0] > 0:
+        hydro_logger.info(
+            "Task time (s): mean %.2f, median %.2f, max %.2f, sum %.1f",
+            run["seconds"].mean(),
+            run["seconds"].median(),
+            run["seconds"].max(),
+            run["seconds"].sum(),
+        )
+        slowest = run.nlargest(5, "seconds")
+        for _, row in slowest.iterrows():
+            hydro_logger.info("  slow task %s: %.2f s", row["task"], row["seconds"])
+    for _, row in summary[summary["status"] == "failed"].iterrows():
+        hydro_logger.error("Task %s failed:\n%s", row["task"], row["error"])
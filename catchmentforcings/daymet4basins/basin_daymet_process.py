@@ -1,5 +1,6 @@
-import fnmatch
+import hashlib
 import os
+from collections import OrderedDict
 from typing import Union, Tuple, List, Optional, MutableMapping, Any
 import pygeoutils as geoutils
 import async_retriever as ar
@@ -8,15 +9,31 @@ from pydaymet import InvalidInputRange
 from pydaymet.core import Daymet, _check_requirements
 from pydaymet.pydaymet import _gridded_urls, _xarray_geomask
 from shapely.geometry import MultiPolygon, Polygon
-import rasterio.features as rio_features
 import io
 import xarray as xr
 import numpy as np
 import pandas as pd
-from catchmentforcings.pet.pet4daymet import priestley_taylor, pm_fao56
-from catchmentforcings.utils.hydro_utils import t_range_days
+from catchmentforcings.daymet4basins.daymet_bulk_download import format_daymet_dataset
+from catchmentforcings.pet.pet_engine import pet_fused_xr
+from catchmentforcings.utils.basin_weights import BasinWeights
+from catchmentforcings.utils.forcing_store import ForcingStore, forcing_store_path
+from catchmentforcings.utils.gee_transformer import (
+    GeeProductSpec,
+    trans_gee_to_camels_format,
+)
+from catchmentforcings.utils.hydro_utils import (
+    hydro_logger,
+    t_range_days,
+    year_month_day_hour,
+)
+from catchmentforcings.utils.mask_cache import cached_geometry_mask
+from catchmentforcings.utils.year_manifest import remove_manifest
 
 DEF_CRS = "epsg:4326"
+DEF_ELEVATION_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "catchmentforcings", "elevation"
+)
+ELEVATION_CACHE_DIR_ENV = "CATCHMENTFORCINGS_ELEVATION_CACHE_DIR"
 
 
 def download_daymet_by_geom_bound(
@@ -109,55 +126,109 @@ def download_daymet_by_geom_bound(
         )
         raise ValueError(msg)
 
-    for k, v in daymet.units.items():
-        if k in clm.variables:
-            clm[k].attrs["units"] = v
-
-    clm = clm.drop_vars(["lambert_conformal_conic"])
-    # daymet's crs comes from: https://daymet.ornl.gov/overview
-    daymet_crs = " ".join(
-        [
-            "+proj=lcc",
-            "+lat_1=25",
-            "+lat_2=60",
-            "+lat_0=42.5",
-            "+lon_0=-100",
-            "+x_0=0",
-            "+y_0=0",
-            "+ellps=WGS84",
-            "+units=km",
-            "+no_defs",
-        ]
-    )
-    clm.attrs["crs"] = daymet_crs
-    clm.attrs["nodatavals"] = (0.0,)
-    transform, _, _ = geoutils.pygeoutils._get_transform(clm, ("y", "x"))
-    clm.attrs["transform"] = transform
-    clm.attrs["res"] = (transform.a, transform.e)
-
-    if isinstance(clm, xr.Dataset):
-        for v in clm:
-            clm[v].attrs["crs"] = crs
-            clm[v].attrs["nodatavals"] = (0.0,)
+    clm = format_daymet_dataset(clm, daymet.units, crs)
     if boundary:
         return _xarray_geomask(clm, geometry.bounds, crs)
     else:
         return clm
 
 
+def _elevation_cache_key(
+    xs: np.ndarray, ys: np.ndarray, crs: str, resolution: float
+) -> str:
+    sha = hashlib.sha1()
+    sha.update(np.ascontiguousarray(xs, dtype=np.float64).tobytes())
+    sha.update(np.ascontiguousarray(ys, dtype=np.float64).tobytes())
+    sha.update(str(crs).encode())
+    sha.update(repr(round(float(resolution), 6)).encode())
+    return sha.hexdigest()
+
+
+_ELEVATION_MEMORY = OrderedDict()
+
+
+def get_elevation_grid(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    crs: str,
+    resolution: float,
+    cache_dir: Optional[str] = None,
+) -> xr.DataArray:
+    """
+    Get elevation of a grid from 3DEP; the grid's elevation is cached, so it is downloaded only once
+
+    Parameters
+    ----------
+    xs
+        x coordinates of the grid
+    ys
+        y coordinates of the grid
+    crs
+        CRS of the grid
+    resolution
+        resolution of the grid in meters
+    cache_dir
+        directory of the cached NetCDF files; if None, use the environment variable
+        CATCHMENTFORCINGS_ELEVATION_CACHE_DIR or ~/.cache/catchmentforcings/elevation
+
+    Returns
+    -------
+    xr.DataArray
+        the elevation of the grid
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(ELEVATION_CACHE_DIR_ENV, DEF_ELEVATION_CACHE_DIR)
+    key = _elevation_cache_key(xs, ys, crs, resolution)
+    if key in _ELEVATION_MEMORY:
+        _ELEVATION_MEMORY.move_to_end(key)
+        return _ELEVATION_MEMORY[key]
+    cache_file = os.path.join(cache_dir, key + ".nc")
+    if os.path.isfile(cache_file):
+        with xr.open_dataarray(cache_file) as da:
+            elev = da.load()
+    else:
+        elev = py3dep.elevation_bygrid(xs, ys, crs, resolution)
+        tmp_file = cache_file + ".tmp" + str(os.getpid())
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+            elev.to_netcdf(tmp_file)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            # e.g. a read-only or full cache directory; the elevation is still kept in memory
+            hydro_logger.warning(
+                f"Failed to save the elevation cache {cache_file}: {e}"
+            )
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+    _ELEVATION_MEMORY[key] = elev
+    while len(_ELEVATION_MEMORY) > 128:
+        _ELEVATION_MEMORY.popitem(last=False)
+    return elev
+
+
 def calculate_basin_grids_pet(
-    clm_ds: xr.Dataset, pet_method: Union[str, list] = "priestley_taylor"
+    clm_ds: xr.Dataset,
+    pet_method: Union[str, list] = "priestley_taylor",
+    chunks: Optional[dict] = None,
 ) -> xr.Dataset:
     """
     Compute Potential EvapoTranspiration using Daymet dataset.
 
+    The elevation of the grid is got from :func:`get_elevation_grid`, so it is downloaded only once for a basin.
+    The input dataset is not modified. When clm_ds is backed by dask arrays (or chunks is given), PET is lazy and
+    calculated chunk by chunk only when the result is computed or saved, so large mosaics fit in memory.
+
     Parameters
     ----------
     clm_ds
         The dataset should include the following variables:
-        `tmin``, ``tmax``, ``lat``, ``lon``, ``vp``, ``srad``, ``dayl``
+        `tmin``, ``tmax``, ``lat``, ``lon``, ``vp``, ``srad``, ``dayl``;
+        its time could cover many years, see :func:`calculate_basin_grids_pet_of_years`
     pet_method
         now support priestley_taylor and fao56
+    chunks
+        if not None, chunk clm_ds with it (such as {"time": 366, "y": 500, "x": 500}) to calculate PET lazily
 
     Returns
     -------
@@ -175,57 +246,91 @@ def calculate_basin_grids_pet(
     # units: °C, °C, °, Pa, W/m^2, seconds
     _check_requirements(reqs, keys)
     dtype = clm_ds.tmin.dtype
-    dates = clm_ds["time"]
     # km -> m
     res = clm_ds.res[0] * 1.0e3
-    elev = py3dep.elevation_bygrid(clm_ds.x.values, clm_ds.y.values, clm_ds.crs, res)
+    elev = get_elevation_grid(clm_ds.x.values, clm_ds.y.values, clm_ds.crs, res)
     attrs = clm_ds.attrs
     clm_ds = xr.merge([clm_ds, elev], combine_attrs="override")
     clm_ds.attrs = attrs
+    # no drop=True here, so the mask is not computed for lazy data; the grid is same as the one after dropping
     clm_ds["elevation"] = clm_ds.elevation.where(
-        ~np.isnan(clm_ds.isel(time=0)[keys[0]]), drop=True
+        ~np.isnan(clm_ds.isel(time=0)[keys[0]])
     ).T
-    # Pa -> kPa
-    clm_ds["vp"] *= 1e-3
-    # data -> day of year
-    clm_ds["time"] = pd.to_datetime(clm_ds.time.values).dayofyear.astype(dtype)
+    if chunks is not None:
+        clm_ds = clm_ds.chunk(chunks)
 
-    t_min = clm_ds["tmin"]
-    t_max = clm_ds["tmax"]
+    ds_dims = ("time", "y", "x")
+    t_min = clm_ds["tmin"].transpose(*ds_dims)
+    t_max = clm_ds["tmax"].transpose(*ds_dims)
     # average over the daylight period of the day, W/m^2 -> average over the day, MJ m-2 day-1
-    r_surf = clm_ds["srad"] * clm_ds["dayl"] * 1e-6
-    lat = clm_ds.isel(time=0).lat
+    r_surf = (
+        clm_ds["srad"].transpose(*ds_dims) * clm_ds["dayl"].transpose(*ds_dims) * 1e-6
+    )
+    lat = clm_ds.isel(time=0).lat.transpose(*ds_dims[1:])
     # ° -> rad
     phi = lat * np.pi / 180.0
-    elevation = clm_ds["elevation"]
-    doy = clm_ds["time"]
-    e_a = clm_ds["vp"]
-
-    for pet_name in pet_method:
-        if pet_name == "pm_fao56":
-            clm_ds["pet_fao56"] = pm_fao56(
-                t_min, t_max, r_surf, phi, elevation, doy, e_a=e_a
-            )
-            clm_ds["pet_fao56"].attrs["units"] = "mm/day"
-        elif pet_name == "priestley_taylor":
-            clm_ds["pet_pt"] = priestley_taylor(
-                t_min, t_max, r_surf, phi, elevation, doy, e_a=e_a
-            )
-            clm_ds["pet_pt"].attrs["units"] = "mm/day"
+    elevation = clm_ds["elevation"].transpose(*ds_dims[1:])
+    # date -> day of year; the time coordinate is kept, so it could span many years
+    doy = clm_ds["time"].dt.dayofyear.astype(dtype)
+    # Pa -> kPa
+    e_a = clm_ds["vp"].transpose(*ds_dims) * 1e-3
+
+    # all methods are calculated in one pass, sharing the common terms
+    pets = pet_fused_xr(
+        t_min, t_max, r_surf, phi, elevation, doy, e_a=e_a, methods=pet_method
+    )
+    pet_names = {"pm_fao56": "pet_fao56", "priestley_taylor": "pet_pt"}
+    for method, pet in pets.items():
+        clm_ds[pet_names[method]] = pet
 
-    # after calculation, recover the value of time and vp
-    clm_ds["time"] = dates
-    clm_ds["vp"] *= 1.0e3
     return clm_ds
 
 
+def calculate_basin_grids_pet_of_years(
+    clm_ds_lst: List[xr.Dataset], pet_method: Union[str, list] = "priestley_taylor"
+) -> List[xr.Dataset]:
+    """
+    Compute PET for many (yearly) datasets of one basin in a single pass
+
+    All datasets are concatenated along time, PET is calculated once, and then the result is split again.
+
+    Parameters
+    ----------
+    clm_ds_lst
+        datasets with the same grid, such as yearly files of a basin cut by :func:`generate_boundary_dataset`
+    pet_method
+        now support priestley_taylor and fao56
+
+    Returns
+    -------
+    List[xr.Dataset]
+        the datasets with PET, in the same order as clm_ds_lst
+    """
+    lengths = [ds.sizes["time"] for ds in clm_ds_lst]
+    clm_ds = xr.concat(
+        clm_ds_lst,
+        dim="time",
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+        combine_attrs="override",
+    )
+    clm_ds_pet = calculate_basin_grids_pet(clm_ds, pet_method)
+    ends = np.cumsum(lengths)
+    starts = ends - np.array(lengths)
+    return [clm_ds_pet.isel(time=slice(start, end)) for start, end in zip(starts, ends)]
+
+
 def calculate_basin_mean(
     clm_ds: xr.Dataset,
     geometry: Union[Polygon, MultiPolygon, Tuple[float, float, float, float]],
     geo_crs: str = DEF_CRS,
+    weights: Optional[BasinWeights] = None,
 ) -> xr.Dataset:
     """
-    Get gridded data from the Daymet database at 1-km resolution.
+    Get basin mean values of gridded Daymet data at 1-km resolution.
+
+    Each grid is weighted by the fraction of its area covered by the basin.
 
     Parameters
     ----------
@@ -235,18 +340,55 @@ def calculate_basin_mean(
         The geometry of a basin.
     geo_crs
         The CRS of the input geometry, defaults to epsg:4326.
+    weights
+        precomputed weights of the basin for the grid of clm_ds;
+        when the same basin is processed for many years, compute it once and pass it here
     Returns
     -------
     xr.Dataset
         Daily mean climate data of the basin
 
     """
+    if weights is None:
+        weights = BasinWeights.from_dataset(clm_ds, [geometry], geo_crs=geo_crs)
+    return weights.mean_dataset(clm_ds).isel(basin=0, drop=True)
 
-    clm = _xarray_geomask(clm_ds, geometry, geo_crs)
-    ds = xr.Dataset({}, coords={"time": clm.time})
-    for k in clm.data_vars:
-        ds[k] = clm[k].mean(dim=("x", "y"))
-    return ds
+
+def calculate_basins_mean(
+    clm_ds: xr.Dataset,
+    geometries: List[Union[Polygon, MultiPolygon]],
+    basin_ids: Optional[List[str]] = None,
+    geo_crs: str = DEF_CRS,
+    weights: Optional[BasinWeights] = None,
+) -> xr.Dataset:
+    """
+    Get basin mean values of many basins from one gridded dataset, such as a Daymet mosaic covering all basins.
+
+    All basins are rasterized only once, and the means of all basins are computed by one sparse matrix product.
+
+    Parameters
+    ----------
+    clm_ds
+        gridded daymet Dataset
+    geometries
+        The geometries of basins.
+    basin_ids
+        ids of basins, used as the coordinate of the "basin" dimension
+    geo_crs
+        The CRS of the input geometries, defaults to epsg:4326.
+    weights
+        precomputed weights of basins for the grid of clm_ds
+
+    Returns
+    -------
+    xr.Dataset
+        Daily mean climate data of basins; the dimensions are (basin, time)
+    """
+    if weights is None:
+        weights = BasinWeights.from_dataset(
+            clm_ds, geometries, basin_ids=basin_ids, geo_crs=geo_crs
+        )
+    return weights.mean_dataset(clm_ds)
 
 
 def generate_boundary_dataset(
@@ -277,9 +419,7 @@ def generate_boundary_dataset(
     transform, width, height = geoutils.pygeoutils._get_transform(clm_ds, ds_dims)
     _geometry = geoutils.pygeoutils._geo2polygon(geometry, geo_crs, clm_ds.crs)
 
-    _mask = rio_features.geometry_mask(
-        [_geometry], (height, width), transform, invert=True
-    )
+    _mask = cached_geometry_mask(_geometry, (height, width), transform, invert=True)
     # x - column, y - row
     y_idx, x_idx = np.where(_mask)
     y_idx_min = y_idx.min()
@@ -349,8 +489,33 @@ def resample_nc(clm_ds: xr.Dataset, resample_size: Union[int, float]) -> xr.Data
     return ds
 
 
+DAYMET_GEE_SPEC = GeeProductSpec(
+    "daymet",
+    ["daymet_{region}_mean_{year}.csv"],
+    [["dayl", "prcp", "srad", "swe", "tmax", "tmin", "vp"]],
+    [
+        "dayl(s)",
+        "prcp(mm/day)",
+        "srad(W/m2)",
+        "swe(mm)",
+        "tmax(C)",
+        "tmin(C)",
+        "vp(Pa)",
+    ],
+    "_lump_daymet_forcing.txt",
+    float_format="%.2f",
+)
+
+
 def trans_daymet_to_camels_format(
-    daymet_dir: str, output_dir: str, gage_dict: dict, region: str, year: int
+    daymet_dir: str,
+    output_dir: str,
+    gage_dict: dict,
+    region: str,
+    year: Union[int, List[int]],
+    output_format: str = "txt",
+    workers: int = 1,
+    chunksize: Optional[int] = None,
 ):
     """
     Transform forcing data of daymet downloaded from GEE to the format in CAMELS.
@@ -374,99 +539,46 @@ def trans_daymet_to_camels_format(
         For example, if we use the basins' shpfile in CAMELS, the region is "camels".
     year
         we use GEE code to generate data for each year, so each year for each region has one data file.
+        It could also be a list of years.
+    output_format
+        "txt": a text file for each basin; "zarr": a ForcingStore for all basins in output_dir; "both": both of them
+    workers
+        number of processes to read the files of years when year is a list of years
+    chunksize
+        if given, the files are streamed in chunks of so many rows, so that very large files fit in memory
     Returns
     -------
     None
     """
+    trans_gee_to_camels_format(
+        DAYMET_GEE_SPEC,
+        daymet_dir,
+        output_dir,
+        gage_dict,
+        region,
+        year,
+        output_format=output_format,
+        workers=workers,
+        chunksize=chunksize,
+    )
 
-    name_dataset = [
-        "gage_id",
-        "time_start",
-        "dayl",
-        "prcp",
-        "srad",
-        "swe",
-        "tmax",
-        "tmin",
-        "vp",
-    ]
-    camels_index = [
-        "Year",
-        "Mnth",
-        "Day",
-        "Hr",
-        "dayl(s)",
-        "prcp(mm/day)",
-        "srad(W/m2)",
-        "swe(mm)",
-        "tmax(C)",
-        "tmin(C)",
-        "vp(Pa)",
-    ]
 
-    if "STAID" in gage_dict:
-        gage_id_key = "STAID"
-    elif "gauge_id" in gage_dict:
-        gage_id_key = "gauge_id"
-    elif "gage_id" in gage_dict:
-        gage_id_key = "gage_id"
-    else:
-        raise NotImplementedError("No such gage id name")
-
-    if "HUC02" in gage_dict:
-        huc02_key = "HUC02"
-    elif "huc_02" in gage_dict:
-        huc02_key = "huc_02"
-    else:
-        raise NotImplementedError("No such huc02 id")
-
-    for f_name in os.listdir(daymet_dir):
-        if fnmatch.fnmatch(f_name, f"daymet_{region}_mean_{year}.csv"):
-            data_file = os.path.join(daymet_dir, f_name)
-            # because this func only works for one region and one year, it means it only works for one file once
-            # Hence, when we find the file and transform it, just finish
-            break
-    data_temp = pd.read_csv(data_file, sep=",", dtype={name_dataset[0]: str})
-    for i_basin in range(len(gage_dict[gage_id_key])):
-        # name csv
-        # if type is not str, may not find the data
-        assert type(gage_dict[gage_id_key][i_basin]) == str
-        basin_data = data_temp[
-            data_temp[name_dataset[0]] == gage_dict[gage_id_key][i_basin]
-        ]
-        if basin_data.shape[0] == 0:
-            raise ArithmeticError("Such chosen basins have no data")
-        # get Year,Month,Day,Hour info
-        csv_date = pd.to_datetime(basin_data[name_dataset[1]])
-        # the hour is set to 12, as 12 is the average hour of a day
-        year_month_day_hour = pd.DataFrame(
-            [[dt.year, dt.month, dt.day, 12] for dt in csv_date],
-            columns=camels_index[:4],
-        )
-        data_df = pd.DataFrame(basin_data.iloc[:, 2:].values, columns=camels_index[4:])
-        # concat
-        new_data_df = pd.concat([year_month_day_hour, data_df], axis=1)
-        # output the result
-        huc_id = gage_dict[huc02_key][i_basin]
-        output_huc_dir = os.path.join(output_dir, huc_id)
-        if not os.path.isdir(output_huc_dir):
-            os.makedirs(output_huc_dir)
-        output_file = os.path.join(
-            output_huc_dir, gage_dict[gage_id_key][i_basin] + "_lump_daymet_forcing.txt"
-        )
-        print("output forcing data of", gage_dict[gage_id_key][i_basin], "year", year)
-        if os.path.isfile(output_file):
-            data_old = pd.read_csv(output_file, sep=" ")
-            years = np.unique(data_old[camels_index[0]].values)
-            if year in years:
-                continue
-            os.remove(output_file)
-            new_data_df = pd.concat([data_old, new_data_df]).sort_values(
-                by=camels_index[:3]
-            )
-        new_data_df.to_csv(
-            output_file, header=True, index=False, sep=" ", float_format="%.2f"
+def _insert_daymet_value_in_leap_year_store(
+    store: ForcingStore, data_dir: str, t_range: list
+):
+    """the same interpolation as insert_daymet_value_in_leap_year, but for all basins in a ForcingStore"""
+    t_range_list = t_range_days(t_range)
+    with store.open() as ds:
+        ds_leap = ds.reindex(time=pd.to_datetime(t_range_list)).load()
+    for var in ds_leap.data_vars:
+        ds_leap[var].values = (
+            pd.DataFrame(ds_leap[var].values.T)
+            .interpolate(method="linear", limit_direction="forward", axis=0)
+            .values.T.astype(ds_leap[var].dtype)
         )
+    ForcingStore(forcing_store_path(data_dir, "_lump_daymet_forcing_leap.txt")).write(
+        ds_leap
+    )
 
 
 def insert_daymet_value_in_leap_year(data_dir: str, t_range: list = None):
@@ -487,7 +599,12 @@ def insert_daymet_value_in_leap_year(data_dir: str, t_range: list = None):
 
     if t_range is None:
         t_range = ["1980-01-01", "2020-01-01"]
-    subdir_str = os.listdir(data_dir)
+    store = ForcingStore(forcing_store_path(data_dir, "_lump_daymet_forcing.txt"))
+    if store.exists():
+        _insert_daymet_value_in_leap_year_store(store, data_dir, t_range)
+    subdir_str = [
+        a_dir for a_dir in os.listdir(data_dir) if not a_dir.endswith(".zarr")
+    ]
     col_lst = [
         "dayl(s)",
         "prcp(mm/day)",
@@ -504,7 +621,8 @@ def insert_daymet_value_in_leap_year(data_dir: str, t_range: list = None):
         for filename in path_list:
             data_file = os.path.join(subdir, filename)
             is_leap_file_name = data_file[-8:]
-            if "leap" in is_leap_file_name:
+            # skip manifests of years, see catchmentforcings.utils.year_manifest
+            if "leap" in is_leap_file_name or not filename.endswith(".txt"):
                 continue
             print("reading", data_file)
             data_temp = pd.read_csv(data_file, sep=r"\s+")
@@ -523,15 +641,13 @@ def insert_daymet_value_in_leap_year(data_dir: str, t_range: list = None):
             x_intepolate = x.interpolate(
                 method="linear", limit_direction="forward", axis=0
             )
-            csv_date = pd.to_datetime(t_range_list)
-            year_month_day_hour = pd.DataFrame(
-                [[dt.year, dt.month, dt.day, dt.hour] for dt in csv_date],
-                columns=["Year", "Mnth", "Day", "Hr"],
-            )
             # concat
-            new_data_df = pd.concat([year_month_day_hour, x_intepolate], axis=1)
+            new_data_df = pd.concat(
+                [year_month_day_hour(t_range_list, hour=None), x_intepolate], axis=1
+            )
             output_file = data_file[:-4] + "_leap.txt"
             new_data_df.to_csv(
                 output_file, header=True, index=False, sep=" ", float_format="%.2f"
             )
             os.remove(data_file)
+            remove_manifest(data_file)
@@ -0,0 +1,408 @@
+"""
+An asynchronous bulk downloader of Daymet subsets from THREDDS
+
+Jobs (the geometry of a basin and its years) are coalesced into deduplicated subset requests, one for each (bounds,
+variable, year), and all requests run in one shared aiohttp session whose connections are pooled. The number of
+concurrent requests is limited globally, requests to a host start at least a given interval apart, and failed requests
+are retried with exponential back-off within a retry budget shared by all requests. Each response is written to a
+temporary file and then renamed, so the downloaded files are the state of a run: a rerun only requests missing files.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlencode, urlsplit
+
+import aiohttp
+import pandas as pd
+import pygeoutils as geoutils
+import xarray as xr
+from shapely.geometry import MultiPolygon, Polygon
+
+from catchmentforcings.utils.hydro_utils import hydro_logger
+
+DAYMET_THREDDS_URL = "https://thredds.daac.ornl.gov/thredds/ncss/ornldaac"
+DAYMET_DATE_FMT = "%Y-%m-%dT%H:%M:%SZ"
+DAYMET_TIME_CODES = {"daily": 2129, "monthly": 2131, "annual": 2130}
+DAYMET_VARS = ["dayl", "prcp", "srad", "swe", "tmax", "tmin", "vp"]
+DAYMET_UNITS = {
+    "dayl": "s/day",
+    "prcp": "mm/day",
+    "srad": "W/m2",
+    "swe": "kg/m2",
+    "tmax": "degrees C",
+    "tmin": "degrees C",
+    "vp": "Pa",
+}
+# daymet's crs comes from: https://daymet.ornl.gov/overview
+DAYMET_CRS = " ".join(
+    [
+        "+proj=lcc",
+        "+lat_1=25",
+        "+lat_2=60",
+        "+lat_0=42.5",
+        "+lon_0=-100",
+        "+x_0=0",
+        "+y_0=0",
+        "+ellps=WGS84",
+        "+units=km",
+        "+no_defs",
+    ]
+)
+# too many requests or errors of the server; other errors (e.g. 404) are not retried
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+DaymetJob = Tuple[
+    Union[Polygon, MultiPolygon, Tuple[float, float, float, float]], Sequence[int]
+]
+
+
+def _daymet_file_name(time_scale: str, region: str, var: str) -> str:
+    if time_scale == "daily":
+        return f"daily_{region}_{var}"
+    if time_scale == "monthly":
+        return f"{var}_monttl_{region}" if var == "prcp" else f"{var}_monavg_{region}"
+    return f"{var}_annttl_{region}" if var == "prcp" else f"{var}_annavg_{region}"
+
+
+def _year_range(year: int) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    # Daymet has no Dec 31 in leap years
+    start = pd.Timestamp(year=year, month=1, day=1, hour=12)
+    end = pd.Timestamp(
+        year=year, month=12, day=30 if start.is_leap_year else 31, hour=12
+    )
+    return start, end
+
+
+def daymet_subset_url(
+    bounds: Tuple[float, float, float, float],
+    var: str,
+    year: int,
+    region: str = "na",
+    time_scale: str = "daily",
+    base_url: str = DAYMET_THREDDS_URL,
+) -> str:
+    """the THREDDS NCSS url of a variable in a year within bounds (west, south, east, north) in epsg:4326"""
+    code = DAYMET_TIME_CODES[time_scale]
+    west, south, east, north = bounds
+    start, end = _year_range(year)
+    params = {
+        "var": var,
+        "north": f"{north:0.6f}",
+        "west": f"{west:0.6f}",
+        "east": f"{east:0.6f}",
+        "south": f"{south:0.6f}",
+        "disableProjSubset": "on",
+        "horizStride": "1",
+        "time_start": start.strftime(DAYMET_DATE_FMT),
+        "time_end": end.strftime(DAYMET_DATE_FMT),
+        "timeStride": "1",
+        "addLatLon": "true",
+        "accept": "netcdf",
+    }
+    file_name = _daymet_file_name(time_scale, region, var)
+    return f"{base_url}/{code}/daymet_v4_{file_name}_{year}.nc?" + urlencode(params)
+
+
+def daymet_subset_requests(
+    jobs: Sequence[DaymetJob],
+    variables: Optional[List[str]] = None,
+    region: str = "na",
+    time_scale: str = "daily",
+    base_url: str = DAYMET_THREDDS_URL,
+) -> Tuple[Dict[str, str], List[Dict[int, List[str]]]]:
+    """
+    Coalesce jobs into deduplicated subset requests
+
+    Parameters
+    ----------
+    jobs
+        a list of (geometry, years); a geometry is a polygon or its bounds (west, south, east, north) in epsg:4326
+    variables
+        Daymet variables; all variables by default
+    region
+        na, hi or pr
+    time_scale
+        daily, monthly or annual
+    base_url
+        the url of the THREDDS NCSS service
+
+    Returns
+    -------
+    Tuple[Dict[str, str], List[Dict[int, List[str]]]]
+        url -> file name of all unique requests, and year -> urls of the variables for each job
+    """
+    if variables is None:
+        variables = DAYMET_VARS
+    requests = OrderedDict()
+    job_urls = []
+    for geometry, years in jobs:
+        bounds = geometry.bounds if hasattr(geometry, "bounds") else tuple(geometry)
+        year_urls = OrderedDict()
+        for year in years:
+            urls = []
+            for var in variables:
+                url = daymet_subset_url(bounds, var, year, region, time_scale, base_url)
+                if url not in requests:
+                    # the hash of the url identifies the file, so the same request of another job shares it
+                    digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+                    requests[url] = f"daymet_{var}_{year}_{digest}.nc"
+                urls.append(url)
+            year_urls[year] = urls
+        job_urls.append(year_urls)
+    return requests, job_urls
+
+
+class _HostRateLimiter:
+    """requests to a host start at least min_interval seconds apart"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_start: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host: str) -> None:
+        if self.min_interval <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class _RetryBudget:
+    """the number of retries left for all requests, so a failing server is not requested again and again"""
+
+    def __init__(self, retries: int):
+        self.retries = retries
+
+    def take(self) -> bool:
+        if self.retries <= 0:
+            return False
+        self.retries -= 1
+        return True
+
+
+async def _fetch(
+    session: aiohttp.ClientSession,
+    url: str,
+    save_path: str,
+    semaphore: asyncio.Semaphore,
+    limiter: _HostRateLimiter,
+    budget: _RetryBudget,
+    max_retries: int,
+    backoff: float,
+) -> bool:
+    host = urlsplit(url).netloc
+    tmp_path = save_path + ".tmp" + str(os.getpid())
+    for attempt in range(max_retries + 1):
+        async with semaphore:
+            await limiter.wait(host)
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        with open(tmp_path, "wb") as f:
+                            async for chunk in resp.content.iter_chunked(2**20):
+                                f.write(chunk)
+                        os.replace(tmp_path, save_path)
+                        return True
+                    error = f"HTTP {resp.status}"
+                    if resp.status not in RETRY_STATUS:
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+        if attempt == max_retries or not budget.take():
+            break
+        await asyncio.sleep(backoff * 2**attempt)
+    if os.path.isfile(tmp_path):
+        os.remove(tmp_path)
+    hydro_logger.warning(f"Failed to download {url}: {error}")
+    return False
+
+
+async def _download_all(
+    requests: Dict[str, str],
+    save_dir: str,
+    max_concurrency: int,
+    max_requests_per_second: Optional[float],
+    max_retries: int,
+    retry_budget: int,
+    backoff: float,
+    timeout: float,
+) -> List[str]:
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = _HostRateLimiter(
+        0.0 if max_requests_per_second is None else 1.0 / max_requests_per_second
+    )
+    budget = _RetryBudget(retry_budget)
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        urls = list(requests)
+        ok = await asyncio.gather(
+            *[
+                _fetch(
+                    session,
+                    url,
+                    os.path.join(save_dir, requests[url]),
+                    semaphore,
+                    limiter,
+                    budget,
+                    max_retries,
+                    backoff,
+                )
+                for url in urls
+            ]
+        )
+    return [url for url, done in zip(urls, ok) if not done]
+
+
+def download_daymet_bulk(
+    jobs: Sequence[DaymetJob],
+    save_dir: str,
+    variables: Optional[List[str]] = None,
+    region: str = "na",
+    time_scale: str = "daily",
+    max_concurrency: int = 8,
+    max_requests_per_second: Optional[float] = None,
+    max_retries: int = 5,
+    retry_budget: int = 100,
+    backoff: float = 1.0,
+    timeout: float = 600.0,
+    base_url: str = DAYMET_THREDDS_URL,
+) -> List[Dict[int, List[str]]]:
+    """
+    Download Daymet subsets of many jobs asynchronously; files which have been downloaded are not requested again
+
+    Parameters
+    ----------
+    jobs
+        a list of (geometry, years); a geometry is a polygon or its bounds (west, south, east, north) in epsg:4326
+    save_dir
+        the directory of downloaded files
+    variables
+        Daymet variables; all variables by default
+    region
+        na, hi or pr
+    time_scale
+        daily, monthly or annual
+    max_concurrency
+        the max number of concurrent requests (and pooled connections)
+    max_requests_per_second
+        the max number of requests to a host started in a second; no limit by default
+    max_retries
+        the max number of retries of a request
+    retry_budget
+        the max number of retries of all requests
+    backoff
+        a request is retried after backoff * 2 ** attempt seconds
+    timeout
+        the timeout of a request in seconds
+    base_url
+        the url of the THREDDS NCSS service
+
+    Returns
+    -------
+    List[Dict[int, List[str]]]
+        year -> paths of the files of variables for each job; see :func:`open_daymet_files`
+
+    Raises
+    -------
+    ValueError
+        when some requests failed; the downloaded files are kept, so run it again to resume
+    """
+    if not os.path.isdir(save_dir):
+        os.makedirs(save_dir)
+    requests, job_urls = daymet_subset_requests(
+        jobs, variables, region, time_scale, base_url
+    )
+    missing = OrderedDict(
+        (url, file_name)
+        for url, file_name in requests.items()
+        if not os.path.isfile(os.path.join(save_dir, file_name))
+    )
+    hydro_logger.info(
+        f"{len(requests)} requests for {len(jobs)} jobs, {len(missing)} to download"
+    )
+    if missing:
+        failed = asyncio.run(
+            _download_all(
+                missing,
+                save_dir,
+                max_concurrency,
+                max_requests_per_second,
+                max_retries,
+                retry_budget,
+                backoff,
+                timeout,
+            )
+        )
+        if failed:
+            raise ValueError(
+                f"The server did NOT process {len(failed)} of {len(missing)} requests successfully. "
+                + "Run it again to download them."
+            )
+    return [
+        OrderedDict(
+            (year, [os.path.join(save_dir, requests[url]) for url in urls])
+            for year, urls in year_urls.items()
+        )
+        for year_urls in job_urls
+    ]
+
+
+def format_daymet_dataset(
+    clm: xr.Dataset,
+    units: Optional[Dict[str, str]] = None,
+    crs: str = "epsg:4326",
+) -> xr.Dataset:
+    """
+    Set units, crs, nodatavals, transform and res of a Daymet subset from THREDDS, as pydaymet does
+
+    Parameters
+    ----------
+    clm
+        the subset
+    units
+        the units of variables; DAYMET_UNITS by default
+    crs
+        the crs attribute of each variable
+
+    Returns
+    -------
+    xr.Dataset
+        the subset without the variable "lambert_conformal_conic", which could be cut by
+        :func:`catchmentforcings.daymet4basins.basin_daymet_process.generate_boundary_dataset`
+    """
+    if units is None:
+        units = DAYMET_UNITS
+    for k, v in units.items():
+        if k in clm.variables:
+            clm[k].attrs["units"] = v
+
+    clm = clm.drop_vars(["lambert_conformal_conic"], errors="ignore")
+    clm.attrs["crs"] = DAYMET_CRS
+    clm.attrs["nodatavals"] = (0.0,)
+    transform, _, _ = geoutils.pygeoutils._get_transform(clm, ("y", "x"))
+    clm.attrs["transform"] = transform
+    clm.attrs["res"] = (transform.a, transform.e)
+    for v in clm:
+        clm[v].attrs["crs"] = crs
+        clm[v].attrs["nodatavals"] = (0.0,)
+    return clm
+
+
+def open_daymet_files(paths: List[str]) -> xr.Dataset:
+    """merge the downloaded files of variables in a year into one dataset; see :func:`format_daymet_dataset`"""
+    datasets = []
+    for path in paths:
+        with xr.open_dataset(path) as ds:
+            datasets.append(ds.load())
+    return format_daymet_dataset(
+        xr.merge(datasets, compat="override", combine_attrs="override")
+    )
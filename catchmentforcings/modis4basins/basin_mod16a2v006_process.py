@@ -2,14 +2,42 @@
 Process MODIS16A2.006 ET data for basins
 """
 
-import fnmatch
-import os
-import numpy as np
-import pandas as pd
+from catchmentforcings.utils.gee_transformer import (
+    GeeProductSpec,
+    trans_gee_to_camels_format,
+)
+
+
+def modis16a2_gee_spec(version="006"):
+    """the spec of MODIS16A2 data (version 006 or gf061) downloaded from GEE"""
+    # you can add features or delete features, or change the order, which depends on your txt content
+    return GeeProductSpec(
+        f"modis16a2v{version}_et",
+        [f"mod16a2{version}_{{region}}_mean_{{year}}*.csv"],
+        [["ET", "LE", "PET", "PLE", "ET_QC"]],
+        [
+            "ET(kg/m^2/8day)",
+            "LE(J/m^2/day)",
+            "PET(kg/m^2/8day)",
+            "PLE(J/m^2/day)",
+            "ET_QC",
+        ],
+        f"_lump_modis16a2v{version}_et.txt",
+        sep=",",
+        float_format="%.4f",
+    )
 
 
 def trans_8day_modis16a2_to_camels_format(
-    modis16a2_dir, output_dir, gage_dict, region, year, version="006"
+    modis16a2_dir,
+    output_dir,
+    gage_dict,
+    region,
+    year,
+    version="006",
+    output_format="txt",
+    workers=1,
+    chunksize=None,
 ):
     """
     Transform 8-day MODIS16A2(version 006 and GF.061) data downloaded from GEE to the format in CAMELS.
@@ -28,105 +56,28 @@ def trans_8day_modis16a2_to_camels_format(
         For example, if we use the basins' shpfile in CAMELS, the region is "camels".
     year
         we use GEE code to generate data for each year, so each year for each region has one data file.
+        It could also be a list of years.
     version
         the version of MODIS16A2 data, we only provide version 006 and gf061 now.
+    output_format
+        "txt": a text file for each basin; "zarr": a ForcingStore for all basins in output_dir; "both": both of them
+    workers
+        number of processes to read the files of years when year is a list of years
+    chunksize
+        if given, the files are streamed in chunks of so many rows, so that very large files fit in memory
     Returns
     -------
     None
 
     """
-    # you can add features or delete features, or change the order, which depends on your txt content
-    modis16a2_dataset = [
-        "gage_id",
-        "time_start",
-        "ET",
-        "LE",
-        "PET",
-        "PLE",
-        "ET_QC",
-    ]
-    camels_format_index = [
-        "Year",
-        "Mnth",
-        "Day",
-        "Hr",
-        "ET(kg/m^2/8day)",
-        "LE(J/m^2/day)",
-        "PET(kg/m^2/8day)",
-        "PLE(J/m^2/day)",
-        "ET_QC",
-    ]
-
-    if "STAID" in gage_dict.keys():
-        gage_id_key = "STAID"
-    elif "gauge_id" in gage_dict.keys():
-        gage_id_key = "gauge_id"
-    elif "gage_id" in gage_dict.keys():
-        gage_id_key = "gage_id"
-    else:
-        raise NotImplementedError("No such gage id name")
-
-    if "HUC02" in gage_dict.keys():
-        huc02_key = "HUC02"
-    elif "huc_02" in gage_dict.keys():
-        huc02_key = "huc_02"
-    else:
-        huc02_key = None
-
-    # because this function only work for one year and one region, it's better to chose avg and sum files at first
-    for f_name in os.listdir(modis16a2_dir):
-        if fnmatch.fnmatch(
-            f_name, f"mod16a2{version}_" + region + "_mean_" + str(year) + "*.csv"
-        ):
-            modis16a2_data_file = os.path.join(modis16a2_dir, f_name)
-
-    data_temp = pd.read_csv(
-        modis16a2_data_file, sep=",", dtype={modis16a2_dataset[0]: str}
+    trans_gee_to_camels_format(
+        modis16a2_gee_spec(version),
+        modis16a2_dir,
+        output_dir,
+        gage_dict,
+        region,
+        year,
+        output_format=output_format,
+        workers=workers,
+        chunksize=chunksize,
     )
-    for i_basin in range(len(gage_dict[gage_id_key])):
-        basin_data = data_temp[
-            data_temp[modis16a2_dataset[0]].values.astype(int)
-            == int(gage_dict[gage_id_key][i_basin])
-        ]
-        if basin_data.shape[0] == 0:
-            raise ArithmeticError("chosen basins' number is zero")
-        # get Year,Month,Day,Hour info
-        csv_date = pd.to_datetime(basin_data[modis16a2_dataset[1]])
-        # the hour is set to 12, as 12 is the average hour of a day
-        year_month_day_hour = pd.DataFrame(
-            [[dt.year, dt.month, dt.day, 12] for dt in csv_date],
-            columns=camels_format_index[:4],
-        )
-        data_df = pd.DataFrame(
-            basin_data.iloc[:, 2:].values, columns=camels_format_index[4:]
-        )
-        # concat
-        new_data_df = pd.concat([year_month_day_hour, data_df], axis=1)
-        # output the result
-        if huc02_key is not None:
-            huc_id = gage_dict[huc02_key][i_basin]
-            output_dir_ = os.path.join(output_dir, huc_id)
-        if not os.path.isdir(output_dir_):
-            os.makedirs(output_dir_)
-        output_file = os.path.join(
-            output_dir_,
-            gage_dict[gage_id_key][i_basin] + f"_lump_modis16a2v{version}_et.txt",
-        )
-        print(
-            f"output modis16a2v{version} et data of",
-            gage_dict[gage_id_key][i_basin],
-            "year",
-            year,
-        )
-        if os.path.isfile(output_file):
-            data_old = pd.read_csv(output_file)
-            years = np.unique(data_old[camels_format_index[0]].values)
-            if year in years:
-                continue
-            os.remove(output_file)
-            new_data_df = pd.concat([data_old, new_data_df]).sort_values(
-                by=camels_format_index[:3]
-            )
-        new_data_df.to_csv(
-            output_file, header=True, index=False, sep=",", float_format="%.4f"
-        )
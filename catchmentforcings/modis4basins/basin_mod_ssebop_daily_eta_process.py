@@ -12,12 +12,12 @@ import fnmatch
 import os
 
 import numpy as np
-from pygeoutils.pygeoutils import _get_transform, _geo2polygon
-from rasterio.features import geometry_mask
 import xarray as xr
 import geopandas as gpd
 import pandas as pd
 
+from catchmentforcings.utils.basin_weights import BasinWeights
+
 
 def calculate_tif_data_basin_mean(
     eta_tif_files: list, camels_shp_file: str
@@ -55,24 +55,13 @@ def calculate_tif_data_basin_mean(
         eta_tif_files, engine="rasterio", preprocess=preprocess, concat_dim="time"
     )
     geo_crs = basins.crs.to_string()
+    # rasterize all basins only once, then get means of all basins and all days by one matmul
+    weights = BasinWeights.from_dataset(
+        xds, list(basins.geometry), geo_crs=geo_crs, ds_crs=xds.rio.crs
+    )
     arr = np.empty((basins.shape[0], len(eta_tif_files)))
-    for i in range(basins.shape[0]):
-        geometry = basins.geometry[i]
-        ds_dims = ("y", "x")
-        transform, width, height = _get_transform(xds, ds_dims)
-        _geometry = _geo2polygon(geometry, geo_crs, xds.rio.crs)
-        _mask = geometry_mask([_geometry], (height, width), transform, invert=True)
-        coords = {
-            ds_dims[0]: xds.coords[ds_dims[0]],
-            ds_dims[1]: xds.coords[ds_dims[1]],
-        }
-        mask = xr.DataArray(_mask, coords, dims=ds_dims)
-
-        ds_masked = xds.where(mask, drop=True)
-        ds_masked.attrs["transform"] = transform
-        ds_masked.attrs["bounds"] = _geometry.bounds
-
-        for k in ds_masked.data_vars:
-            # only one band now
-            arr[i, :] = ds_masked[k].mean(dim=("x", "y", "band")).values
+    for k in xds.data_vars:
+        # only one band now
+        da = xds[k].transpose("time", "band", "y", "x")
+        arr[:, :] = np.nanmean(weights.mean(da.values), axis=-1)
     return arr
@@ -0,0 +1,227 @@
+"""fused calculation of several PET methods for gridded (time, y, x) data"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import xarray as xr
+
+from catchmentforcings.pet.rad_utils import extraterrestrial_r_lut
+
+PET_METHODS = ("priestley_taylor", "pm_fao56")
+
+
+def _e0(t: np.ndarray) -> np.ndarray:
+    # equation 11 in [allen_1998], same as meteo_utils.calc_e0
+    return 0.6108 * np.exp(17.27 * t / (t + 237.3))
+
+
+def pet_fused(
+    t_min: np.ndarray,
+    t_max: np.ndarray,
+    s_rad: np.ndarray,
+    lat: np.ndarray,
+    elevation: np.ndarray,
+    doy: np.ndarray,
+    e_a: Optional[np.ndarray] = None,
+    methods: Sequence[str] = PET_METHODS,
+    chunk_size: int = 32,
+    out: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, np.ndarray]:
+    """PET of several methods in one pass.
+
+    It gives the same results as :func:`catchmentforcings.pet.pet4daymet.priestley_taylor` and
+    :func:`catchmentforcings.pet.pet4daymet.pm_fao56`, but the terms shared by the methods (t_mean, delta, gamma,
+    Ra, Rn, ...) are computed only once, and the time axis is processed chunk by chunk, so temporary arrays are
+    only as large as a chunk rather than the whole cube.
+
+    Parameters
+    ----------
+    t_min:
+        minimum day temperature [°C], the first dimension is time, i.e. (time, ...)
+    t_max:
+        maximum day temperature [°C], (time, ...)
+    s_rad:
+        incoming solar radiation [MJ m-2 d-1], (time, ...)
+    lat:
+        the site latitude [rad], broadcastable to one time step of t_min
+    elevation:
+        the site elevation [m], broadcastable to one time step of t_min
+    doy:
+        Day of the year, (time,)
+    e_a:
+        Actual vapor pressure [kPa], (time, ...); if None, it is estimated from t_min
+    methods:
+        PET methods: "priestley_taylor" and/or "pm_fao56"
+    chunk_size:
+        number of time steps calculated together
+    out:
+        preallocated output arrays for methods; arrays for methods not in it are created
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        the calculated evaporation [mm day-1] of each method
+    """
+    methods = list(methods)
+    assert set(methods).issubset(PET_METHODS)
+    t_min = np.asarray(t_min)
+    t_max = np.asarray(t_max)
+    s_rad = np.asarray(s_rad)
+    doy = np.asarray(doy)
+    assert t_min.shape == t_max.shape == s_rad.shape
+    assert doy.shape == (t_min.shape[0],)
+    if out is None:
+        out = {}
+    dtype = np.result_type(t_min, t_max, s_rad)
+    for method in methods:
+        if method not in out:
+            out[method] = np.empty(t_min.shape, dtype=dtype)
+        assert out[method].shape == t_min.shape
+    # terms only depending on space
+    lat = np.asarray(lat)
+    elevation = np.asarray(elevation)
+    pressure = 101.3 * ((293 - 0.0065 * elevation) / 293) ** 5.26
+    gamma = 0.000665 * pressure
+    # mean wind speed is 2 m/s, see pm_fao56
+    wind = 2
+    gamma1 = gamma * (1 + 0.34 * wind)
+    rso_factor = 0.75 + (2 * 10**-5) * elevation
+    # shape of doy for broadcasting with the spatial dimensions
+    doy_shape = (-1,) + (1,) * (t_min.ndim - 1)
+
+    for start in range(0, t_min.shape[0], chunk_size):
+        s = slice(start, min(start + chunk_size, t_min.shape[0]))
+        tmin = t_min[s]
+        tmax = t_max[s]
+        srad = s_rad[s]
+        t_mean = 0.5 * (tmin + tmax)
+        t_mean_237 = t_mean + 237.3
+        dlt = 4098 * (0.6108 * np.exp(17.27 * t_mean / t_mean_237)) / t_mean_237**2
+        ea = (
+            0.611 * np.exp((17.27 * tmin) / (tmin + 237.3))
+            if e_a is None
+            else np.asarray(e_a[s])
+        )
+        # net shortwave radiation, albedo is 0.23
+        rns = (1 - 0.23) * srad
+        # net longwave radiation, equation 39 in [allen_1998]
+        ra = extraterrestrial_r_lut(doy[s].reshape(doy_shape), lat)
+        solar_rat = np.clip(srad / (rso_factor * ra), 0.3, 1)
+        rnl = 4.903 * 10**-9 * ((tmax + 273.16) ** 4 + (tmin + 273.16) ** 4) / 2
+        rnl *= 0.34 - 0.14 * np.sqrt(ea)
+        rnl *= 1.35 * solar_rat - 0.35
+        rn = rns - rnl
+        del rns, rnl, solar_rat, ra
+        if "priestley_taylor" in methods:
+            _lambda = 2.501 - 0.002361 * t_mean
+            out["priestley_taylor"][s] = (1.26 * dlt * rn) / (_lambda * (dlt + gamma))
+            del _lambda
+        if "pm_fao56" in methods:
+            e_s = (_e0(tmax) + _e0(tmin)) / 2
+            den = dlt + gamma1
+            out["pm_fao56"][s] = (0.408 * dlt * rn) / den + (
+                gamma * (e_s - ea) * 900 * wind / (t_mean + 273)
+            ) / den
+    return {method: out[method] for method in methods}
+
+
+def _pet_fused_block(
+    t_min, t_max, s_rad, lat, elevation, doy, e_a, methods, chunk_size
+):
+    # for dask arrays, apply_ufunc gives every array all dimensions (time, ...), with size 1 for missing ones
+    if lat.ndim == t_min.ndim:
+        lat = lat[0]
+    if elevation.ndim == t_min.ndim:
+        elevation = elevation[0]
+    pets = pet_fused(
+        t_min,
+        t_max,
+        s_rad,
+        lat,
+        elevation,
+        doy.reshape(-1),
+        e_a=e_a,
+        methods=methods,
+        chunk_size=chunk_size,
+    )
+    if len(methods) == 1:
+        return pets[methods[0]]
+    return tuple(pets[method] for method in methods)
+
+
+def pet_fused_xr(
+    t_min: xr.DataArray,
+    t_max: xr.DataArray,
+    s_rad: xr.DataArray,
+    lat: xr.DataArray,
+    elevation: xr.DataArray,
+    doy: xr.DataArray,
+    e_a: Optional[xr.DataArray] = None,
+    methods: Sequence[str] = PET_METHODS,
+    time_dim: str = "time",
+    chunk_size: int = 32,
+) -> Dict[str, xr.DataArray]:
+    """:func:`pet_fused` for xarray data; it is lazy when the data are dask arrays.
+
+    The calculation is expressed with xr.apply_ufunc(..., dask="parallelized"), so every dask chunk is
+    calculated independently, nothing is loaded before compute() and the memory is bounded by the chunks.
+
+    Parameters
+    ----------
+    t_min:
+        minimum day temperature [°C], with the time dimension
+    t_max:
+        maximum day temperature [°C]
+    s_rad:
+        incoming solar radiation [MJ m-2 d-1]
+    lat:
+        the site latitude [rad], without the time dimension
+    elevation:
+        the site elevation [m], without the time dimension
+    doy:
+        Day of the year, only with the time dimension
+    e_a:
+        Actual vapor pressure [kPa]; if None, it is estimated from t_min
+    methods:
+        PET methods: "priestley_taylor" and/or "pm_fao56"
+    time_dim:
+        name of the time dimension
+    chunk_size:
+        number of time steps calculated together in a block, see :func:`pet_fused`
+
+    Returns
+    -------
+    Dict[str, xr.DataArray]
+        the calculated evaporation [mm day-1] of each method
+    """
+    methods = list(methods)
+    dims = [time_dim] + [d for d in t_min.dims if d != time_dim]
+    t_min = t_min.transpose(*dims)
+    t_max = t_max.transpose(*dims)
+    s_rad = s_rad.transpose(*dims)
+    if e_a is None:
+        # same as the default of pet_fused, equation 48 in [allen_1998]
+        e_a = 0.611 * np.exp((17.27 * t_min) / (t_min + 237.3))
+    e_a = e_a.transpose(*dims)
+    lat = lat.transpose(*[d for d in dims if d in lat.dims])
+    elevation = elevation.transpose(*[d for d in dims if d in elevation.dims])
+    dtype = np.result_type(t_min.dtype, t_max.dtype, s_rad.dtype)
+    results = xr.apply_ufunc(
+        _pet_fused_block,
+        t_min,
+        t_max,
+        s_rad,
+        lat,
+        elevation,
+        doy,
+        e_a,
+        kwargs={"methods": methods, "chunk_size": chunk_size},
+        output_core_dims=[[] for _ in methods],
+        dask="parallelized",
+        output_dtypes=[dtype for _ in methods],
+    )
+    if len(methods) == 1:
+        results = (results,)
+    return {
+        method: result.transpose(*dims).assign_attrs(units="mm/day")
+        for method, result in zip(methods, results)
+    }
@@ -116,6 +116,123 @@ def extraterrestrial_r(
     return (24 * 60) / np.pi * 0.082 * dr * (omega * xx + yy * np.sin(omega))
 
 
+# latitude step [rad] of the Ra lookup table, about 0.6 km
+RA_TABLE_LAT_STEP = 1.0e-4
+# number of latitude nodes in each cached block of the Ra lookup table
+RA_TABLE_BLOCK = 1024
+_RA_TABLE_BLOCKS = {}
+
+
+def _ra_table_block(block: int) -> np.ndarray:
+    """Ra of doy 1-366 for latitude nodes of a block (including the first node of the next block)"""
+    if block not in _RA_TABLE_BLOCKS:
+        nodes = np.arange(block * RA_TABLE_BLOCK, (block + 1) * RA_TABLE_BLOCK + 1)
+        lat_nodes = nodes * RA_TABLE_LAT_STEP
+        doy = np.arange(1, 367, dtype=float)[:, None]
+        with np.errstate(invalid="ignore"):
+            _RA_TABLE_BLOCKS[block] = extraterrestrial_r(doy, lat_nodes[None, :])
+    return _RA_TABLE_BLOCKS[block]
+
+
+def _extraterrestrial_r_lookup(doy: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    doy = np.asarray(doy)
+    lat = np.asarray(lat, dtype=float)
+    out_shape = np.broadcast_shapes(doy.shape, lat.shape)
+    valid = np.isfinite(lat)
+    pos = np.where(valid, lat, 0.0) / RA_TABLE_LAT_STEP
+    node = np.floor(pos).astype(np.int64)
+    # NaN latitudes give NaN Ra through frac
+    frac = np.where(valid, pos - node, np.nan)
+    first_block = int(node[valid].min()) // RA_TABLE_BLOCK if valid.any() else 0
+    last_block = int(node[valid].max()) // RA_TABLE_BLOCK if valid.any() else 0
+    table = np.concatenate(
+        [_ra_table_block(block)[:, :-1] for block in range(first_block, last_block + 1)]
+        + [_ra_table_block(last_block)[:, -1:]],
+        axis=1,
+    )
+    slope = np.diff(table, axis=1)
+    col = np.where(valid, node - first_block * RA_TABLE_BLOCK, 0)
+    row = doy.astype(np.int64) - 1
+    ndim = len(out_shape)
+    row_nd = row.reshape((1,) * (ndim - row.ndim) + row.shape)
+    col_nd = col.reshape((1,) * (ndim - col.ndim) + col.shape)
+    if ndim > 0 and row_nd.size == row_nd.shape[0] and col_nd.shape[0] == 1:
+        # the common case: doy only varies along the first (time) axis and lat along the others,
+        # so every time step is a 1-d lookup and a time step is calculated only once for each doy
+        ra = np.empty(out_shape)
+        col_1d = np.broadcast_to(col_nd[0], out_shape[1:]).ravel()
+        frac_1d = np.broadcast_to(frac.reshape(col_nd.shape)[0], out_shape[1:]).ravel()
+        rows = np.broadcast_to(row_nd.ravel(), out_shape[:1])
+        done = {}
+        for i, r in enumerate(rows):
+            if r in done:
+                ra[i] = ra[done[r]]
+            else:
+                ra[i] = (
+                    table[r].take(col_1d) + slope[r].take(col_1d) * frac_1d
+                ).reshape(out_shape[1:])
+                done[r] = i
+    else:
+        ra = table[row, col] + slope[row, col] * frac
+    return ra
+
+
+def _is_chunked(x) -> bool:
+    """whether x is a dask array or a DataArray backed by one"""
+    return not isinstance(x, np.ndarray) and getattr(x, "chunks", None) is not None
+
+
+def extraterrestrial_r_lut(
+    doy: Union[np.ndarray, xr.DataArray],
+    lat: Union[np.ndarray, xr.DataArray],
+) -> Union[np.ndarray, xr.DataArray]:
+    """Extraterrestrial daily radiation [MJ m-2 d-1] from a lookup table.
+
+    Ra only depends on (doy, lat), so it is precomputed for doy 1-366 on a uniform latitude grid
+    (step is RA_TABLE_LAT_STEP) and linearly interpolated in latitude; the table is cached in memory.
+    The relative error to :func:`extraterrestrial_r` is less than 1e-6 except where Ra is close to 0 (polar night).
+    If doy is not an integer, :func:`extraterrestrial_r` is used directly. Dask-backed DataArrays are calculated lazily,
+    block by block; a chunked doy must have an integer dtype to use the table.
+
+    Parameters
+    ----------
+    doy: day of the year
+    lat: float
+        the site latitude [rad]
+
+    Returns
+    -------
+    Union[np.ndarray, xr.DataArray]
+        extraterrestrial radiation
+    """
+    if _is_chunked(doy) or _is_chunked(lat):
+        # values of a chunked doy are not computed to check them, so only an integer doy (e.g. dt.dayofyear) uses
+        # the table, and only DataArrays could be calculated block by block
+        if not (
+            isinstance(doy, xr.DataArray)
+            and isinstance(lat, xr.DataArray)
+            and np.issubdtype(doy.dtype, np.integer)
+        ):
+            return extraterrestrial_r(doy, lat)
+    else:
+        doy_values = doy.values if isinstance(doy, xr.DataArray) else np.asarray(doy)
+        if not (
+            np.issubdtype(doy_values.dtype, np.number)
+            and np.all(doy_values == np.round(doy_values))
+            and np.all((doy_values >= 1) & (doy_values <= 366))
+        ):
+            return extraterrestrial_r(doy, lat)
+    if isinstance(doy, xr.DataArray) or isinstance(lat, xr.DataArray):
+        return xr.apply_ufunc(
+            _extraterrestrial_r_lookup,
+            doy,
+            lat,
+            dask="parallelized",
+            output_dtypes=[float],
+        )
+    return _extraterrestrial_r_lookup(doy, lat)
+
+
 def relative_distance(
     doy: Union[np.ndarray, xr.DataArray]
 ) -> Union[np.ndarray, xr.DataArray]:
@@ -291,7 +408,7 @@ def calc_rad_long(
         tmp1 = STEFAN_BOLTZMANN_HOUR * (t_mean + 273.16) ** 4
     else:
         if rso is None:
-            ra = extraterrestrial_r(doy=doy, lat=lat)
+            ra = extraterrestrial_r_lut(doy=doy, lat=lat)
             rso = calc_rso(ra=ra, elevation=elevation)
         # The ratio varies between about 0.33 (dense cloud cover) and 1 (clear sky)  Page 42 in [allen_1998]
         # people always clip with [0.3, 1]:
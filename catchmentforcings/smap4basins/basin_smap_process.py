@@ -8,16 +8,43 @@ FilePath: \CatchmentForcings\catchmentforcings\smap4basins\basin_smap_process.py
 Copyright (c) 2021-2022 Wenyu Ouyang. All rights reserved.
 """
 
-import fnmatch
-import os
-import numpy as np
-import pandas as pd
-
-from catchmentforcings.app.app_utils import get_gage_huc_keys
+from catchmentforcings.utils.gee_transformer import (
+    GeeProductSpec,
+    trans_gee_to_camels_format,
+)
+
+# you can add features or delete features, or change the order, which depends on your txt content
+NASA_USDA_SMAP_GEE_SPEC = GeeProductSpec(
+    "nasa_usda_smap",
+    ["NASA_USDA_HSL_SMAP10KM_soil_moisture_{region}_mean_{year}*.csv"],
+    [["ssm", "susm", "smp", "ssma", "susma"]],
+    ["ssm(mm)", "susm(mm)", "smp(-)", "ssma(-)", "susma(-)"],
+    "_lump_nasa_usda_smap.txt",
+    id_col="hru_id",
+    time_col="system:time_start",
+    sep=",",
+    float_format="%.4f",
+)
+SMAP_GEE_SPEC = GeeProductSpec(
+    "smap",
+    ["smap_{region}_meandaily_{year}*.csv"],
+    [["sm_surface_mean", "sm_rootzone_mean"]],
+    ["sm_surface", "sm_rootzone"],
+    "_lump_smap.txt",
+    sep=",",
+    float_format="%.4f",
+)
 
 
 def trans_nasa_usda_smap_to_camels_format(
-    source_dir, output_dir, gage_dict, region, year
+    source_dir,
+    output_dir,
+    gage_dict,
+    region,
+    year,
+    output_format="txt",
+    workers=1,
+    chunksize=None,
 ):
     """
     Transform 3-day SMAP data downloaded from GEE to the format in CAMELS.
@@ -36,110 +63,41 @@ def trans_nasa_usda_smap_to_camels_format(
         For example, if we use the basins' shpfile in CAMELS, the region is "camels".
     year
         we use GEE code to generate data for each year, so each year for each region has one data file.
+        It could also be a list of years.
+    output_format
+        "txt": a text file for each basin; "zarr": a ForcingStore for all basins in output_dir; "both": both of them
+    workers
+        number of processes to read the files of years when year is a list of years
+    chunksize
+        if given, the files are streamed in chunks of so many rows, so that very large files fit in memory
     Returns
     -------
     None
 
     """
-    # you can add features or delete features, or change the order, which depends on your txt content
-    smap_dataset = [
-        "hru_id",
-        "system:time_start",
-        "ssm",
-        "susm",
-        "smp",
-        "ssma",
-        "susma",
-    ]
-    camels_format_index = [
-        "Year",
-        "Mnth",
-        "Day",
-        "Hr",
-        "ssm(mm)",
-        "susm(mm)",
-        "smp(-)",
-        "ssma(-)",
-        "susma(-)",
-    ]
-
-    if "STAID" in gage_dict.keys():
-        gage_id_key = "STAID"
-    elif "gauge_id" in gage_dict.keys():
-        gage_id_key = "gauge_id"
-    elif "gage_id" in gage_dict.keys():
-        gage_id_key = "gage_id"
-    else:
-        raise NotImplementedError("No such gage id name")
-
-    if "HUC02" in gage_dict.keys():
-        huc02_key = "HUC02"
-    elif "huc_02" in gage_dict.keys():
-        huc02_key = "huc_02"
-    else:
-        huc02_key = None
-
-    # because this function only work for one year and one region, it's better to chose avg and sum files at first
-    for f_name in os.listdir(source_dir):
-        if fnmatch.fnmatch(
-            f_name,
-            "NASA_USDA_HSL_SMAP10KM_soil_moisture_"
-            + region
-            + "_mean_"
-            + str(year)
-            + "*.csv",
-        ):
-            smap_data_file = os.path.join(source_dir, f_name)
-
-    data_temp = pd.read_csv(smap_data_file, sep=",", dtype={smap_dataset[0]: str})
-    for i_basin in range(len(gage_dict[gage_id_key])):
-        basin_data = data_temp[
-            data_temp[smap_dataset[0]].values.astype(int)
-            == int(gage_dict[gage_id_key][i_basin])
-        ]
-        if basin_data.shape[0] == 0:
-            raise ArithmeticError("chosen basins' number is zero")
-        # get Year,Month,Day,Hour info
-        csv_date = pd.to_datetime(basin_data[smap_dataset[1]].values)
-        # the hour is set to 12, as 12 is the average hour of a day
-        year_month_day_hour = pd.DataFrame(
-            [[dt.year, dt.month, dt.day, 12] for dt in csv_date],
-            columns=camels_format_index[0:4],
-        )
-        data_df = pd.DataFrame(
-            basin_data.iloc[:, 2:].values, columns=camels_format_index[4:]
-        )
-        # concat
-        new_data_df = pd.concat([year_month_day_hour, data_df], axis=1)
-        # output the result
-        if huc02_key is None:
-            output_huc_dir = output_dir
-        else:
-            huc_id = gage_dict[huc02_key][i_basin]
-            output_huc_dir = os.path.join(output_dir, huc_id)
-        if not os.path.isdir(output_huc_dir):
-            os.makedirs(output_huc_dir)
-        output_file = os.path.join(
-            output_huc_dir,
-            str(gage_dict[gage_id_key][i_basin]) + "_lump_nasa_usda_smap.txt",
-        )
-        print("output SMAP data of", gage_dict[gage_id_key][i_basin], "year", str(year))
-        if os.path.isfile(output_file):
-            data_old = pd.read_csv(output_file)
-            years = np.unique(data_old[camels_format_index[0]].values)
-            if year in years:
-                continue
-            else:
-                os.remove(output_file)
-                new_data_df = pd.concat([data_old, new_data_df]).sort_values(
-                    by=camels_format_index[0:3]
-                )
-        new_data_df.to_csv(
-            output_file, header=True, index=False, sep=",", float_format="%.4f"
-        )
-
-
-def trans_smap_to_camels_format(source_dir, output_dir, gage_dict, region, year):
+    trans_gee_to_camels_format(
+        NASA_USDA_SMAP_GEE_SPEC,
+        source_dir,
+        output_dir,
+        gage_dict,
+        region,
+        year,
+        output_format=output_format,
+        workers=workers,
+        chunksize=chunksize,
+    )
+
+
+def trans_smap_to_camels_format(
+    source_dir,
+    output_dir,
+    gage_dict,
+    region,
+    year,
+    output_format="txt",
+    workers=1,
+    chunksize=None,
+):
     """
     Transform SMAP data downloaded from GEE to the format in CAMELS.
 
@@ -156,79 +114,26 @@ def trans_smap_to_camels_format(source_dir, output_dir, gage_dict, region, year)
         For example, if we use the basins' shpfile in CAMELS, the region is "camels".
     year
         we use GEE code to generate data for each year, so each year for each region has one data file.
+        It could also be a list of years.
+    output_format
+        "txt": a text file for each basin; "zarr": a ForcingStore for all basins in output_dir; "both": both of them
+    workers
+        number of processes to read the files of years when year is a list of years
+    chunksize
+        if given, the files are streamed in chunks of so many rows, so that very large files fit in memory
     Returns
     -------
     None
 
     """
-    # you can add features or delete features, or change the order, which depends on your txt content
-    smap_dataset = [
-        "gage_id",
-        "time_start",
-        "sm_surface_mean",
-        "sm_rootzone_mean",
-    ]
-    camels_format_index = [
-        "Year",
-        "Mnth",
-        "Day",
-        "Hr",
-        "sm_surface",
-        "sm_rootzone",
-    ]
-
-    gage_id_key, huc02_key = get_gage_huc_keys(gage_dict)
-
-    # because this function only work for one year and one region, it's better to chose avg and sum files at first
-    for f_name in os.listdir(source_dir):
-        if fnmatch.fnmatch(
-            f_name,
-            "smap_" + region + "_meandaily_" + str(year) + "*.csv",
-        ):
-            smap_data_file = os.path.join(source_dir, f_name)
-
-    data_temp = pd.read_csv(smap_data_file, sep=",", dtype={smap_dataset[0]: str})
-    for i_basin in range(len(gage_dict[gage_id_key])):
-        basin_data = data_temp[
-            data_temp[smap_dataset[0]].values.astype(int)
-            == int(gage_dict[gage_id_key][i_basin])
-        ]
-        if basin_data.shape[0] == 0:
-            raise ArithmeticError("chosen basins' number is zero")
-        # get Year,Month,Day,Hour info
-        csv_date = pd.to_datetime(basin_data[smap_dataset[1]].values)
-        # the hour is set to 12, as 12 is the average hour of a day
-        year_month_day_hour = pd.DataFrame(
-            [[dt.year, dt.month, dt.day, 12] for dt in csv_date],
-            columns=camels_format_index[:4],
-        )
-        data_df = pd.DataFrame(
-            basin_data.iloc[:, 2:].values, columns=camels_format_index[4:]
-        )
-        # concat
-        new_data_df = pd.concat([year_month_day_hour, data_df], axis=1)
-        # output the result
-        if huc02_key is None:
-            output_huc_dir = output_dir
-        else:
-            huc_id = gage_dict[huc02_key][i_basin]
-            output_huc_dir = os.path.join(output_dir, huc_id)
-        if not os.path.isdir(output_huc_dir):
-            os.makedirs(output_huc_dir)
-        output_file = os.path.join(
-            output_huc_dir,
-            f"{str(gage_dict[gage_id_key][i_basin])}_lump_smap.txt",
-        )
-        print("output SMAP data of", gage_dict[gage_id_key][i_basin], "year", year)
-        if os.path.isfile(output_file):
-            data_old = pd.read_csv(output_file)
-            years = np.unique(data_old[camels_format_index[0]].values)
-            if year in years:
-                continue
-            os.remove(output_file)
-            new_data_df = pd.concat([data_old, new_data_df]).sort_values(
-                by=camels_format_index[:3]
-            )
-        new_data_df.to_csv(
-            output_file, header=True, index=False, sep=",", float_format="%.4f"
-        )
+    trans_gee_to_camels_format(
+        SMAP_GEE_SPEC,
+        source_dir,
+        output_dir,
+        gage_dict,
+        region,
+        year,
+        output_format=output_format,
+        workers=workers,
+        chunksize=chunksize,
+    )
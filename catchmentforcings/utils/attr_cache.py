@@ -0,0 +1,127 @@
+"""
+A binary cache of a pre-parsed attribute matrix
+
+Attributes of all sites (e.g. the conterm_*.txt files of GAGES-II) are parsed once to a matrix, in which str
+attributes are factorized over all sites, and saved in an npz file with the modification times of the source files.
+If any source file is changed, the cache is stale and should be rebuilt.
+"""
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def source_mtimes(source_files: Sequence[str]) -> Dict[str, float]:
+    """modification times of files, which decide whether a cache is stale"""
+    return {
+        os.path.basename(the_file): os.path.getmtime(the_file)
+        for the_file in source_files
+    }
+
+
+class AttrMatrix:
+    """attributes of all sites; rows are sites and columns are attributes"""
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        data: np.ndarray,
+        var_lst: List[str],
+        var_dict: Dict[str, List[str]],
+        f_dict: Dict[str, list],
+    ):
+        """
+        Parameters
+        ----------
+        ids
+            ids of all sites
+        data
+            the matrix; a str attribute has codes of its values in f_dict, and -1 for missing values
+        var_lst
+            names of all attributes
+        var_dict
+            names of attributes in each source file
+        f_dict
+            the sorted values of each str attribute over all sites
+        """
+        self.ids = np.asarray(ids, dtype=str)
+        self.data = data
+        self.var_lst = list(var_lst)
+        self.var_dict = var_dict
+        self.f_dict = f_dict
+
+    def select(
+        self, rows: np.ndarray, var_lst: Optional[List[str]] = None
+    ) -> Tuple[np.ndarray, Dict[str, list]]:
+        """
+        Attributes of some sites; str attributes are factorized again over these sites, as pd.factorize does
+
+        Parameters
+        ----------
+        rows
+            rows of the sites
+        var_lst
+            names of attributes; all attributes by default
+
+        Returns
+        -------
+        Tuple[np.ndarray, Dict[str, list]]
+            the matrix of the sites and the factorization dict of the chosen str attributes
+        """
+        if var_lst is None:
+            var_lst = self.var_lst
+        cols = [self.var_lst.index(var) for var in var_lst]
+        out = self.data[np.ix_(rows, cols)]
+        f_dict = {}
+        for k, var in enumerate(var_lst):
+            if var not in self.f_dict:
+                continue
+            codes = out[:, k].astype(int)
+            used = np.unique(codes[codes >= 0])
+            # categories are sorted, so the order of used codes is the order of used values
+            out[:, k] = np.where(codes >= 0, np.searchsorted(used, codes), -1)
+            f_dict[var] = [self.f_dict[var][i] for i in used]
+        return out, f_dict
+
+    def save(self, cache_file: str, source_files: Sequence[str]) -> None:
+        """save the matrix with the modification times of its source files"""
+        meta = {
+            "var_dict": self.var_dict,
+            "f_dict": self.f_dict,
+            "mtimes": source_mtimes(source_files),
+        }
+        tmp_file = cache_file + ".tmp" + str(os.getpid())
+        try:
+            with open(tmp_file, "wb") as f:
+                np.savez(
+                    f,
+                    ids=self.ids,
+                    data=self.data,
+                    var_lst=np.asarray(self.var_lst, dtype=str),
+                    meta=np.asarray(json.dumps(meta)),
+                )
+            os.replace(tmp_file, cache_file)
+        finally:
+            # a partly written file is not left behind
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+    @classmethod
+    def load(
+        cls, cache_file: str, source_files: Sequence[str]
+    ) -> Optional["AttrMatrix"]:
+        """the cached matrix; None if there is no cache or any source file has been changed since it was saved"""
+        if not os.path.isfile(cache_file):
+            return None
+        with np.load(cache_file) as npz:
+            meta = json.loads(str(npz["meta"]))
+            if meta["mtimes"] != source_mtimes(source_files):
+                return None
+            return cls(
+                npz["ids"],
+                npz["data"],
+                npz["var_lst"].tolist(),
+                meta["var_dict"],
+                meta["f_dict"],
+            )
@@ -0,0 +1,340 @@
+"""
+Sparse basin-weight matrices for calculating basin mean values of gridded data
+
+Each basin polygon is rasterized only once for a grid definition (transform + shape), and the fractional
+coverage of every grid cell is kept in one row of a CSR matrix. With this matrix, the basin mean values of all
+basins and all time steps are obtained by a single sparse x dense matrix multiplication.
+"""
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pygeoutils as geoutils
+import rasterio.features as rio_features
+import scipy.sparse as sp
+import xarray as xr
+from affine import Affine
+from shapely.geometry import MultiPolygon, Polygon
+
+from catchmentforcings.utils.mask_cache import MaskCache, get_mask_cache, mask_key
+
+DEF_CRS = "epsg:4326"
+
+
+def cell_coverage_fraction(
+    geometry: Union[Polygon, MultiPolygon],
+    transform: Affine,
+    shape: Tuple[int, int],
+    supersample: int = 10,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the fraction of each grid cell covered by a geometry
+
+    Only the window of the grid around the geometry's bounds is rasterized, and each cell in the window is
+    split to supersample * supersample sub-cells to estimate its covered fraction.
+
+    Parameters
+    ----------
+    geometry
+        the geometry of a basin; it must be in the same CRS as the grid
+    transform
+        the affine transform of the grid
+    shape
+        (height, width) of the grid
+    supersample
+        the number of sub-cells in each direction of a cell;
+        if it is 1, a cell is fully weighted when its center is in the geometry
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        flat indices (row * width + col) of cells covered by the geometry and their covered fractions
+    """
+    height, width = shape
+    left, bottom, right, top = geometry.bounds
+    inv = ~transform
+    cols, rows = inv * (
+        np.array([left, left, right, right]),
+        np.array([bottom, top, bottom, top]),
+    )
+    col_min = max(int(np.floor(cols.min())), 0)
+    col_max = min(int(np.ceil(cols.max())), width)
+    row_min = max(int(np.floor(rows.min())), 0)
+    row_max = min(int(np.ceil(rows.max())), height)
+    if col_min >= col_max or row_min >= row_max:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+    win_height = row_max - row_min
+    win_width = col_max - col_min
+    # the transform of the window, then scale it to the sub-cells
+    win_transform = transform * Affine.translation(col_min, row_min)
+    fine_transform = win_transform * Affine.scale(1.0 / supersample)
+    fine = rio_features.rasterize(
+        [(geometry, 1)],
+        out_shape=(win_height * supersample, win_width * supersample),
+        transform=fine_transform,
+        fill=0,
+        dtype="uint8",
+    )
+    fraction = fine.reshape(win_height, supersample, win_width, supersample).sum(
+        axis=(1, 3)
+    ) / float(supersample**2)
+    win_rows, win_cols = np.nonzero(fraction)
+    flat_idx = (win_rows + row_min).astype(np.int64) * width + (win_cols + col_min)
+    return flat_idx, fraction[win_rows, win_cols]
+
+
+def cached_cell_coverage_fraction(
+    geometry: Union[Polygon, MultiPolygon],
+    transform: Affine,
+    shape: Tuple[int, int],
+    supersample: int = 10,
+    cache: Optional[MaskCache] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Same as :func:`cell_coverage_fraction`, but the result is kept in the mask cache
+
+    Parameters
+    ----------
+    cache
+        the cache; if None, use the default one
+    """
+    if cache is None:
+        cache = get_mask_cache()
+    key = mask_key(geometry, transform, shape, coverage_supersample=supersample)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached["idx"], cached["frac"]
+    idx, frac = cell_coverage_fraction(geometry, transform, shape, supersample)
+    cache.put(key, {"idx": idx, "frac": frac})
+    return idx, frac
+
+
+class BasinWeights:
+    """
+    Sparse weight matrix of basins for a grid
+
+    Rows are basins and columns are the flattened (y, x) cells of the grid.
+    """
+
+    def __init__(
+        self,
+        matrix: sp.csr_matrix,
+        basin_ids: Sequence,
+        shape: Tuple[int, int],
+        transform: Affine,
+        crs: Optional[str] = None,
+    ):
+        self.matrix = matrix.tocsr()
+        self.basin_ids = list(basin_ids)
+        self.shape = tuple(shape)
+        self.transform = transform
+        self.crs = crs
+
+    @classmethod
+    def from_geometries(
+        cls,
+        geometries: List[Union[Polygon, MultiPolygon]],
+        transform: Affine,
+        shape: Tuple[int, int],
+        basin_ids: Optional[Sequence] = None,
+        crs: Optional[str] = None,
+        supersample: int = 10,
+        cache: Optional[MaskCache] = None,
+    ) -> "BasinWeights":
+        """
+        Rasterize all geometries (already in the grid's CRS) to a weight matrix
+
+        The coverage of each geometry is kept in the mask cache, so a basin is not rasterized again on the same grid
+
+        Parameters
+        ----------
+        geometries
+            geometries of basins in the CRS of the grid
+        transform
+            the affine transform of the grid
+        shape
+            (height, width) of the grid
+        basin_ids
+            ids of basins; default is 0, 1, 2, ...
+        crs
+            the CRS of the grid, just recorded for reference
+        supersample
+            see :func:`cell_coverage_fraction`
+        cache
+            the mask cache; if None, use the default one
+
+        Returns
+        -------
+        BasinWeights
+            the weights of all basins
+        """
+        if basin_ids is None:
+            basin_ids = list(range(len(geometries)))
+        assert len(basin_ids) == len(geometries)
+        indptr = [0]
+        indices = []
+        data = []
+        for geometry in geometries:
+            idx, frac = cached_cell_coverage_fraction(
+                geometry, transform, shape, supersample, cache
+            )
+            indices.append(idx)
+            data.append(frac)
+            indptr.append(indptr[-1] + idx.size)
+        matrix = sp.csr_matrix(
+            (
+                np.concatenate(data) if data else np.array([]),
+                np.concatenate(indices) if indices else np.array([], dtype=np.int64),
+                np.array(indptr),
+            ),
+            shape=(len(geometries), shape[0] * shape[1]),
+        )
+        return cls(matrix, basin_ids, shape, transform, crs)
+
+    @classmethod
+    def from_dataset(
+        cls,
+        ds: Union[xr.Dataset, xr.DataArray],
+        geometries: List[Union[Polygon, MultiPolygon]],
+        basin_ids: Optional[Sequence] = None,
+        geo_crs: str = DEF_CRS,
+        ds_crs: Optional[str] = None,
+        ds_dims: Tuple[str, str] = ("y", "x"),
+        supersample: int = 10,
+        cache: Optional[MaskCache] = None,
+    ) -> "BasinWeights":
+        """
+        Build the weights of geometries for the grid of a dataset
+
+        Parameters
+        ----------
+        ds
+            the gridded dataset
+        geometries
+            geometries of basins
+        basin_ids
+            ids of basins
+        geo_crs
+            the CRS of the geometries, defaults to epsg:4326.
+        ds_crs
+            the CRS of the dataset; if None, we use ds.crs
+        ds_dims
+            the names of the (y, x) dimensions
+        supersample
+            see :func:`cell_coverage_fraction`
+        cache
+            the mask cache; if None, use the default one
+
+        Returns
+        -------
+        BasinWeights
+            the weights of all basins
+        """
+        if ds_crs is None:
+            ds_crs = ds.crs
+        transform, width, height = geoutils.pygeoutils._get_transform(ds, ds_dims)
+        _geometries = [
+            geoutils.pygeoutils._geo2polygon(geometry, geo_crs, ds_crs)
+            for geometry in geometries
+        ]
+        return cls.from_geometries(
+            _geometries,
+            transform,
+            (height, width),
+            basin_ids=basin_ids,
+            crs=ds_crs,
+            supersample=supersample,
+            cache=cache,
+        )
+
+    @property
+    def n_basin(self) -> int:
+        return self.matrix.shape[0]
+
+    def fit_grid(
+        self,
+        ds: Union[xr.Dataset, xr.DataArray],
+        ds_dims: Tuple[str, str] = ("y", "x"),
+    ) -> bool:
+        """
+        Check if the weights are built for the grid of a dataset, so that they can be reused for it
+
+        Parameters
+        ----------
+        ds
+            the gridded dataset
+        ds_dims
+            the names of the (y, x) dimensions
+
+        Returns
+        -------
+        bool
+            True if the transform and shape of the grid are same as the weights'
+        """
+        transform, width, height = geoutils.pygeoutils._get_transform(ds, ds_dims)
+        return (height, width) == self.shape and transform.almost_equals(self.transform)
+
+    def mean(self, values: np.ndarray) -> np.ndarray:
+        """
+        Weighted basin mean values of a gridded array; NaN cells are ignored
+
+        Parameters
+        ----------
+        values
+            an array whose last two dimensions are (y, x) of the grid
+
+        Returns
+        -------
+        np.ndarray
+            basin mean values; the first dimension is basin and the others are the leading dimensions of values
+        """
+        values = np.asarray(values)
+        assert values.shape[-2:] == self.shape
+        lead_shape = values.shape[:-2]
+        flat = values.reshape(-1, self.shape[0] * self.shape[1])
+        valid = ~np.isnan(flat)
+        filled = np.where(valid, flat, 0.0)
+        # (n_basin, n_cell) @ (n_cell, n_lead)
+        num = self.matrix @ filled.T
+        den = self.matrix @ valid.T.astype(filled.dtype)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = num / den
+        out[den == 0] = np.nan
+        return out.reshape((self.n_basin,) + lead_shape)
+
+    def mean_dataset(
+        self,
+        ds: xr.Dataset,
+        ds_dims: Tuple[str, str] = ("y", "x"),
+        basin_dim: str = "basin",
+    ) -> xr.Dataset:
+        """
+        Weighted basin mean values of all variables on the grid in a dataset
+
+        Parameters
+        ----------
+        ds
+            the gridded dataset
+        ds_dims
+            the names of the (y, x) dimensions
+        basin_dim
+            the name of the basin dimension in the returned dataset
+
+        Returns
+        -------
+        xr.Dataset
+            basin mean values; variables without (y, x) dimensions are dropped
+        """
+        out = xr.Dataset(coords={basin_dim: self.basin_ids})
+        for k in ds.data_vars:
+            da = ds[k]
+            if not set(ds_dims).issubset(da.dims):
+                continue
+            lead_dims = [d for d in da.dims if d not in ds_dims]
+            da = da.transpose(*lead_dims, *ds_dims)
+            out[k] = xr.DataArray(
+                self.mean(da.values),
+                coords={basin_dim: self.basin_ids, **{d: da[d] for d in lead_dims}},
+                dims=[basin_dim] + lead_dims,
+                attrs=da.attrs,
+            )
+        return out
@@ -0,0 +1,145 @@
+"""
+A columnar cache of parsed streamflow
+
+The daily streamflow of all gages (e.g. the NWIS RDB files of GAGES-II) is parsed once to a float32 array with dims
+(gage, day) and an int16 array of the codes of their qualifiers (e.g. "A" or "P"; -1 for days without data), and
+both are saved in an npz file with the modification times of the source files, see
+:func:`catchmentforcings.utils.attr_cache.source_mtimes`. If any source file is changed, the cache is stale.
+"""
+import json
+import os
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from catchmentforcings.utils.attr_cache import source_mtimes
+
+FLOW_DTYPE = "float32"
+QUALIFIER_DTYPE = "int16"
+# "Ice": ice affected, "Ssn": parameter monitored seasonally, "Tst": value affected by a test, "Eqp": equipment
+# malfunction, "Rat": rating being developed, "Dis": data-collection discontinued, "Bkw": affected by backwater,
+# "***": temporarily unavailable, "Mnt": maintenance, "ZFL": zero flow
+USGS_FLOW_QUALIFIERS = (
+    "Ice",
+    "Ssn",
+    "Tst",
+    "Eqp",
+    "Rat",
+    "Dis",
+    "Bkw",
+    "***",
+    "Mnt",
+    "ZFL",
+)
+
+
+def mask_flow_qualifiers(
+    df_flow: pd.DataFrame,
+    columns: Union[str, List[str]],
+    qualifiers: Sequence[str] = USGS_FLOW_QUALIFIERS,
+) -> None:
+    """set values of columns which are qualifiers (e.g. "Ice") to NaN in place"""
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    df_flow[columns] = df_flow[columns].mask(df_flow[columns].isin(qualifiers))
+
+
+def best_flow_column(
+    df_flow: pd.DataFrame, t_lst: np.ndarray, columns_flow: List[str]
+) -> int:
+    """the index of the flow column with the most values at days t_lst; the first one if there is a tie"""
+    date = pd.to_datetime(df_flow["datetime"]).values.astype("datetime64[D]")
+    in_t_lst = np.isin(date, np.asarray(t_lst, dtype="datetime64[D]"))
+    num_values = df_flow.loc[in_t_lst, columns_flow].notna().sum().values
+    return int(np.argmax(num_values))
+
+
+class FlowCache:
+    """streamflow of gages at days, with codes of their qualifiers"""
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        time: np.ndarray,
+        flow: np.ndarray,
+        qualifier_codes: np.ndarray,
+        qualifiers: List[str],
+    ):
+        """
+        Parameters
+        ----------
+        ids
+            ids of gages
+        time
+            the days
+        flow
+            streamflow with dims (gage, day)
+        qualifier_codes
+            codes of qualifiers with dims (gage, day); -1 if a day has no qualifier
+        qualifiers
+            the qualifier of each code
+        """
+        self.ids = pd.Index(np.asarray(ids, dtype=str))
+        self.time = pd.DatetimeIndex(np.asarray(time, dtype="datetime64[D]"))
+        self.flow = flow
+        self.qualifier_codes = qualifier_codes
+        self.qualifiers = list(qualifiers)
+
+    def covers(self, ids: Sequence[str], t_lst: np.ndarray) -> bool:
+        """whether all gages and days are in the cache"""
+        return bool(
+            (self.ids.get_indexer(np.asarray(ids, dtype=str)) >= 0).all()
+            and (self.time.get_indexer(pd.to_datetime(t_lst)) >= 0).all()
+        )
+
+    def read(
+        self, ids: Sequence[str], t_lst: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Streamflow and qualifier codes of gages at days; see :meth:`covers`
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            streamflow and qualifier codes, both with dims (gage, day)
+        """
+        rows = self.ids.get_indexer(np.asarray(ids, dtype=str))
+        cols = self.time.get_indexer(pd.to_datetime(t_lst))
+        if (rows < 0).any() or (cols < 0).any():
+            raise KeyError("Some gages or days are not in the flow cache")
+        the_ix = np.ix_(rows, cols)
+        return self.flow[the_ix], self.qualifier_codes[the_ix]
+
+    def save(self, cache_file: str, source_files: Sequence[str]) -> None:
+        """save the cache with the modification times of its source files"""
+        meta = {"qualifiers": self.qualifiers, "mtimes": source_mtimes(source_files)}
+        tmp_file = cache_file + ".tmp" + str(os.getpid())
+        with open(tmp_file, "wb") as f:
+            np.savez(
+                f,
+                ids=self.ids.values.astype(str),
+                time=self.time.values.astype("datetime64[D]"),
+                flow=self.flow,
+                qualifier_codes=self.qualifier_codes,
+                meta=np.asarray(json.dumps(meta)),
+            )
+        os.replace(tmp_file, cache_file)
+
+    @classmethod
+    def load(
+        cls, cache_file: str, source_files: Sequence[str]
+    ) -> Optional["FlowCache"]:
+        """the cache; None if there is no cache or any source file has been changed since it was saved"""
+        if not os.path.isfile(cache_file):
+            return None
+        with np.load(cache_file) as npz:
+            meta = json.loads(str(npz["meta"]))
+            if meta["mtimes"] != source_mtimes(source_files):
+                return None
+            return cls(
+                npz["ids"],
+                npz["time"],
+                npz["flow"],
+                npz["qualifier_codes"],
+                meta["qualifiers"],
+            )
@@ -0,0 +1,268 @@
+"""
+A memory-mapped cube of basin mean forcings
+
+The forcings of all basins are materialized once to a dense .npy array with dims (basin, time, variable), and its
+indices are saved in sidecars: "time.npy" for the days, "index.json" for the basin ids and variable names.
+Reading the cube maps the file into memory, so a call only touches the needed pages, and processes reading the same
+cube share its pages in the OS cache; when basins, days and variables are consecutive, a read is a view of the file.
+"""
+import json
+import os
+import shutil
+from typing import Callable, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from catchmentforcings.utils.forcing_store import (
+    BASIN_CHUNK,
+    FORCING_DTYPE,
+    ForcingStore,
+    _as_slice,
+)
+
+CUBE_DATA_FILE = "data.npy"
+CUBE_TIME_FILE = "time.npy"
+CUBE_INDEX_FILE = "index.json"
+
+
+def latest_mtime(paths: Sequence[str]) -> float:
+    """
+    The latest modification time of files; a directory is a ForcingStore, so only the time of its last write is
+    checked (see :meth:`ForcingStore.mtime`) rather than all its chunk files
+    """
+    mtimes = [
+        ForcingStore(path).mtime() if os.path.isdir(path) else os.path.getmtime(path)
+        for path in paths
+    ]
+    return max(mtimes, default=0.0)
+
+
+def forcing_cube_path(store_path: str) -> str:
+    """the cube built from a ForcingStore "<name>.zarr" is "<name>.cube" beside it"""
+    return os.path.splitext(store_path)[0] + ".cube"
+
+
+class ForcingCube:
+    """Basin mean forcings saved in a memory-mapped .npy array with dims (basin, time, variable)"""
+
+    def __init__(self, cube_path: str):
+        self.cube_path = cube_path
+        self._data = None
+        self._basins = None
+        self._time = None
+        self._variables = None
+        # sources which the cube has been found newer than
+        self._fresh_sources = set()
+
+    def exists(self) -> bool:
+        return os.path.isfile(os.path.join(self.cube_path, CUBE_INDEX_FILE))
+
+    def _open(self) -> None:
+        if self._data is not None:
+            return
+        with open(os.path.join(self.cube_path, CUBE_INDEX_FILE)) as f:
+            index = json.load(f)
+        self._basins = pd.Index(index["basins"])
+        self._variables = pd.Index(index["variables"])
+        self._time = pd.DatetimeIndex(
+            np.load(os.path.join(self.cube_path, CUBE_TIME_FILE))
+        )
+        self._data = np.load(
+            os.path.join(self.cube_path, CUBE_DATA_FILE), mmap_mode="r"
+        )
+
+    @property
+    def data(self) -> np.memmap:
+        """the read-only memory-mapped array with dims (basin, time, variable)"""
+        self._open()
+        return self._data
+
+    @property
+    def basins(self) -> np.ndarray:
+        self._open()
+        return self._basins.values
+
+    @property
+    def time(self) -> np.ndarray:
+        self._open()
+        return self._time.values
+
+    @property
+    def variables(self) -> List[str]:
+        self._open()
+        return self._variables.tolist()
+
+    def covers(
+        self,
+        basin_ids: Union[list, np.ndarray],
+        t_range_list: np.ndarray,
+        var_lst: List[str],
+    ) -> bool:
+        """whether all basins, days and variables are in the cube"""
+        self._open()
+        return bool(
+            (self._basins.get_indexer(np.asarray(basin_ids, dtype=str)) >= 0).all()
+            and (self._time.get_indexer(pd.to_datetime(t_range_list)) >= 0).all()
+            and (self._variables.get_indexer(var_lst) >= 0).all()
+        )
+
+    def is_newer_than(self, source_paths: Sequence[str]) -> bool:
+        """
+        Whether the cube was built after the last change of its sources (see :func:`latest_mtime`)
+
+        Once the cube is found newer than some sources, they are not checked again by this instance, so repeated
+        reads cost nothing; use a new instance to check sources changed after that.
+        """
+        key = tuple(source_paths)
+        if key in self._fresh_sources:
+            return True
+        built = os.path.getmtime(os.path.join(self.cube_path, CUBE_INDEX_FILE))
+        if built <= latest_mtime(source_paths):
+            return False
+        self._fresh_sources.add(key)
+        return True
+
+    def can_read(
+        self,
+        basin_ids: Union[list, np.ndarray],
+        t_range_list: np.ndarray,
+        var_lst: List[str],
+        source_paths: Sequence[str],
+    ) -> bool:
+        """whether the cube exists, covers the request and is newer than its sources, so it could be read instead"""
+        return (
+            self.exists()
+            and self.covers(basin_ids, t_range_list, var_lst)
+            and self.is_newer_than(source_paths)
+        )
+
+    def build(
+        self,
+        basin_ids: Sequence[str],
+        t_range_list: np.ndarray,
+        var_lst: List[str],
+        read_basins: Callable[[List[str]], np.ndarray],
+        dtype: str = FORCING_DTYPE,
+        basin_chunk: int = BASIN_CHUNK,
+    ) -> None:
+        """
+        Materialize the cube; basins are read and written in chunks, so the whole cube never has to be in memory
+
+        Parameters
+        ----------
+        basin_ids
+            ids of basins
+        t_range_list
+            the days of the cube
+        var_lst
+            names of variables
+        read_basins
+            a function which reads some basins and returns their data with dims (basin, time, variable)
+        dtype
+            data type of the cube
+        basin_chunk
+            number of basins read in each call of read_basins
+        """
+        basin_ids = [str(basin_id) for basin_id in basin_ids]
+        t_range_list = np.asarray(t_range_list, dtype="datetime64[D]")
+        # write to a temporary directory and then replace the old one, so a failure never leaves a broken cube
+        tmp_path = self.cube_path + ".tmp" + str(os.getpid())
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        data = np.lib.format.open_memmap(
+            os.path.join(tmp_path, CUBE_DATA_FILE),
+            mode="w+",
+            dtype=dtype,
+            shape=(len(basin_ids), t_range_list.size, len(var_lst)),
+        )
+        for start in range(0, len(basin_ids), basin_chunk):
+            end = min(start + basin_chunk, len(basin_ids))
+            data[start:end] = read_basins(basin_ids[start:end])
+        data.flush()
+        del data
+        np.save(os.path.join(tmp_path, CUBE_TIME_FILE), t_range_list)
+        # the index is written at last, as it marks a complete cube
+        with open(os.path.join(tmp_path, CUBE_INDEX_FILE), "w") as f:
+            json.dump({"basins": basin_ids, "variables": list(var_lst)}, f)
+        if os.path.isdir(self.cube_path):
+            old_path = self.cube_path + ".old" + str(os.getpid())
+            os.replace(self.cube_path, old_path)
+            os.replace(tmp_path, self.cube_path)
+            shutil.rmtree(old_path)
+        else:
+            os.replace(tmp_path, self.cube_path)
+        self._data = None
+        self._fresh_sources.clear()
+
+    def build_from_store(
+        self,
+        store: ForcingStore,
+        t_range_list: Optional[np.ndarray] = None,
+        var_lst: Optional[List[str]] = None,
+        dtype: str = FORCING_DTYPE,
+    ) -> None:
+        """materialize all basins of a ForcingStore; all its days and variables are used by default"""
+        with store.open() as ds:
+            basin_ids = ds["basin"].values.tolist()
+            if t_range_list is None:
+                t_range_list = ds["time"].values
+            if var_lst is None:
+                var_lst = list(ds.data_vars)
+        self.build(
+            basin_ids,
+            t_range_list,
+            var_lst,
+            lambda some_ids: store.read(some_ids, t_range_list, var_lst, dtype=dtype),
+            dtype=dtype,
+        )
+
+    def read(
+        self,
+        basin_ids: Union[list, np.ndarray],
+        t_range_list: np.ndarray,
+        var_lst: List[str],
+        dtype: str = FORCING_DTYPE,
+    ) -> np.ndarray:
+        """
+        Read some variables of basins at given days
+
+        The arguments and output are same as those of :meth:`ForcingStore.read`. If the basins, days and variables
+        are consecutive in the cube, all days are in it and dtype is that of the cube, the output is a read-only view
+        of the memory-mapped file, so copy it before changing it; otherwise the output is a new array.
+        """
+        self._open()
+        basin_ind = self._basins.get_indexer(np.asarray(basin_ids, dtype=str))
+        if (basin_ind < 0).any():
+            raise KeyError(
+                "No such basins in the cube: "
+                + str(np.asarray(basin_ids)[basin_ind < 0].tolist())
+            )
+        var_ind = self._variables.get_indexer(var_lst)
+        if (var_ind < 0).any():
+            raise KeyError(
+                "No such variables in the cube: "
+                + str(np.asarray(var_lst)[var_ind < 0].tolist())
+            )
+        time_ind = self._time.get_indexer(pd.to_datetime(t_range_list))
+        basin_sel = _as_slice(basin_ind)
+        var_sel = _as_slice(var_ind)
+        time_ok = np.flatnonzero(time_ind >= 0)
+        time_sel = _as_slice(time_ind[time_ok])
+        if (
+            time_ok.size == time_ind.size
+            and np.dtype(dtype) == self._data.dtype
+            and all(isinstance(sel, slice) for sel in (basin_sel, time_sel, var_sel))
+        ):
+            return self._data[basin_sel, time_sel, var_sel]
+        out = np.full(
+            [len(basin_ids), len(t_range_list), len(var_lst)], np.nan, dtype=dtype
+        )
+        if time_ok.size == 0:
+            return out
+        # a memmap only reads the rows of the selected basins; other axes are then indexed in memory
+        out[:, _as_slice(time_ok), :] = self._data[basin_sel][:, time_sel][
+            :, :, var_sel
+        ]
+        return out
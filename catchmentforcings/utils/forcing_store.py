@@ -0,0 +1,435 @@
+"""
+A columnar store of basin mean forcings
+
+All basins of a product are saved in one Zarr store with dims (basin, time); each variable is an array, so reading
+some variables of many basins in a period is a slice instead of parsing one text file for each basin.
+The text files in the format of CAMELS could still be exported from (or imported to) the store.
+"""
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from catchmentforcings.utils.hydro_utils import year_month_day_hour
+
+CAMELS_TIME_COLS = ["Year", "Mnth", "Day", "Hr"]
+# output formats of transformers: text files in the format of CAMELS, a ForcingStore, or both
+OUTPUT_FORMATS = ("txt", "zarr", "both")
+# forcings are saved and read as float32 by default, which halves the memory of (basin, time, variable) arrays;
+# "float64" could be given to readers when the full precision is needed
+FORCING_DTYPE = "float32"
+# a chunk has 64 basins and about 10 years
+BASIN_CHUNK = 64
+TIME_CHUNK = 3660
+# the root metadata of a Zarr store (v3, or consolidated v2)
+ZARR_METADATA_FILES = ("zarr.json", ".zmetadata", ".zgroup")
+
+
+def split_camels_col(col: str) -> Tuple[str, str]:
+    """split a column name in CAMELS format such as "prcp(mm/day)" to its variable name and units"""
+    if col.endswith(")") and "(" in col:
+        name, units = col[:-1].split("(", 1)
+        return name, units
+    return col, ""
+
+
+def join_camels_col(name: str, units: str) -> str:
+    """the inverse of :func:`split_camels_col`"""
+    return f"{name}({units})" if units else name
+
+
+def forcing_store_path(data_dir: str, file_suffix: str) -> str:
+    """
+    The store of basins' text files "<data_dir>/<huc02>/<basin_id><file_suffix>" is "<data_dir>/<name>.zarr"
+
+    For example, the store of files "*_lump_daymet_forcing.txt" is "lump_daymet_forcing.zarr"
+    """
+    name = os.path.splitext(file_suffix)[0].strip("_")
+    return os.path.join(data_dir, name + ".zarr")
+
+
+def _as_slice(ind: np.ndarray) -> Union[slice, np.ndarray]:
+    """the slice of consecutive indices, or the indices themselves"""
+    if ind.size > 0 and ind[-1] - ind[0] == ind.size - 1 and (np.diff(ind) == 1).all():
+        return slice(int(ind[0]), int(ind[-1]) + 1)
+    return ind
+
+
+class ForcingStore:
+    """Basin mean forcings saved in a Zarr store with dims (basin, time)"""
+
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.store_path)
+
+    def open(self) -> xr.Dataset:
+        """open the store lazily; without dask, indexing only reads the needed chunks"""
+        return xr.open_zarr(self.store_path, chunks=None)
+
+    def _metadata_file(self) -> str:
+        for name in ZARR_METADATA_FILES:
+            the_file = os.path.join(self.store_path, name)
+            if os.path.isfile(the_file):
+                return the_file
+        return self.store_path
+
+    def mtime(self) -> float:
+        """
+        The time of the last write; in-place writes only change chunk files, so each write touches the root metadata
+        """
+        return os.path.getmtime(self._metadata_file())
+
+    @property
+    def basins(self) -> np.ndarray:
+        with self.open() as ds:
+            return ds["basin"].values
+
+    @property
+    def variables(self) -> List[str]:
+        with self.open() as ds:
+            return list(ds.data_vars)
+
+    def write(self, ds: xr.Dataset) -> None:
+        """
+        Write a dataset with dims (basin, time) to the store
+
+        When the store has all basins and the same variables, new times are appended and existing times are
+        overwritten in place; basins not in the dataset are NaN at new times and keep their values at existing times.
+        Otherwise (e.g. there are new basins), the data are merged with the store (the new values have priority) and
+        the whole store is rewritten.
+        """
+        self._write(ds)
+        # mark the change of the store for readers of its mtime (e.g. a ForcingCube built from it)
+        os.utime(self._metadata_file())
+
+    def _write(self, ds: xr.Dataset) -> None:
+        ds = ds.transpose("basin", "time")
+        if not self.exists():
+            self._write_new(ds)
+            return
+        with xr.open_zarr(self.store_path) as old:
+            known_basins = ds.indexes["basin"].isin(old.indexes["basin"]).all()
+            same_vars = set(old.data_vars) == set(ds.data_vars)
+            if known_basins and same_vars and self._write_in_place(ds, old):
+                return
+            merged = ds.combine_first(old).load()
+            # combine_first drops coordinates which differ, so merge huc02 ids by basin
+            huc02 = pd.Series(dtype=object)
+            for a_ds in (ds, old):
+                if "huc02" in a_ds.coords:
+                    huc02 = huc02.combine_first(
+                        pd.Series(a_ds["huc02"].values, index=a_ds["basin"].values)
+                    )
+            if huc02.size > 0:
+                huc02 = huc02.reindex(merged["basin"].values).fillna("")
+                merged = merged.assign_coords(huc02=("basin", huc02.values.astype(str)))
+        self._write_new(merged)
+
+    def _write_in_place(self, ds: xr.Dataset, old: xr.Dataset) -> bool:
+        """
+        Overwrite existing times and append later times of basins in the store; only the time window of the data is
+        read from the store, so the memory does not grow with the store
+
+        Returns False if the times could not be written in place, i.e. existing times are not consecutive in the store
+        or are not followed only by later times.
+        """
+        old_basins = old.indexes["basin"]
+        old_time = old.indexes["time"]
+        ind = old_time.get_indexer(ds.indexes["time"])
+        n_existing = int((ind >= 0).sum())
+        existing = ind[:n_existing]
+        if (existing < 0).any() or (np.diff(existing) != 1).any():
+            return False
+        later = ds.indexes["time"][n_existing:]
+        if later.size > 0 and later[0] <= old_time[-1]:
+            return False
+        ds = ds.drop_vars(["huc02"], errors="ignore")
+        all_basins = ds.sizes["basin"] == old_basins.size
+        if n_existing > 0:
+            window = slice(int(existing[0]), int(existing[-1]) + 1)
+            part = ds.isel(time=slice(0, n_existing))
+            region = {"time": window}
+            if not all_basins:
+                basin_ind = np.sort(old_basins.get_indexer(part.indexes["basin"]))
+                basin_sel = _as_slice(basin_ind)
+                if isinstance(basin_sel, slice):
+                    # basins which are a block in the store are written to their block only
+                    region["basin"] = basin_sel
+                    old_basins = old_basins[basin_sel]
+                else:
+                    # other basins keep their values in the window
+                    part = part.combine_first(
+                        old[list(ds.data_vars)].isel(time=window).load()
+                    )
+            part = part.reindex(basin=old_basins)
+            part.drop_vars(["basin", "huc02"], errors="ignore").to_zarr(
+                self.store_path, region=region
+            )
+            old_basins = old.indexes["basin"]
+        if later.size > 0:
+            part = ds.isel(time=slice(n_existing, None)).reindex(basin=old_basins)
+            if "huc02" in old.coords:
+                part = part.assign_coords(huc02=("basin", old["huc02"].values))
+            part.to_zarr(self.store_path, append_dim="time")
+        return True
+
+    def reserve(
+        self,
+        basin_ids: Union[list, np.ndarray],
+        like: xr.Dataset,
+        huc02: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        Add basins, times and variables which are not in the store yet, filled with NaN
+
+        When a store is written in batches of basins, the first batch reserves all basins, so every batch is then
+        written in place (see :meth:`write`) rather than merged with the whole store. Values in the store are kept.
+
+        Parameters
+        ----------
+        basin_ids
+            ids of all basins which will be written
+        like
+            a dataset with dims (basin, time) whose times and variables (with their dtypes and attributes) are reserved
+        huc02
+            basin id -> HUC02 id
+        """
+        basin_ids = pd.Index(np.asarray(basin_ids, dtype=str)).unique().sort_values()
+        time = like.indexes["time"]
+        if self.exists():
+            with self.open() as old:
+                new_basins = basin_ids[~basin_ids.isin(old.indexes["basin"])]
+                new_time = time[~time.isin(old.indexes["time"])]
+                new_vars = set(like.data_vars) - set(old.data_vars)
+                if new_basins.size == 0 and new_time.size == 0 and not new_vars:
+                    return
+                if new_basins.size > 0:
+                    # new basins are merged with the store once, at all times of the store and like
+                    basin_ids = new_basins
+                elif not new_vars:
+                    # new times of all basins, which are appended if they are later than the store's
+                    basin_ids = old.indexes["basin"]
+                    time = new_time
+        ds = xr.Dataset(
+            {
+                var: (
+                    ("basin", "time"),
+                    np.full((basin_ids.size, time.size), np.nan, like[var].dtype),
+                    like[var].attrs,
+                )
+                for var in like.data_vars
+            },
+            coords={"basin": basin_ids.values, "time": time},
+        )
+        if huc02 is not None:
+            ds = ds.assign_coords(
+                huc02=("basin", [str(huc02.get(b, "")) for b in ds["basin"].values])
+            )
+        self.write(ds)
+
+    def _write_new(self, ds: xr.Dataset) -> None:
+        # write to a temporary store and then replace the old one, so a failure never leaves a broken store
+        encoding = {}
+        for var in ds.variables:
+            ds[var].encoding = {}
+        for var in ds.data_vars:
+            encoding[var] = {
+                "chunks": (
+                    min(ds.sizes["basin"], BASIN_CHUNK),
+                    min(ds.sizes["time"], TIME_CHUNK),
+                )
+            }
+        tmp_path = self.store_path + ".tmp" + str(os.getpid())
+        ds.to_zarr(tmp_path, mode="w", encoding=encoding)
+        if self.exists():
+            old_path = self.store_path + ".old" + str(os.getpid())
+            os.replace(self.store_path, old_path)
+            os.replace(tmp_path, self.store_path)
+            shutil.rmtree(old_path)
+        else:
+            os.replace(tmp_path, self.store_path)
+
+    def write_camels_frames(
+        self,
+        frames: Dict[str, pd.DataFrame],
+        huc02: Optional[Dict[str, str]] = None,
+        dtype: str = FORCING_DTYPE,
+        all_basins: Optional[list] = None,
+    ) -> None:
+        """
+        Write tables in the format of CAMELS to the store
+
+        Parameters
+        ----------
+        frames
+            basin id -> a table whose columns are Year, Mnth, Day, Hr and variables such as "prcp(mm/day)"
+        huc02
+            basin id -> HUC02 id; it is used to export the text files to their huc02 directories
+        dtype
+            data type of the variables in the store
+        all_basins
+            if the basins are written in batches, ids of the basins of all batches; they are reserved in the store
+            (see :meth:`reserve`), so the store is not rewritten for each batch
+        """
+        if len(frames) == 0:
+            return
+        df = pd.concat(
+            list(frames.values()), keys=list(frames.keys()), names=["basin", "row"]
+        )
+        time = pd.to_datetime(
+            pd.DataFrame(
+                {
+                    "year": df[CAMELS_TIME_COLS[0]].values,
+                    "month": df[CAMELS_TIME_COLS[1]].values,
+                    "day": df[CAMELS_TIME_COLS[2]].values,
+                }
+            )
+        )
+        data = df.drop(columns=CAMELS_TIME_COLS)
+        data.index = pd.MultiIndex.from_arrays(
+            [df.index.get_level_values("basin").astype(str), time],
+            names=["basin", "time"],
+        )
+        data = data[~data.index.duplicated(keep="last")]
+        names_units = [split_camels_col(col) for col in data.columns]
+        data.columns = [name for name, _ in names_units]
+        ds = xr.Dataset.from_dataframe(data.astype(dtype))
+        ds["basin"] = ds["basin"].values.astype(str)
+        for name, units in names_units:
+            ds[name].attrs["units"] = units
+        if huc02 is not None:
+            ds = ds.assign_coords(
+                huc02=("basin", [str(huc02[b]) for b in ds["basin"].values])
+            )
+        if all_basins is not None:
+            self.reserve(all_basins, ds, huc02)
+        self.write(ds)
+
+    def read(
+        self,
+        basin_ids: Union[list, np.ndarray],
+        t_range_list: np.ndarray,
+        var_lst: List[str],
+        dtype: str = FORCING_DTYPE,
+    ) -> np.ndarray:
+        """
+        Read some variables of basins at given days
+
+        Parameters
+        ----------
+        basin_ids
+            ids of basins
+        t_range_list
+            the days, for example, hydro_time.t_range_days(["1990-01-01", "2000-01-01"])
+        var_lst
+            names of variables without units, such as "prcp"
+        dtype
+            data type of the output array; "float64" for the full precision
+
+        Returns
+        -------
+        np.ndarray
+            data with dims (basin, time, variable); days not in the store are NaN
+        """
+        with self.open() as ds:
+            basin_ind = ds.indexes["basin"].get_indexer(
+                np.asarray(basin_ids, dtype=str)
+            )
+            if (basin_ind < 0).any():
+                raise KeyError(
+                    "No such basins in the store: "
+                    + str(np.asarray(basin_ids)[basin_ind < 0].tolist())
+                )
+            time_ind = ds.indexes["time"].get_indexer(pd.to_datetime(t_range_list))
+            time_ok = np.flatnonzero(time_ind >= 0)
+            out = np.full(
+                [len(basin_ids), len(t_range_list), len(var_lst)], np.nan, dtype=dtype
+            )
+            if time_ok.size == 0:
+                return out
+            # slices are much faster than fancy indexing for both zarr and numpy
+            basin_sel = _as_slice(basin_ind)
+            time_sel = _as_slice(time_ind[time_ok])
+            out_time = _as_slice(time_ok)
+            for k, var in enumerate(var_lst):
+                out[:, out_time, k] = (
+                    ds[var].isel(basin=basin_sel, time=time_sel).values
+                )
+        return out
+
+    def to_camels_frame(
+        self, basin_id: str, ds: Optional[xr.Dataset] = None
+    ) -> pd.DataFrame:
+        """the table of a basin in the format of CAMELS"""
+        close = ds is None
+        if close:
+            ds = self.open()
+        basin_ds = ds.sel(basin=basin_id).load()
+        if close:
+            ds.close()
+        df = year_month_day_hour(basin_ds.indexes["time"])
+        for var in basin_ds.data_vars:
+            col = join_camels_col(var, basin_ds[var].attrs.get("units", ""))
+            df[col] = basin_ds[var].values
+        return df
+
+    def export_camels_txt(
+        self,
+        output_dir: str,
+        file_suffix: str,
+        basin_ids: Optional[list] = None,
+        sep: str = " ",
+        float_format: Optional[str] = None,
+    ) -> None:
+        """
+        Export the text files "<output_dir>/<huc02>/<basin_id><file_suffix>" in the format of CAMELS
+
+        If the store has no huc02 coordinate, files are saved in output_dir directly.
+        """
+        with self.open() as ds:
+            if basin_ids is None:
+                basin_ids = ds["basin"].values.tolist()
+            for basin_id in basin_ids:
+                output_huc_dir = output_dir
+                if "huc02" in ds.coords:
+                    output_huc_dir = os.path.join(
+                        output_dir, str(ds["huc02"].sel(basin=basin_id).values)
+                    )
+                if not os.path.isdir(output_huc_dir):
+                    os.makedirs(output_huc_dir)
+                self.to_camels_frame(basin_id, ds).to_csv(
+                    os.path.join(output_huc_dir, basin_id + file_suffix),
+                    header=True,
+                    index=False,
+                    sep=sep,
+                    float_format=float_format,
+                )
+
+    def import_camels_txt(
+        self,
+        input_dir: str,
+        file_suffix: str,
+        basin_ids: list,
+        huc02s: Optional[list] = None,
+        sep: str = r"\s+",
+    ) -> None:
+        """
+        Import the text files "<input_dir>/<huc02>/<basin_id><file_suffix>" in the format of CAMELS to the store
+
+        It is used to convert the text files produced before to a store.
+        """
+        frames = {}
+        for i, basin_id in enumerate(basin_ids):
+            huc_dir = (
+                input_dir if huc02s is None else os.path.join(input_dir, huc02s[i])
+            )
+            frames[basin_id] = pd.read_csv(
+                os.path.join(huc_dir, basin_id + file_suffix), sep=sep
+            )
+        huc02 = None if huc02s is None else dict(zip(basin_ids, huc02s))
+        self.write_camels_frames(frames, huc02)
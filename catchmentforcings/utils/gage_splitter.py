@@ -0,0 +1,73 @@
+"""
+Split a regional table (e.g. a csv file exported from GEE for all basins in a region) into the tables of basins
+
+The id column is parsed only once and the table is sorted by it once, so getting the rows of a basin is a slice rather
+than comparing the whole id column with each basin's id.
+"""
+from typing import Dict, Iterator, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+def _id_keys(ids: Union[pd.Series, np.ndarray, Sequence]) -> np.ndarray:
+    """
+    Keys to compare gage ids: integers when all ids are numbers, so "01013500" and 1013500 are same as before;
+    otherwise the stripped strings
+    """
+    ids = pd.Series(np.asarray(ids))
+    numbers = pd.to_numeric(ids, errors="coerce")
+    if numbers.notna().all() and (numbers % 1 == 0).all():
+        return numbers.values.astype(np.int64)
+    return ids.astype(str).str.strip().values
+
+
+class GageSplitter:
+    """rows of each gage in a table with a column of gage ids"""
+
+    def __init__(self, data: pd.DataFrame, id_col: str):
+        """
+        Parameters
+        ----------
+        data
+            the table of all gages; rows of a gage keep their original order
+        id_col
+            name of the column of gage ids
+        """
+        keys = _id_keys(data[id_col])
+        self.numeric = keys.dtype.kind == "i"
+        order = np.argsort(keys, kind="stable")
+        self.data = data.iloc[order]
+        unique_keys, starts, counts = np.unique(
+            keys[order], return_index=True, return_counts=True
+        )
+        self._slices: Dict = {
+            key: slice(start, start + count)
+            for key, start, count in zip(unique_keys.tolist(), starts, counts)
+        }
+
+    def _key(self, gage_id):
+        if self.numeric:
+            try:
+                return int(gage_id)
+            except ValueError:
+                return None
+        return str(gage_id).strip()
+
+    def __contains__(self, gage_id) -> bool:
+        return self._key(gage_id) in self._slices
+
+    def __len__(self) -> int:
+        return len(self._slices)
+
+    def get(self, gage_id) -> pd.DataFrame:
+        """rows of a gage; an empty table if the gage is not in it"""
+        the_slice = self._slices.get(self._key(gage_id), slice(0, 0))
+        return self.data.iloc[the_slice]
+
+    def split(
+        self, gage_ids: Sequence
+    ) -> Iterator[Tuple[int, Union[str, int], pd.DataFrame]]:
+        """yield (index, gage id, rows of the gage) for the given gages"""
+        for i, gage_id in enumerate(gage_ids):
+            yield i, gage_id, self.get(gage_id)
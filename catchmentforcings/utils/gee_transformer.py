@@ -0,0 +1,509 @@
+"""
+Transform the tables of basin mean data exported from GEE to the text files in the format of CAMELS
+
+Each product is described by a :class:`GeeProductSpec` (its files, columns, time and output format), and
+:func:`trans_gee_to_camels_format` does the same work for all products: the table of a region is parsed once with
+vectorized dates, split by gage in one pass, and the data of each year are appended to the file of each basin;
+the tables of different years could be parsed in parallel, and very large files could be streamed in chunks.
+"""
+import copy
+import fnmatch
+import os
+import shutil
+from functools import partial
+from itertools import zip_longest
+from multiprocessing import Pool
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import pandas as pd
+
+from catchmentforcings.utils.forcing_store import (
+    BASIN_CHUNK,
+    CAMELS_TIME_COLS,
+    FORCING_DTYPE,
+    OUTPUT_FORMATS,
+    ForcingStore,
+    forcing_store_path,
+)
+from catchmentforcings.utils.gage_splitter import GageSplitter
+from catchmentforcings.utils.hydro_utils import (
+    CAMELS_DATE_DTYPE,
+    to_datetime_index,
+    utc_to_local_array,
+    year_month_day_hour,
+)
+from catchmentforcings.utils.year_manifest import append_year_to_txt
+
+GAGE_ID_KEYS = ["STAID", "gauge_id", "gage_id"]
+HUC02_KEYS = ["HUC02", "huc_02"]
+# in the streaming mode, buffers of basins are flushed to staged files when they have so many chunks of rows
+STAGING_BUFFER_CHUNKS = 4
+
+
+class GeeProductSpec:
+    """how to transform the tables of a product exported from GEE to the format of CAMELS"""
+
+    def __init__(
+        self,
+        name: str,
+        file_patterns: List[str],
+        value_cols: List[List[str]],
+        output_cols: List[str],
+        file_suffix: str,
+        id_col: str = "gage_id",
+        time_col: str = "time_start",
+        time_unit: Optional[str] = None,
+        time_zone: Optional[str] = None,
+        sep: str = " ",
+        float_format: Optional[str] = None,
+        skip_missing: bool = False,
+        huc_dirs: bool = True,
+        value_dtype: Optional[str] = None,
+    ):
+        """
+        Parameters
+        ----------
+        name
+            name of the product, only used in messages
+        file_patterns
+            fnmatch patterns of the files of a region and a year, with "{region}" and "{year}" in them,
+            e.g. ["nldas_{region}_avg_mean_{year}.csv", "nldas_{region}_sum_mean_{year}.csv"] for a pair of avg/sum files
+        value_cols
+            names of the value columns in each file; if a file has no such names, the columns after its id and time
+            columns are used in order
+        output_cols
+            names of the value columns in the output files, e.g. "prcp(mm/day)"; one for each of value_cols
+        file_suffix
+            the output file of a basin is <basin_id><file_suffix>
+        id_col
+            name of the gage id column in the files
+        time_col
+            name of the time column in the files
+        time_unit
+            None if times are strings, e.g. "2000-01-01"; "julian" if they are Julian codes, e.g. 2000001;
+            otherwise the unit of epoch times, e.g. "ms"
+        time_zone
+            times are UTC; if a time zone is given, they are transformed to local times of it
+        sep
+            separator of the output files
+        float_format
+            float format of the values in the output files
+        skip_missing
+            if True, basins without data are skipped; otherwise an error is raised
+        huc_dirs
+            if True and gage_dict has HUC02 ids, the output files are in <output_dir>/<huc02>; otherwise in output_dir
+        value_dtype
+            data type of the values when the files are parsed; "float64" keeps the full precision of the files;
+            if None, it is float64 when text files are written (see :func:`spec_for_output_format`) and FORCING_DTYPE
+            otherwise
+        """
+        if len(file_patterns) != len(value_cols):
+            raise ValueError("Each file pattern should have its value columns")
+        if sum(len(cols) for cols in value_cols) != len(output_cols):
+            raise ValueError("Each value column should have its output column")
+        self.name = name
+        self.file_patterns = file_patterns
+        self.value_cols = value_cols
+        self.output_cols = output_cols
+        self.file_suffix = file_suffix
+        self.id_col = id_col
+        self.time_col = time_col
+        self.time_unit = time_unit
+        self.time_zone = time_zone
+        self.sep = sep
+        self.float_format = float_format
+        self.skip_missing = skip_missing
+        self.huc_dirs = huc_dirs
+        self.value_dtype = value_dtype
+
+    def __repr__(self):
+        return f"GeeProductSpec({self.name!r})"
+
+
+def spec_for_output_format(spec: GeeProductSpec, output_format: str) -> GeeProductSpec:
+    """
+    The spec used to write the output format; if spec.value_dtype is None, values are parsed as float64 when text
+    files are written, so the text files keep the precision of the files, and they are cast to float32 only in the
+    ForcingStore
+    """
+    if spec.value_dtype is not None:
+        return spec
+    spec = copy.copy(spec)
+    spec.value_dtype = FORCING_DTYPE if output_format == "zarr" else "float64"
+    return spec
+
+
+def _value_dtype(spec: GeeProductSpec) -> str:
+    return FORCING_DTYPE if spec.value_dtype is None else spec.value_dtype
+
+
+def gage_huc_keys(gage_dict) -> Tuple[str, Optional[str]]:
+    """names of the gage id and HUC02 id in gage_dict; the HUC02 one is None if there is no such key"""
+    gage_id_key = next((key for key in GAGE_ID_KEYS if key in gage_dict.keys()), None)
+    if gage_id_key is None:
+        raise NotImplementedError("No such gage id name")
+    huc02_key = next((key for key in HUC02_KEYS if key in gage_dict.keys()), None)
+    return gage_id_key, huc02_key
+
+
+def find_gee_files(
+    spec: GeeProductSpec, source_dir: str, region: str, year: int
+) -> List[str]:
+    """the files of a region and a year, one for each of spec.file_patterns"""
+    f_names = sorted(os.listdir(source_dir))
+    data_files = []
+    for pattern in spec.file_patterns:
+        pattern = pattern.format(region=region, year=year)
+        matched = [f_name for f_name in f_names if fnmatch.fnmatch(f_name, pattern)]
+        if not matched:
+            raise FileNotFoundError(f"No file {pattern} in {source_dir}")
+        # if more files match, the last one is used as before
+        data_files.append(os.path.join(source_dir, matched[-1]))
+    return data_files
+
+
+def parse_gee_time(times: pd.Series, spec: GeeProductSpec) -> pd.DatetimeIndex:
+    """parse the time column of a table in one vectorized call"""
+    if spec.time_zone is not None:
+        return utc_to_local_array(times.values, spec.time_zone, spec.time_unit)
+    return to_datetime_index(times.values, spec.time_unit)
+
+
+def _read_gee_file(
+    data_file: str, spec: GeeProductSpec, i_file: int, chunksize: Optional[int] = None
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """read a file (or its chunks) with only the id, time and value columns, in this order"""
+    value_cols = spec.value_cols[i_file]
+    cols = [spec.id_col, spec.time_col] + value_cols
+    header = pd.read_csv(data_file, sep=",", nrows=0).columns.tolist()
+    dtype = {col: _value_dtype(spec) for col in value_cols}
+    dtype[spec.id_col] = str
+    if all(col in header for col in value_cols):
+        kwargs = {"usecols": cols}
+    else:
+        # the columns after id and time columns are values, as files exported by old GEE code
+        if len(header) - 2 != len(value_cols):
+            raise ValueError(
+                f"{data_file} has {len(header) - 2} value columns, but {len(value_cols)} are expected"
+            )
+        kwargs = {"header": 0, "names": cols}
+    data = pd.read_csv(data_file, sep=",", dtype=dtype, chunksize=chunksize, **kwargs)
+    if chunksize is None:
+        return data[cols]
+    return (chunk[cols] for chunk in data)
+
+
+def _to_camels_table(data: pd.DataFrame, spec: GeeProductSpec) -> pd.DataFrame:
+    dates = year_month_day_hour(parse_gee_time(data[spec.time_col], spec))
+    # a region has few gages and many rows for each, so its ids are categorical
+    dates.insert(0, spec.id_col, pd.Categorical(data[spec.id_col].values))
+    values = pd.DataFrame(
+        data[sum(spec.value_cols, [])].values, columns=spec.output_cols
+    )
+    return pd.concat([dates, values], axis=1)
+
+
+def read_gee_year(
+    spec: GeeProductSpec, source_dir: str, region: str, year: int
+) -> pd.DataFrame:
+    """
+    Read the files of a region and a year to one table in the format of CAMELS
+
+    Returns
+    -------
+    pd.DataFrame
+        a table of all basins; its columns are spec.id_col, Year, Mnth, Day, Hr and spec.output_cols
+    """
+    data_files = find_gee_files(spec, source_dir, region, year)
+    data = _read_gee_file(data_files[0], spec, 0)
+    for i_file in range(1, len(data_files)):
+        # avg and sum files of a product are joined by gage and time
+        data = data.merge(
+            _read_gee_file(data_files[i_file], spec, i_file),
+            on=[spec.id_col, spec.time_col],
+            how="left",
+        )
+    return _to_camels_table(data, spec)
+
+
+def iter_gee_chunks(
+    spec: GeeProductSpec, source_dir: str, region: str, year: int, chunksize: int
+) -> Iterator[pd.DataFrame]:
+    """
+    Read the files of a region and a year chunk by chunk; each chunk is a table like that of :func:`read_gee_year`
+
+    The avg and sum files of a product are read in step, so their rows should be in the same order, as GEE exports
+    them; otherwise a ValueError is raised.
+    """
+    data_files = find_gee_files(spec, source_dir, region, year)
+    readers = [
+        _read_gee_file(data_file, spec, i_file, chunksize)
+        for i_file, data_file in enumerate(data_files)
+    ]
+    for chunks in zip_longest(*readers):
+        if any(chunk is None for chunk in chunks):
+            raise ValueError(
+                f"The {spec.name} files of {region} in {year} have different numbers of rows"
+            )
+        data = chunks[0].reset_index(drop=True)
+        for chunk in chunks[1:]:
+            chunk = chunk.reset_index(drop=True)
+            if not data[[spec.id_col, spec.time_col]].equals(
+                chunk[[spec.id_col, spec.time_col]]
+            ):
+                raise ValueError(
+                    f"Rows of the {spec.name} files of {region} in {year} are not in the same order, "
+                    "so they could not be read in chunks"
+                )
+            data = pd.concat(
+                [data, chunk.drop(columns=[spec.id_col, spec.time_col])], axis=1
+            )
+        yield _to_camels_table(data, spec)
+
+
+def split_gee_year(
+    spec: GeeProductSpec, source_dir: str, region: str, year: int
+) -> GageSplitter:
+    """read the files of a region and a year (see :func:`read_gee_year`) and split the table by gage"""
+    return GageSplitter(read_gee_year(spec, source_dir, region, year), spec.id_col)
+
+
+def _imap_years(
+    func: Callable[[int], Any], years: Sequence[int], workers: int
+) -> Iterator[Tuple[int, Any]]:
+    if workers > 1 and len(years) > 1:
+        with Pool(min(workers, len(years))) as pool:
+            # imap keeps the order of years
+            yield from zip(years, pool.imap(func, years))
+    else:
+        for year in years:
+            yield year, func(year)
+
+
+def iter_gee_years(
+    spec: GeeProductSpec,
+    source_dir: str,
+    region: str,
+    years: Sequence[int],
+    workers: int = 1,
+) -> Iterator[Tuple[int, GageSplitter]]:
+    """
+    Yield (year, the table of the year split by gage) in the given order of years
+
+    With more than one worker, the files of years are read and split in a pool of processes, while the caller
+    handles former years; as all outputs are written by the caller in order, years never race on a basin's file.
+    """
+    return _imap_years(
+        partial(split_gee_year, spec, source_dir, region), years, workers
+    )
+
+
+def _staged_file(staging_dir: str, gage_id) -> str:
+    return os.path.join(staging_dir, str(gage_id) + ".csv")
+
+
+def _flush_staging_buffers(buffers: Dict[Any, List[pd.DataFrame]], staging_dir: str):
+    for gage_id, frames in buffers.items():
+        the_file = _staged_file(staging_dir, gage_id)
+        pd.concat(frames).to_csv(
+            the_file, mode="a", header=not os.path.isfile(the_file), index=False
+        )
+    buffers.clear()
+
+
+def stage_gee_year(
+    spec: GeeProductSpec,
+    source_dir: str,
+    region: str,
+    gage_ids: list,
+    chunksize: int,
+    staging_dir: str,
+    year: int,
+) -> str:
+    """
+    Read the files of a region and a year in chunks and route the rows of each gage to its own file in staging_dir
+
+    Rows are kept in buffers of basins, which are flushed when they have more than STAGING_BUFFER_CHUNKS chunks of
+    rows, so the memory used is bounded by chunksize rather than the size of the files.
+
+    Returns
+    -------
+    str
+        the directory of staged files of the year: "<staging_dir>/<year>"
+    """
+    year_dir = os.path.join(staging_dir, str(year))
+    if os.path.isdir(year_dir):
+        shutil.rmtree(year_dir)
+    os.makedirs(year_dir)
+    # a gage given twice should not have its rows staged twice
+    unique_gage_ids = list(dict.fromkeys(gage_ids))
+    buffers = {}
+    n_buffered = 0
+    for table in iter_gee_chunks(spec, source_dir, region, year, chunksize):
+        data_by_gage = GageSplitter(table, spec.id_col)
+        for _, gage_id, basin_data in data_by_gage.split(unique_gage_ids):
+            if basin_data.shape[0] > 0:
+                buffers.setdefault(gage_id, []).append(basin_data)
+                n_buffered += basin_data.shape[0]
+        if n_buffered >= STAGING_BUFFER_CHUNKS * chunksize:
+            _flush_staging_buffers(buffers, year_dir)
+            n_buffered = 0
+    _flush_staging_buffers(buffers, year_dir)
+    return year_dir
+
+
+def _iter_staged_basins(
+    spec: GeeProductSpec, year_dir: str, gage_ids: list
+) -> Iterator[Tuple[int, Any, pd.DataFrame]]:
+    dtype = {col: CAMELS_DATE_DTYPE for col in CAMELS_TIME_COLS}
+    dtype.update({col: _value_dtype(spec) for col in spec.output_cols})
+    dtype[spec.id_col] = str
+    for i_basin, gage_id in enumerate(gage_ids):
+        the_file = _staged_file(year_dir, gage_id)
+        if os.path.isfile(the_file):
+            yield i_basin, gage_id, pd.read_csv(the_file, dtype=dtype)
+        else:
+            yield i_basin, gage_id, pd.DataFrame()
+
+
+def _write_gee_year(
+    spec: GeeProductSpec,
+    basin_frames: Iterable[Tuple[int, Any, pd.DataFrame]],
+    year: int,
+    output_dir: str,
+    gage_ids: list,
+    huc02s: Optional[list],
+    output_format: str,
+) -> None:
+    store = None
+    if output_format != "txt":
+        store = ForcingStore(forcing_store_path(output_dir, spec.file_suffix))
+        huc02 = None if huc02s is None else dict(zip(gage_ids, huc02s))
+    store_frames = {}
+    for i_basin, gage_id, basin_data in basin_frames:
+        if basin_data.shape[0] == 0:
+            if spec.skip_missing:
+                continue
+            raise ArithmeticError(f"Basin {gage_id} has no {spec.name} data in {year}")
+        new_data_df = basin_data.drop(columns=spec.id_col).reset_index(drop=True)
+        if store is not None:
+            store_frames[gage_id] = new_data_df
+            if len(store_frames) >= BASIN_CHUNK:
+                # basins are written to the store in batches, so the memory does not grow with the number of basins;
+                # all basins are reserved in the store by the first batch, so each batch is written in place
+                store.write_camels_frames(store_frames, huc02, all_basins=gage_ids)
+                store_frames = {}
+            if output_format == "zarr":
+                continue
+        output_huc_dir = (
+            output_dir if huc02s is None else os.path.join(output_dir, huc02s[i_basin])
+        )
+        if not os.path.isdir(output_huc_dir):
+            os.makedirs(output_huc_dir)
+        append_year_to_txt(
+            os.path.join(output_huc_dir, str(gage_id) + spec.file_suffix),
+            new_data_df,
+            year,
+            sep=spec.sep,
+            float_format=spec.float_format,
+        )
+    if store_frames:
+        store.write_camels_frames(store_frames, huc02, all_basins=gage_ids)
+    print("output", spec.name, "data of year", year)
+
+
+def trans_gee_to_camels_format(
+    spec: GeeProductSpec,
+    source_dir: str,
+    output_dir: str,
+    gage_dict,
+    region: str,
+    years: Union[int, Sequence[int]],
+    output_format: str = "txt",
+    workers: int = 1,
+    chunksize: Optional[int] = None,
+):
+    """
+    Transform the data of a product downloaded from GEE to the format in CAMELS.
+
+    Parameters
+    ----------
+    spec
+        the product's spec
+    source_dir
+        the original data's directory
+    output_dir
+        the transformed data's directory
+    gage_dict
+        a dict containing gage's ids and the correspond HUC02 ids
+    region
+        we use GEE code to generate data for each year for each shape file (region) containing some basins,
+        and the region is a part of the file names; for example, if we use the basins' shpfile in CAMELS,
+        the region is "camels".
+    years
+        a year or some years; each year for each region has its own data file(s)
+    output_format
+        "txt": a text file for each basin; "zarr": a ForcingStore for all basins in output_dir; "both": both of them
+    workers
+        number of processes to read the files of different years; data are always written in the given order of years
+    chunksize
+        if given, files are streamed in chunks of chunksize rows and the rows of basins are staged in
+        "<output_dir>/.staging_<name>_<region>" (see :func:`stage_gee_year`), so large files never have to be loaded
+        at once; text outputs are then written basin by basin, and a ForcingStore gets batches of BASIN_CHUNK basins
+
+    Returns
+    -------
+    None
+    """
+    assert output_format in OUTPUT_FORMATS
+    spec = spec_for_output_format(spec, output_format)
+    years = [years] if isinstance(years, int) else list(years)
+    gage_id_key, huc02_key = gage_huc_keys(gage_dict)
+    gage_ids = list(gage_dict[gage_id_key])
+    huc02s = None
+    if spec.huc_dirs and huc02_key is not None:
+        huc02s = list(gage_dict[huc02_key])
+    if chunksize is None:
+        for year, data_by_gage in iter_gee_years(
+            spec, source_dir, region, years, workers
+        ):
+            _write_gee_year(
+                spec,
+                data_by_gage.split(gage_ids),
+                year,
+                output_dir,
+                gage_ids,
+                huc02s,
+                output_format,
+            )
+        return
+    staging_dir = os.path.join(output_dir, f".staging_{spec.name}_{region}")
+    stage_year = partial(
+        stage_gee_year, spec, source_dir, region, gage_ids, chunksize, staging_dir
+    )
+    try:
+        for year, year_dir in _imap_years(stage_year, years, workers):
+            _write_gee_year(
+                spec,
+                _iter_staged_basins(spec, year_dir, gage_ids),
+                year,
+                output_dir,
+                gage_ids,
+                huc02s,
+                output_format,
+            )
+            shutil.rmtree(year_dir)
+    finally:
+        if os.path.isdir(staging_dir):
+            shutil.rmtree(staging_dir)
@@ -0,0 +1,181 @@
+"""
+A Zarr store of gridded data of basins
+
+Instead of a NetCDF file for each basin and each year, the gridded data (e.g. Daymet cut to basins' bounds) of all
+basins are saved in one Zarr store with a group for each basin. A group has all years of its basin along the time
+dimension, so a new year is appended to it, and its chunks are long in time, so reading the time series of some
+pixels only touches a few chunks. Each group is a Zarr hierarchy of its own with consolidated metadata, so opening it
+is one read, and basins could be written in parallel without touching the metadata of others.
+"""
+import os
+import shutil
+from typing import List, Optional, Sequence
+
+import numpy as np
+import xarray as xr
+
+# a chunk has 5 years and at most about 16 MB, so a time series of some pixels is read from a few chunks
+TIME_CHUNK = 1830
+TARGET_CHUNK_BYTES = 16 * 2**20
+
+
+def gridded_store_path(data_dir: str, suffix: str = "") -> str:
+    """
+    The store of the yearly files "<data_dir>/<basin_id>/<basin_id>_<year>_*<suffix>.nc" is "<data_dir>_<suffix>.zarr"
+
+    For example, the store of the files in "daymet_camels_671_bound" is "daymet_camels_671_bound.zarr", and the store
+    of files resampled with 2 times in "daymet_camels_671_bound_resample" is "daymet_camels_671_bound_resample_2.zarr"
+    """
+    data_dir = data_dir.rstrip(os.sep)
+    return data_dir + (f"_{suffix}" if suffix else "") + ".zarr"
+
+
+def _chunks(da: xr.DataArray) -> tuple:
+    if "time" not in da.dims:
+        return da.shape
+    time_chunk = min(da.sizes["time"], TIME_CHUNK)
+    # spatial chunks are square, and as large as the size of a chunk allows
+    n_space = max(1, TARGET_CHUNK_BYTES // (time_chunk * da.dtype.itemsize))
+    side = max(1, int(np.sqrt(n_space)))
+    return tuple(
+        time_chunk if dim == "time" else min(size, side)
+        for dim, size in zip(da.dims, da.shape)
+    )
+
+
+class GriddedStore:
+    """Gridded data of basins saved in a Zarr store, with a group for each basin"""
+
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.store_path)
+
+    def create(self) -> None:
+        """create an empty store; it is done once before basins are written in parallel"""
+        os.makedirs(self.store_path, exist_ok=True)
+
+    def group_path(self, basin_id: str) -> str:
+        return os.path.join(self.store_path, basin_id)
+
+    def __contains__(self, basin_id) -> bool:
+        return os.path.isdir(self.group_path(str(basin_id)))
+
+    @property
+    def basins(self) -> List[str]:
+        if not self.exists():
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.store_path)
+            # temporary groups have dots in their names
+            if os.path.isdir(self.group_path(name)) and "." not in name
+        )
+
+    def open_basin(self, basin_id: str, **kwargs) -> xr.Dataset:
+        """open the group of a basin lazily; values are read only when they are accessed"""
+        return xr.open_zarr(self.group_path(basin_id), **kwargs)
+
+    def years(self, basin_id: str) -> List[int]:
+        """years which have data in the group of a basin"""
+        if basin_id not in self:
+            return []
+        with self.open_basin(basin_id) as ds:
+            return np.unique(ds.indexes["time"].year).tolist()
+
+    def has_years(self, basin_id: str, years: Sequence[int]) -> bool:
+        return set(years) <= set(self.years(basin_id))
+
+    def write(self, basin_id: str, ds: xr.Dataset) -> None:
+        """
+        Write data of a basin to its group
+
+        Times later than those in the group are appended, existing times are overwritten in place, and others are
+        merged with the group (the new values have priority).
+        """
+        ds = ds.copy()
+        for var in ds.variables:
+            ds[var].encoding = {}
+        if basin_id not in self:
+            self._write_new(basin_id, ds)
+            return
+        with self.open_basin(basin_id) as old:
+            old_time = old.indexes["time"]
+            if ds.indexes["time"][0] > old_time[-1]:
+                ds.to_zarr(
+                    self.group_path(basin_id),
+                    append_dim="time",
+                    consolidated=True,
+                )
+                return
+            ind = old_time.get_indexer(ds.indexes["time"])
+            if (ind >= 0).all() and (np.diff(ind) == 1).all():
+                no_time_vars = [v for v in ds.variables if "time" not in ds[v].dims]
+                ds.drop_vars(no_time_vars).to_zarr(
+                    self.group_path(basin_id),
+                    region={"time": slice(ind[0], ind[-1] + 1)},
+                    consolidated=True,
+                )
+                return
+            merged = ds.combine_first(old).load()
+        for var in merged.variables:
+            merged[var].encoding = {}
+        self._write_new(basin_id, merged)
+
+    def _write_new(self, basin_id: str, ds: xr.Dataset) -> None:
+        # write to a temporary group and then replace the old one, so a failure never leaves a broken group
+        self.create()
+        encoding = {var: {"chunks": _chunks(ds[var])} for var in ds.data_vars}
+        tmp_group = basin_id + ".tmp" + str(os.getpid())
+        ds.to_zarr(
+            self.group_path(tmp_group),
+            mode="w",
+            encoding=encoding,
+            consolidated=True,
+        )
+        group_path = self.group_path(basin_id)
+        if os.path.isdir(group_path):
+            old_path = group_path + ".old" + str(os.getpid())
+            os.replace(group_path, old_path)
+            os.replace(self.group_path(tmp_group), group_path)
+            shutil.rmtree(old_path)
+        else:
+            os.replace(self.group_path(tmp_group), group_path)
+
+
+def open_basin_year(source: str, year: int) -> xr.Dataset:
+    """
+    Open the data of a basin in a year
+
+    Parameters
+    ----------
+    source
+        a yearly nc file, or the group of the basin in a GriddedStore (see :meth:`GriddedStore.group_path`)
+    year
+        the year; it is used to select the data in a group
+
+    Returns
+    -------
+    xr.Dataset
+        data of the year
+    """
+    if os.path.isdir(source):
+        store_path, basin_id = os.path.split(source.rstrip(os.sep))
+        ds = GriddedStore(store_path).open_basin(basin_id)
+        return ds.sel(time=str(year))
+    return xr.open_dataset(source)
+
+
+def valid_store_group(group_path: str, years: Optional[Sequence[int]] = None) -> bool:
+    """a group of a basin is valid if it could be opened and has all years"""
+    store_path, basin_id = os.path.split(group_path.rstrip(os.sep))
+    store = GriddedStore(store_path)
+    if basin_id not in store:
+        return False
+    try:
+        return len(store.years(basin_id)) > 0 and (
+            years is None or store.has_years(basin_id, years)
+        )
+    except Exception:
+        return False
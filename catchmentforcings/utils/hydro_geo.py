@@ -7,10 +7,12 @@ import geopandas as gpd
 import numpy as np
 import pandas as pd
 from pyproj import transform, CRS, Proj
+import shapely
 from shapely.geometry import Polygon, Point
 import xarray as xr
 
-from catchmentforcings.utils.hydro_utils import serialize_geopandas
+from catchmentforcings.utils.hydro_utils import serialize_geopandas, serialize_numpy
+from catchmentforcings.utils.mask_cache import get_mask_cache, mask_key
 
 
 def split_shp_to_shps_in_time_zones(
@@ -241,8 +243,8 @@ def nearest_point_index(crs_from, crs_to, lon, lat, xs, ys):
     return [index_x, index_y]
 
 
-def create_mask(poly, xs, ys, lons, lats, crs_from, crs_to):
-    mask_index = []
+def _mask_window(poly, xs, ys, crs_from, crs_to):
+    """the (row, col) window of the grid around the bounds of the polygon"""
     poly_bound = poly.bounds
     poly_bound_min_lat = poly_bound[1]
     poly_bound_min_lon = poly_bound[0]
@@ -256,6 +258,112 @@ def create_mask(poly, xs, ys, lons, lats, crs_from, crs_to):
     )
     range_x = [index_min[0], index_max[0]]
     range_y = [index_max[1], index_min[1]]
+    return range_y, range_x
+
+
+def points_in_polygon(poly, pxs, pys):
+    """
+    Vectorized check if points are in the polygon; same as Point(px, py).within(poly) for every point
+
+    Parameters
+    ----------
+    poly
+        the polygon
+    pxs
+        x of every point (array of any shape)
+    pys
+        y of every point (same shape as pxs)
+
+    Returns
+    -------
+    np.ndarray
+        a boolean array with the same shape as pxs
+    """
+    pxs = np.asarray(pxs, dtype=float)
+    pys = np.asarray(pys, dtype=float)
+    if hasattr(shapely, "contains_xy"):
+        # shapely 2
+        return shapely.contains_xy(poly, pxs, pys)
+    from shapely import vectorized
+
+    return vectorized.contains(poly, pxs, pys)
+
+
+def create_mask(poly, xs, ys, lons, lats, crs_from, crs_to, cache=None, as_array=False):
+    """
+    Find the grid cells whose centers are in the polygon
+
+    Only the cells in the window around the polygon's bounds are checked, all at once.
+    The result is kept in the mask cache (see catchmentforcings.utils.mask_cache),
+    so the same polygon is not checked again for the same grid
+
+    Parameters
+    ----------
+    poly
+        the polygon in geographic coordinates
+    xs
+        projected x coordinates of the grid
+    ys
+        projected y coordinates of the grid
+    lons
+        2-d longitudes of the grid cells
+    lats
+        2-d latitudes of the grid cells
+    crs_from
+        geographic crs
+    crs_to
+        projected crs of the grid
+    cache
+        the mask cache; if None, use the default one
+    as_array
+        if True, return a boolean array with the shape of lons
+
+    Returns
+    -------
+    list or np.ndarray
+        the list of (i, j) indices, or the boolean array when as_array is True
+    """
+    if cache is None:
+        cache = get_mask_cache()
+    xs_ = np.asarray(xs)
+    ys_ = np.asarray(ys)
+    key = mask_key(
+        poly,
+        (xs_[0], xs_[-1], ys_[0], ys_[-1]),
+        (ys_.size, xs_.size),
+        crs_from=str(crs_from),
+        crs_to=str(crs_to),
+        method="create_mask",
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        mask_index = cached["mask_index"]
+    else:
+        range_y, range_x = _mask_window(poly, xs, ys, crs_from, crs_to)
+        win = (
+            slice(range_y[0], range_y[1] + 1),
+            slice(range_x[0], range_x[1] + 1),
+        )
+        inside = points_in_polygon(poly, np.asarray(lons)[win], np.asarray(lats)[win])
+        win_i, win_j = np.nonzero(inside)
+        # np.nonzero is in row-major order, same as the loop in create_mask_by_loop
+        mask_index = np.stack([win_i + range_y[0], win_j + range_x[0]], axis=1).astype(
+            np.int64
+        )
+        cache.put(key, {"mask_index": mask_index})
+    if as_array:
+        mask = np.full(np.shape(lons), False)
+        mask[mask_index[:, 0], mask_index[:, 1]] = True
+        return mask
+    return [tuple(ij) for ij in mask_index.tolist()]
+
+
+def create_mask_by_loop(poly, xs, ys, lons, lats, crs_from, crs_to):
+    """
+    The original version of create_mask checking cells one by one; slow, only kept for comparison
+    """
+    mask_index = []
+    range_y, range_x = _mask_window(poly, xs, ys, crs_from, crs_to)
     for i in range(range_y[0], range_y[1] + 1):
         for j in range(range_x[0], range_x[1] + 1):
             if is_point_in_boundary(lons[i][j], lats[i][j], poly):
@@ -285,7 +393,7 @@ def shps_trans_coord(input_folder, output_folder):
         new_datas = trans_shp_coord(input_folder, shp_file, output_folder)
 
 
-def basin_avg_netcdf(netcdf_file, shp_file, mask_file):
+def basin_avg_netcdf(netcdf_file, shp_file, mask_file=None):
     # TODO: use xarray and dask
     data_netcdf = xr.open_dataset(netcdf_file)  # reads the netCDF file
     temp_lat = data_netcdf.variables["lat"]  # temperature variable
@@ -313,7 +421,9 @@ def basin_avg_netcdf(netcdf_file, shp_file, mask_file):
     mask = create_mask(polygon, x, y, lons, lats, crs_from, crs_to)
     end = time.time()
     print("time：", "%.7f" % (end - start))
-    serialize_numpy(np.array(mask), mask_file)
+    if mask_file is not None:
+        # masks are cached by create_mask; only export it when a file is required
+        serialize_numpy(np.array(mask), mask_file)
     var_types = ["tmax"]
     # var_types = ['tmax', 'tmin', 'prcp', 'srad', 'vp', 'swe', 'dayl']
     avgs = []
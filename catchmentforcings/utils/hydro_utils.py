@@ -3,13 +3,14 @@ import os
 import re
 import zipfile
 import datetime as dt, datetime
-from typing import List, Union
+from typing import List, Optional, Union
 import geopandas as gpd
 import pickle
 import smtplib
 import ssl
 from collections import OrderedDict
 import numpy as np
+import pandas as pd
 import urllib
 from urllib import parse
 from dateutil import tz
@@ -430,6 +431,77 @@ def t_range_to_julian(t_range):
     return julian_dates
 
 
+# dtype of the Year, Mnth, Day and Hr columns of tables in the format of CAMELS
+CAMELS_DATE_DTYPE = "int16"
+
+
+def to_datetime_index(times, unit: Optional[str] = None) -> pd.DatetimeIndex:
+    """
+    Parse an array of times in one vectorized call
+
+    Parameters
+    ----------
+    times
+        ISO strings such as "2000-01-01" or datetime64 values; epoch times; or Julian codes such as 2000001 (YYYYDDD)
+    unit
+        None for strings or datetime64; "julian" for Julian codes; otherwise the unit of epoch times, such as "ms"
+
+    Returns
+    -------
+    pd.DatetimeIndex
+        the times
+    """
+    values = np.asarray(times)
+    if unit is None:
+        return pd.DatetimeIndex(pd.to_datetime(values))
+    if unit == "julian":
+        return pd.DatetimeIndex(
+            pd.to_datetime(pd.Series(values).astype(str).str.strip(), format="%Y%j")
+        )
+    return pd.DatetimeIndex(pd.to_datetime(values, unit=unit))
+
+
+def year_month_day_hour(
+    times,
+    hour: Optional[int] = 12,
+    unit: Optional[str] = None,
+    dtype: str = CAMELS_DATE_DTYPE,
+) -> pd.DataFrame:
+    """
+    The Year, Mnth, Day and Hr columns of times in the format of CAMELS
+
+    Parameters
+    ----------
+    times
+        the times; see :func:`to_datetime_index`
+    hour
+        the hour is set to 12 by default, as 12 is the average hour of a day; if None, the hours of times are used
+    unit
+        the unit of times; see :func:`to_datetime_index`
+    dtype
+        data type of the columns; int16 is enough for all dates and takes a quarter of the memory of int64
+
+    Returns
+    -------
+    pd.DataFrame
+        a table with columns Year, Mnth, Day and Hr
+    """
+    time = (
+        times
+        if isinstance(times, pd.DatetimeIndex) and unit is None
+        else to_datetime_index(times, unit)
+    )
+    return pd.DataFrame(
+        {
+            "Year": time.year,
+            "Mnth": time.month,
+            "Day": time.day,
+            "Hr": time.hour if hour is None else hour,
+        },
+        dtype=dtype,
+    )
+
+
 def utc_to_local(
         utc_time: Union[str, np.datetime64],
         local_tz: str = "Asia/Hong_Kong",
@@ -468,6 +540,32 @@ def utc_to_local(
     return result_str
 
 
+def utc_to_local_array(
+    utc_times, local_tz: str = "Asia/Hong_Kong", unit: Optional[str] = None
+) -> pd.DatetimeIndex:
+    """
+    Transform an array of UTC times to local times in one vectorized call; it is the array version of utc_to_local
+
+    Parameters
+    ----------
+    utc_times
+        the UTC times: strings such as "2020-01-01T00:00:00", datetime64 values, or epoch times of the unit
+    local_tz
+        the local time zone; default is "Asia/Hong_Kong"
+    unit
+        see :func:`to_datetime_index`
+
+    Returns
+    -------
+    pd.DatetimeIndex
+        local times without time zone info, so they could be compared with other naive times
+    """
+    time = to_datetime_index(utc_times, unit)
+    if time.tz is None:
+        time = time.tz_localize("UTC")
+    return time.tz_convert(local_tz).tz_localize(None)
+
+
 # --------------------------------------------------MATH CALCULATION---------------------------------------------------
 def subset_of_dict(dict, chosen_keys):
     """make a new dict from key-values of chosen keys in a list"""
@@ -0,0 +1,223 @@
+"""
+Cache of basin rasterization masks
+
+A mask is identified by the content of the geometry (a hash of its WKB) and the grid it is rasterized to
+(transform + shape), so the same basin on the same grid is rasterized only once, no matter how many yearly files
+are processed. Masks are kept in an in-memory LRU layer and saved on disk as compressed npz files
+(boolean masks are bit-packed).
+
+The default cache directory is ~/.cache/catchmentforcings/masks; set the environment variable
+CATCHMENTFORCINGS_MASK_CACHE_DIR to change it, or set it to an empty string to keep masks in memory only.
+"""
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import rasterio.features as rio_features
+from affine import Affine
+from shapely.geometry import MultiPolygon, Polygon
+
+from catchmentforcings.utils.hydro_utils import hydro_logger
+
+DEF_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "catchmentforcings", "masks"
+)
+CACHE_DIR_ENV = "CATCHMENTFORCINGS_MASK_CACHE_DIR"
+
+
+def mask_key(
+    geometry: Union[Polygon, MultiPolygon],
+    transform: Union[Affine, Sequence[float]],
+    shape: Tuple[int, ...],
+    **options,
+) -> str:
+    """
+    Content-addressed key of a mask
+
+    Parameters
+    ----------
+    geometry
+        the geometry which is rasterized
+    transform
+        the affine transform of the grid (or any numbers defining the grid)
+    shape
+        the shape of the grid
+    options
+        other options which change the mask, such as all_touched
+
+    Returns
+    -------
+    str
+        a sha1 hex digest
+    """
+    sha = hashlib.sha1()
+    sha.update(geometry.wkb)
+    # round to avoid different keys for the same grid due to floating-point noise
+    sha.update(repr([round(float(t), 9) for t in tuple(transform)[:6]]).encode())
+    sha.update(repr(tuple(int(s) for s in shape)).encode())
+    sha.update(repr(sorted(options.items())).encode())
+    return sha.hexdigest()
+
+
+class MaskCache:
+    """
+    Two-level (memory LRU + disk) cache of masks; each entry is a dict of numpy arrays
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_items: int = 256):
+        """
+        Parameters
+        ----------
+        cache_dir
+            directory of the on-disk cache; if None, use the environment variable or the default directory;
+            if it is "", nothing is saved on disk
+        max_items
+            the max number of entries kept in memory
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get(CACHE_DIR_ENV, DEF_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self._memory = OrderedDict()
+
+    def _file(self, key: str) -> str:
+        # two-level directory so that there are not too many files in one directory
+        return os.path.join(self.cache_dir, key[:2], key + ".npz")
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """Get an entry; None if it is not cached"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if not self.cache_dir:
+            return None
+        the_file = self._file(key)
+        if not os.path.isfile(the_file):
+            return None
+        try:
+            with np.load(the_file) as npz:
+                arrays = _unpack(dict(npz))
+        except (OSError, ValueError, KeyError):
+            # a broken file, just rasterize again
+            return None
+        self._remember(key, arrays)
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        """Put an entry into memory and on disk; saving it on disk is best-effort"""
+        self._remember(key, arrays)
+        if not self.cache_dir:
+            return
+        the_file = self._file(key)
+        the_dir = os.path.dirname(the_file)
+        tmp_file = None
+        try:
+            if not os.path.isdir(the_dir):
+                os.makedirs(the_dir, exist_ok=True)
+            # write to a temp file then rename, so that parallel processes never read a half-written file
+            fd, tmp_file = tempfile.mkstemp(suffix=".npz", dir=the_dir)
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **_pack(arrays))
+            os.replace(tmp_file, the_file)
+        except OSError as e:
+            # e.g. a read-only or full cache directory; the entry is still kept in memory
+            hydro_logger.warning(f"Failed to save the mask cache {the_file}: {e}")
+        finally:
+            if tmp_file is not None and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def clear_memory(self) -> None:
+        self._memory.clear()
+
+    def _remember(self, key, arrays):
+        self._memory[key] = arrays
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+
+def _pack(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    packed = {}
+    for k, v in arrays.items():
+        v = np.asarray(v)
+        if v.dtype == bool:
+            packed["__bits__" + k] = np.packbits(v, axis=None)
+            packed["__shape__" + k] = np.array(v.shape, dtype=np.int64)
+        else:
+            packed[k] = v
+    return packed
+
+
+def _unpack(packed: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    arrays = {}
+    for k, v in packed.items():
+        if k.startswith("__shape__"):
+            continue
+        if k.startswith("__bits__"):
+            name = k[len("__bits__") :]
+            shape = tuple(packed["__shape__" + name])
+            n = int(np.prod(shape))
+            arrays[name] = np.unpackbits(v, count=n).astype(bool).reshape(shape)
+        else:
+            arrays[k] = v
+    return arrays
+
+
+_DEFAULT_CACHE = None
+
+
+def get_mask_cache() -> MaskCache:
+    """The cache shared by all masking functions in this package"""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = MaskCache()
+    return _DEFAULT_CACHE
+
+
+def cached_geometry_mask(
+    geometry: Union[Polygon, MultiPolygon],
+    out_shape: Tuple[int, int],
+    transform: Affine,
+    all_touched: bool = False,
+    invert: bool = False,
+    cache: Optional[MaskCache] = None,
+) -> np.ndarray:
+    """
+    Same as rasterio.features.geometry_mask for one geometry, but the mask is cached
+
+    Parameters
+    ----------
+    geometry
+        the geometry in the CRS of the grid
+    out_shape
+        (height, width) of the grid
+    transform
+        the affine transform of the grid
+    all_touched
+        see rasterio.features.geometry_mask
+    invert
+        see rasterio.features.geometry_mask
+    cache
+        the cache; if None, use the default one
+
+    Returns
+    -------
+    np.ndarray
+        a boolean mask
+    """
+    if cache is None:
+        cache = get_mask_cache()
+    key = mask_key(geometry, transform, out_shape, all_touched=all_touched)
+    cached = cache.get(key)
+    if cached is None:
+        # always cache the mask with True inside the geometry
+        mask = rio_features.geometry_mask(
+            [geometry], out_shape, transform, all_touched=all_touched, invert=True
+        )
+        cache.put(key, {"mask": mask})
+    else:
+        mask = cached["mask"]
+    return ~mask if not invert else mask.copy()
@@ -0,0 +1,138 @@
+"""
+An index of yearly NetCDF files of basins, and a batched lazy open of them
+
+Gridded data of each basin are saved in "<data_dir>/<basin_id>/<name>_<year>_<...><suffix>.nc". The index
+(basin -> year -> file name) is saved in a JSON file in data_dir with the modification time of each basin's directory,
+so refreshing it only lists the directories changed since the last time, rather than globbing all basins.
+"""
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import dask
+import xarray as xr
+
+from catchmentforcings.utils.hydro_utils import hydro_logger
+
+INDEX_FILE_PREFIX = "nc_file_index"
+
+
+class NcFileIndex:
+    """basin -> year -> path of the yearly NetCDF files in a directory"""
+
+    def __init__(self, data_dir: str, suffix: str = ""):
+        """
+        Parameters
+        ----------
+        data_dir
+            the directory with a sub-directory for each basin
+        suffix
+            only files ending with "<suffix>.nc" are indexed, e.g. "2" for data resampled with 2 times
+        """
+        self.data_dir = data_dir
+        self.suffix = suffix
+        self.index_file = os.path.join(data_dir, f"{INDEX_FILE_PREFIX}{suffix}.json")
+        self._basins: Dict[str, Dict] = {}
+        if os.path.isfile(self.index_file):
+            with open(self.index_file) as f:
+                self._basins = json.load(f)
+
+    def _list_basin(self, basin_id: str) -> Dict[str, str]:
+        basin_dir = os.path.join(self.data_dir, basin_id)
+        files = {}
+        for name in os.listdir(basin_dir):
+            if not name.endswith(f"{self.suffix}.nc"):
+                continue
+            # the year is the second part of a file name, e.g. 01013500_1990_boundary.nc
+            try:
+                year = int(name.split("_")[1])
+            except (IndexError, ValueError):
+                continue
+            files[str(year)] = name
+        return files
+
+    def refresh(self, basin_ids: Sequence[str]) -> None:
+        """index the files of basins; only directories changed since the last refresh are listed again"""
+        changed = False
+        for basin_id in basin_ids:
+            mtime = os.path.getmtime(os.path.join(self.data_dir, basin_id))
+            entry = self._basins.get(basin_id)
+            if entry is not None and entry["mtime"] == mtime:
+                continue
+            self._basins[basin_id] = {
+                "mtime": mtime,
+                "files": self._list_basin(basin_id),
+            }
+            changed = True
+        if changed:
+            self._save()
+
+    def _save(self) -> None:
+        # saving is best-effort: data_dir may be read-only, and then the index is kept only in memory
+        tmp_file = self.index_file + ".tmp" + str(os.getpid())
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(self._basins, f)
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            hydro_logger.warning(f"Failed to save {self.index_file}: {e}")
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+    def paths(self, basin_id: str, years: Optional[Sequence[int]] = None) -> List[str]:
+        """paths of a basin's files in the order of years; all years by default"""
+        files = self._basins[basin_id]["files"]
+        if years is None:
+            years = sorted(int(year) for year in files)
+        return [
+            os.path.join(self.data_dir, basin_id, files[str(year)])
+            for year in sorted(years)
+            if str(year) in files
+        ]
+
+
+def open_basin_datasets(
+    paths_by_basin: Dict[str, List[str]], parallel: bool = True, **open_kwargs
+) -> Dict[str, xr.Dataset]:
+    """
+    Open the files of all basins in one batch; values are not loaded until they are accessed
+
+    Parameters
+    ----------
+    paths_by_basin
+        basin id -> paths of its yearly files
+    parallel
+        if True, files of all basins are opened in parallel with dask, as open_mfdataset(parallel=True) does for
+        the files of one basin
+    open_kwargs
+        options of xr.open_dataset shared by all files, such as decode_times
+
+    Returns
+    -------
+    Dict[str, xr.Dataset]
+        basin id -> a lazy dataset of all its years, in the order of paths_by_basin
+    """
+    open_kwargs.setdefault("chunks", {})
+    open_ = dask.delayed(xr.open_dataset) if parallel else xr.open_dataset
+    datasets = [
+        open_(path, **open_kwargs)
+        for paths in paths_by_basin.values()
+        for path in paths
+    ]
+    if parallel:
+        datasets = list(dask.compute(*datasets))
+    out = OrderedDict()
+    start = 0
+    for basin_id, paths in paths_by_basin.items():
+        basin_datasets = datasets[start : start + len(paths)]
+        start += len(paths)
+        # variables without a time dimension (e.g. lat and lon) are same in all years, so they are not compared
+        out[basin_id] = xr.combine_by_coords(
+            basin_datasets,
+            data_vars="minimal",
+            coords="minimal",
+            compat="override",
+            combine_attrs="override",
+        )
+    return out
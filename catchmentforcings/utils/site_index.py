@@ -0,0 +1,66 @@
+"""
+Index of sites (gages or basins) by their ids
+
+The index is a dict from a site's id to its row in the site table and its HUC02 id, built once, so looking up many
+sites is linear rather than comparing the whole id column (or calling list.index) for each site.
+"""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def common_rows(all_ids: Sequence, ids: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rows of the common sites in all_ids and in ids; neither of them need be sorted
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        rows in all_ids and the corresponding rows in ids
+    """
+    ind = pd.Index(ids).get_indexer(all_ids)
+    ok = ind >= 0
+    return np.flatnonzero(ok), ind[ok]
+
+
+class SiteIndex:
+    """id -> (row, HUC02 id) of the sites in a table"""
+
+    def __init__(self, ids: Sequence, huc02s: Optional[Sequence] = None):
+        """
+        Parameters
+        ----------
+        ids
+            ids of all sites, in the order of rows of the site table
+        huc02s
+            HUC02 ids of the sites; None if the table has no HUC02 ids
+        """
+        if huc02s is None:
+            huc02s = [None] * len(ids)
+        self._sites: Dict[str, Tuple[int, Optional[str]]] = {
+            str(site_id): (i, huc02)
+            for i, (site_id, huc02) in enumerate(zip(ids, huc02s))
+        }
+
+    def __contains__(self, site_id) -> bool:
+        return str(site_id) in self._sites
+
+    def __len__(self) -> int:
+        return len(self._sites)
+
+    def _get(self, site_id) -> Tuple[int, Optional[str]]:
+        try:
+            return self._sites[str(site_id)]
+        except KeyError as e:
+            raise KeyError(f"No such site: {site_id}") from e
+
+    def row(self, site_id) -> int:
+        return self._get(site_id)[0]
+
+    def huc02(self, site_id) -> Optional[str]:
+        return self._get(site_id)[1]
+
+    def rows(self, site_ids: Sequence) -> np.ndarray:
+        """rows of sites in the order of site_ids"""
+        return np.array([self._get(site_id)[0] for site_id in site_ids], dtype=int)
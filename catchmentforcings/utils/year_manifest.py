@@ -0,0 +1,144 @@
+"""
+Append yearly data to the text file of a basin without rewriting it
+
+A small manifest "<txt_file>.years" records the years in the text file and the file's size and modification time, so
+checking whether a year is present needs no parsing of the text file, and a new (later) year is only appended to the
+end of the file. If the text file is changed by other tools, even rewritten with the same size, its size or
+modification time differs from that in the manifest, so the manifest is rebuilt.
+"""
+import json
+import os
+from typing import Dict, Optional, Set
+
+import pandas as pd
+
+MANIFEST_SUFFIX = ".years"
+
+
+def manifest_path(txt_file: str) -> str:
+    return txt_file + MANIFEST_SUFFIX
+
+
+def _txt_stat(txt_file: str) -> Dict[str, int]:
+    stat = os.stat(txt_file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _write_manifest(txt_file: str, years: Set[int]) -> None:
+    the_path = manifest_path(txt_file)
+    tmp_path = the_path + ".tmp" + str(os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump({**_txt_stat(txt_file), "years": sorted(years)}, f)
+    os.replace(tmp_path, the_path)
+
+
+def read_manifest(txt_file: str, sep: str = " ", year_col: str = "Year") -> Set[int]:
+    """
+    Years in a text file; if the manifest is missing or stale, it is rebuilt from the year column of the file
+
+    Parameters
+    ----------
+    txt_file
+        the text file of a basin
+    sep
+        separator of the text file
+    year_col
+        name of the year column
+
+    Returns
+    -------
+    Set[int]
+        years in the file; empty if the file does not exist
+    """
+    if not os.path.isfile(txt_file):
+        return set()
+    the_path = manifest_path(txt_file)
+    if os.path.isfile(the_path):
+        try:
+            with open(the_path) as f:
+                manifest = json.load(f)
+            txt_stat = _txt_stat(txt_file)
+            if all(manifest[k] == v for k, v in txt_stat.items()):
+                return set(manifest["years"])
+        except (ValueError, KeyError):
+            pass
+    years = set(
+        pd.read_csv(txt_file, sep=sep, usecols=[year_col])[year_col]
+        .unique()
+        .astype(int)
+        .tolist()
+    )
+    _write_manifest(txt_file, years)
+    return years
+
+
+def append_year_to_txt(
+    txt_file: str,
+    data_df: pd.DataFrame,
+    year: int,
+    sep: str = " ",
+    float_format: Optional[str] = None,
+    year_col: str = "Year",
+    sort_cols: Optional[list] = None,
+) -> bool:
+    """
+    Add the data of a year to the text file of a basin
+
+    If the year is later than all years in the file, the data are appended to the end of the file; if it is earlier
+    (e.g. a backfill in reverse order), the file is rewritten in time order as before.
+
+    Parameters
+    ----------
+    txt_file
+        the text file of a basin
+    data_df
+        data of the year, with the same columns as the file
+    year
+        the year of data_df
+    sep
+        separator of the text file
+    float_format
+        the float format of values
+    year_col
+        name of the year column
+    sort_cols
+        columns to sort the data when the file is rewritten; the default is Year, Mnth, Day
+
+    Returns
+    -------
+    bool
+        False if the year is already in the file, so nothing is written
+    """
+    years = read_manifest(txt_file, sep=sep, year_col=year_col)
+    if year in years:
+        return False
+    if not years:
+        data_df.to_csv(
+            txt_file, header=True, index=False, sep=sep, float_format=float_format
+        )
+    elif year > max(years):
+        data_df.to_csv(
+            txt_file,
+            mode="a",
+            header=False,
+            index=False,
+            sep=sep,
+            float_format=float_format,
+        )
+    else:
+        if sort_cols is None:
+            sort_cols = [year_col, "Mnth", "Day"]
+        data_old = pd.read_csv(txt_file, sep=sep)
+        pd.concat([data_old, data_df]).sort_values(by=sort_cols).to_csv(
+            txt_file, header=True, index=False, sep=sep, float_format=float_format
+        )
+    years.add(year)
+    _write_manifest(txt_file, years)
+    return True
+
+
+def remove_manifest(txt_file: str) -> None:
+    """remove the manifest of a text file, used when the file is removed or moved"""
+    the_path = manifest_path(txt_file)
+    if os.path.isfile(the_path):
+        os.remove(the_path)
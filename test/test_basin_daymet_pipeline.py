@@ -0,0 +1,71 @@
+import os
+
+from catchmentforcings.daymet4basins.basin_daymet_pipeline import (
+    make_task,
+    run_pipeline,
+    valid_txt,
+)
+
+
+def _write_txt(save_path, years):
+    with open(save_path, "w") as f:
+        f.write("Year Mnth Day Hr prcp(mm/day)\n")
+        for year in years:
+            f.write(f"{year} 1 1 12 1.0\n")
+
+
+def _raise_error(save_path):
+    raise ValueError("a broken input")
+
+
+def _missing_input(basin_id):
+    raise FileNotFoundError("This file has not been downloaded: " + basin_id)
+
+
+def test_valid_txt(tmp_path):
+    txt_file = str(tmp_path / "01013500_lump_daymet_forcing.txt")
+    assert not valid_txt(txt_file)
+    _write_txt(txt_file, [2000, 2001])
+    assert valid_txt(txt_file)
+    assert valid_txt(txt_file, years=[2000, 2001])
+    # a file without a year is not valid, so a run with more years does it again
+    assert not valid_txt(txt_file, years=[2000, 2001, 2002])
+    with open(txt_file, "w") as f:
+        f.write("Year Mnth Day Hr prcp(mm/day)\n")
+    assert not valid_txt(txt_file)
+
+
+def test_run_pipeline(tmp_path):
+    years = [2000, 2001]
+    outputs = [str(tmp_path / f"{basin_id}.txt") for basin_id in ["a", "b", "c", "d"]]
+    # the output of "a" is valid, and the output of "b" misses a year
+    _write_txt(outputs[0], years)
+    _write_txt(outputs[1], [2000])
+    tasks = [
+        make_task("a", _write_txt, lambda: (outputs[0], years)),
+        make_task("b", _write_txt, lambda: (outputs[1], years)),
+        make_task("c", _raise_error, lambda: (outputs[2],)),
+        make_task("d", _write_txt, lambda: (_missing_input("d"), years)),
+    ]
+    assert tasks[3][1].__name__ == "missing_input_task"
+    summary_file = str(tmp_path / "summary.csv")
+    summary = run_pipeline(
+        tasks,
+        outputs,
+        validate=lambda txt_file: valid_txt(txt_file, years),
+        summary_file=summary_file,
+    )
+    status = summary.set_index("task")["status"]
+    assert status.to_dict() == {
+        "a": "skipped",
+        "b": "done",
+        "c": "failed",
+        "d": "failed",
+    }
+    errors = summary.set_index("task")["error"]
+    assert "ValueError: a broken input" in errors["c"]
+    assert "This file has not been downloaded: d" in errors["d"]
+    # failed tasks do not stop the run, and they leave no outputs
+    assert valid_txt(outputs[1], years)
+    assert not os.path.exists(outputs[2]) and not os.path.exists(outputs[3])
+    assert os.path.isfile(summary_file)
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+from affine import Affine
+from shapely.geometry import box
+
+from catchmentforcings.utils.basin_weights import BasinWeights
+from catchmentforcings.utils.mask_cache import MaskCache, cached_geometry_mask
+
+
+def test_basin_weights_mean():
+    transform = Affine(1.0, 0.0, 0.0, 0.0, -1.0, 10.0)
+    shape = (10, 10)
+    # half of the first basin's boundary cells are covered
+    geometries = [box(0.5, 6.5, 2.5, 8.5), box(5.0, 0.0, 10.0, 5.0)]
+    weights = BasinWeights.from_geometries(geometries, transform, shape)
+    np.testing.assert_allclose(weights.matrix.sum(axis=1).A1, [4.0, 25.0])
+
+    values = np.arange(2 * 10 * 10, dtype=float).reshape(2, 10, 10)
+    values[0, 9, 9] = np.nan
+    means = weights.mean(values)
+    assert means.shape == (2, 2)
+    # cells of the first basin: rows 1-3, cols 0-2 with weights 0.25/0.5/1
+    w = np.array([[0.25, 0.5, 0.25], [0.5, 1.0, 0.5], [0.25, 0.5, 0.25]])
+    np.testing.assert_allclose(
+        means[0], [(values[i, 1:4, 0:3] * w).sum() / w.sum() for i in range(2)]
+    )
+    np.testing.assert_allclose(
+        means[1], [np.nanmean(values[i, 5:10, 5:10]) for i in range(2)]
+    )
+
+
+def test_mask_cache(tmp_path):
+    transform = Affine(1.0, 0.0, 0.0, 0.0, -1.0, 10.0)
+    geometry = box(0.5, 6.5, 2.5, 8.5)
+    cache = MaskCache(cache_dir=str(tmp_path), max_items=1)
+    mask = cached_geometry_mask(geometry, (10, 10), transform, cache=cache)
+    weights = BasinWeights.from_geometries(
+        [geometry], transform, (10, 10), cache=cache
+    )
+    # read from disk with a new cache
+    cache_again = MaskCache(cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(
+        cached_geometry_mask(geometry, (10, 10), transform, cache=cache_again), mask
+    )
+    weights_again = BasinWeights.from_geometries(
+        [geometry], transform, (10, 10), cache=cache_again
+    )
+    assert (weights.matrix != weights_again.matrix).nnz == 0
+    assert len(list(tmp_path.glob("*/*.npz"))) == 2
+
+
+def test_mask_cache_not_saved(tmp_path):
+    transform = Affine(1.0, 0.0, 0.0, 0.0, -1.0, 10.0)
+    geometry = box(0.5, 6.5, 2.5, 8.5)
+    # a cache directory which cannot be created, like a read-only one; masks are still kept in memory
+    not_a_dir = tmp_path / "masks"
+    not_a_dir.write_text("")
+    cache = MaskCache(cache_dir=str(not_a_dir))
+    mask = cached_geometry_mask(geometry, (10, 10), transform, cache=cache)
+    np.testing.assert_array_equal(
+        mask,
+        cached_geometry_mask(
+            geometry, (10, 10), transform, cache=MaskCache(cache_dir="")
+        ),
+    )
+    key = list(cache._memory)[0]
+    np.testing.assert_array_equal(cache.get(key)["mask"], ~mask)
+    assert sorted(os.listdir(tmp_path)) == ["masks"]
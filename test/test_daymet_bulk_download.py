@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+from catchmentforcings.daymet4basins.daymet_bulk_download import (
+    daymet_subset_requests,
+    download_daymet_bulk,
+)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """returns the requested path as the content; requests of prcp fail once with 503, and of swe always with 404"""
+
+    def do_GET(self):
+        counts = self.server.counts
+        path = unquote(self.path)
+        with self.server.lock:
+            counts[path] += 1
+            n = counts[path]
+        if "var=swe" in self.path:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if "var=prcp" in self.path and n == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.counts = Counter()
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_daymet_bulk_download(stub_server, tmp_path):
+    base_url = f"http://127.0.0.1:{stub_server.server_address[1]}/ncss"
+    bounds = (-70.0, 44.0, -69.0, 45.0)
+    # the second job has the same bounds and an overlapping year, so only a new year is requested for it
+    jobs = [(bounds, [2000, 2001]), (bounds, [2001, 2002])]
+    requests, job_urls = daymet_subset_requests(
+        jobs, ["prcp", "tmax"], base_url=base_url
+    )
+    assert len(requests) == 6
+    assert job_urls[0][2001] == job_urls[1][2001]
+    # Daymet has no Dec 31 in leap years
+    assert "time_end=2000-12-30T12" in job_urls[0][2000][0]
+
+    save_dir = str(tmp_path)
+    kwargs = dict(
+        variables=["prcp", "tmax"],
+        max_concurrency=4,
+        max_requests_per_second=200,
+        backoff=0.01,
+        base_url=base_url,
+    )
+    job_files = download_daymet_bulk(jobs, save_dir, **kwargs)
+    for url, file_name in requests.items():
+        path = unquote(url[len(base_url) - len("/ncss") :])
+        with open(os.path.join(save_dir, file_name)) as f:
+            assert f.read() == path
+        # a prcp request is retried after a 503
+        assert stub_server.counts[path] == (2 if "var=prcp" in url else 1)
+    assert job_files[1][2001] == job_files[0][2001]
+    assert not [f for f in os.listdir(save_dir) if ".tmp" in f]
+
+    # downloaded files are not requested again
+    n_requests = sum(stub_server.counts.values())
+    download_daymet_bulk(jobs, save_dir, **kwargs)
+    assert sum(stub_server.counts.values()) == n_requests
+
+    # a 404 is not retried, and failures are raised after other requests are done
+    kwargs["variables"] = ["swe", "tmin"]
+    with pytest.raises(ValueError):
+        download_daymet_bulk(jobs, save_dir, **kwargs)
+    assert all(n == 1 for path, n in stub_server.counts.items() if "var=swe" in path)
+    assert len([f for f in os.listdir(save_dir) if "tmin" in f]) == 3
@@ -1,4 +1,5 @@
 import os
+import time
 import pytest
 import numpy as np
 import pandas as pd
@@ -6,6 +7,8 @@ import geopandas as gpd
 import xarray as xr
 import rasterio.features as rio_features
 import pygeoutils as geoutils
+from pyproj import CRS, Transformer
+from shapely.geometry import Polygon, box
 import definitions
 from catchmentforcings.climateproj4basins.basin_nexdcp30_process import (
     trans_month_nex_dcp30to_camels_format,
@@ -18,6 +21,10 @@ from catchmentforcings.daymet4basins.basin_daymet_process import (
     trans_daymet_to_camels_format,
     insert_daymet_value_in_leap_year,
 )
+from catchmentforcings.daymet4basins.daymet_bulk_download import (
+    DAYMET_CRS,
+    open_daymet_files,
+)
 from catchmentforcings.ecmwf4basins.basin_era5_process import (
     trans_era5_land_to_camels_format,
 )
@@ -37,10 +44,13 @@ from catchmentforcings.smap4basins.basin_smap_process import (
     trans_nasa_usda_smap_to_camels_format,
 )
 from catchmentforcings.utils.hydro_geo import (
+    create_mask,
+    create_mask_by_loop,
     gage_intersect_time_zone,
     split_shp_to_shps_in_time_zones,
 )
 from catchmentforcings.utils.hydro_utils import serialize_json, unserialize_json_ordered
+from catchmentforcings.utils.mask_cache import MaskCache
 
 
 @pytest.fixture()
@@ -234,6 +244,85 @@ def test4_read_nc_write_boundary(camels, save_dir):
     ds_masked.to_netcdf(save_path)
 
 
+def test_bulk_file_to_boundary(tmp_path):
+    # a subset from THREDDS as saved by download_daymet_bulk: 1-km grid in lcc with a grid mapping variable
+    x = np.arange(1950.0, 1970.0)
+    y = np.arange(520.0, 500.0, -1.0)
+    xx, yy = np.meshgrid(x, y)
+    to_lonlat = Transformer.from_crs(DAYMET_CRS, "epsg:4326", always_xy=True)
+    lon, lat = to_lonlat.transform(xx, yy)
+    time = pd.date_range("2000-01-01", "2000-01-03")
+    ds = xr.Dataset(
+        {
+            "prcp": (
+                ("time", "y", "x"),
+                np.ones((time.size, y.size, x.size)),
+                {"grid_mapping": "lambert_conformal_conic"},
+            ),
+            "lambert_conformal_conic": ((), 0),
+        },
+        coords={
+            "time": time,
+            "y": y,
+            "x": x,
+            "lat": (("y", "x"), lat),
+            "lon": (("y", "x"), lon),
+        },
+    )
+    bulk_file = str(tmp_path / "daymet_prcp_2000.nc")
+    ds.to_netcdf(bulk_file)
+
+    clm = open_daymet_files([bulk_file])
+    assert "lambert_conformal_conic" not in clm.variables
+    assert clm.crs == DAYMET_CRS
+    assert clm["prcp"].attrs["units"] == "mm/day"
+    assert clm.attrs["res"] == (1.0, -1.0)
+    # a basin covering the cells whose centers are 1955 <= x <= 1959 and 505 <= y <= 509
+    basin = Polygon(
+        zip(*to_lonlat.transform(*box(1954.5, 504.5, 1959.5, 509.5).exterior.xy))
+    )
+    ds_bound = generate_boundary_dataset(clm, basin)
+    np.testing.assert_array_equal(ds_bound["x"], np.arange(1955.0, 1960.0))
+    np.testing.assert_array_equal(ds_bound["y"], np.arange(509.0, 504.0, -1.0))
+
+
+def test_create_mask_vectorized_vs_loop(camels, save_dir):
+    basin_id = "01013500"
+    camels_shp_file = camels.data_source_description["CAMELS_BASINS_SHP_FILE"]
+    camels_shp = gpd.read_file(camels_shp_file)
+    camels_shp_epsg4326 = camels_shp.to_crs(epsg=4326)
+    geometry = camels_shp_epsg4326[
+        camels_shp_epsg4326["hru_id"] == int(basin_id)
+    ].geometry.item()
+
+    read_path = os.path.join(save_dir, f"{basin_id}_2000_01_01-03_nomask.nc")
+    ds = xr.open_dataset(read_path)
+    crs_from = CRS.from_epsg(4326)
+    crs_to = CRS.from_user_input(ds.crs)
+    args = (
+        geometry,
+        ds["x"].values,
+        ds["y"].values,
+        ds["lon"].values,
+        ds["lat"].values,
+        crs_from,
+        crs_to,
+    )
+    start = time.time()
+    mask_loop = create_mask_by_loop(*args)
+    time_loop = time.time() - start
+    start = time.time()
+    # no cache here, so that we only compare the calculation
+    mask_vec = create_mask(*args, cache=MaskCache(cache_dir=""))
+    time_vec = time.time() - start
+    print(
+        f"create_mask of {len(mask_vec)} cells: loop {time_loop:.4f}s, vectorized {time_vec:.4f}s"
+    )
+    assert mask_loop == mask_vec
+    mask_arr = create_mask(*args, cache=MaskCache(cache_dir=""), as_array=True)
+    assert mask_arr.sum() == len(mask_vec)
+
+
 def test_resample_nc(save_dir):
     basin_id = "01013500"
     nc_path = os.path.join(save_dir, f"{basin_id}_2000_01_01-03_bound.nc")
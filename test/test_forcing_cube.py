@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from catchmentforcings.utils.forcing_cube import ForcingCube, forcing_cube_path
+from catchmentforcings.utils.forcing_store import ForcingStore
+
+
+def _store(tmp_path, basins, time):
+    rng = np.random.default_rng(0)
+    frames = {}
+    for basin in basins:
+        frames[basin] = pd.DataFrame(
+            {
+                "Year": time.year,
+                "Mnth": time.month,
+                "Day": time.day,
+                "Hr": 12,
+                "prcp(mm/day)": rng.uniform(0, 50, time.size),
+                "srad(W/m2)": rng.uniform(0, 400, time.size),
+                "tmax(C)": rng.uniform(-10, 30, time.size),
+            }
+        )
+    store = ForcingStore(str(tmp_path / "lump_test_forcing.zarr"))
+    store.write_camels_frames(frames)
+    return store
+
+
+def test_forcing_cube_same_as_store(tmp_path):
+    basins = ["01013500", "01022500", "01030500", "01031500"]
+    time = pd.date_range("2000-01-01", "2001-12-31")
+    store = _store(tmp_path, basins, time)
+    cube = ForcingCube(forcing_cube_path(store.store_path))
+    assert cube.cube_path.endswith("lump_test_forcing.cube")
+    assert not cube.exists()
+    cube.build_from_store(store)
+    assert cube.exists()
+    assert cube.basins.tolist() == basins
+    assert cube.variables == ["prcp", "srad", "tmax"]
+
+    # consecutive basins, days and variables are a view of the file
+    t_range_list = pd.date_range("2000-03-01", "2000-06-30").values
+    view = cube.read(basins[1:3], t_range_list, ["srad", "tmax"])
+    assert isinstance(view, np.memmap)
+    assert not view.flags.writeable
+    np.testing.assert_array_equal(
+        view, store.read(basins[1:3], t_range_list, ["srad", "tmax"])
+    )
+
+    # others are copied; days not in the cube are NaN
+    t_range_list = pd.date_range("1999-12-30", "2000-01-10").values
+    var_lst = ["tmax", "prcp"]
+    data = cube.read([basins[3], basins[0]], t_range_list, var_lst, dtype="float64")
+    assert not isinstance(data, np.memmap) and data.dtype == np.float64
+    np.testing.assert_array_equal(
+        data, store.read([basins[3], basins[0]], t_range_list, var_lst, "float64")
+    )
+    assert np.isnan(data[:, :2]).all()
+    with pytest.raises(KeyError):
+        cube.read(["02013000"], t_range_list, var_lst)
+
+
+def test_forcing_cube_can_read(tmp_path):
+    basins = ["01013500", "01022500"]
+    time = pd.date_range("2000-01-01", "2000-12-31")
+    store = _store(tmp_path, basins, time)
+    cube = ForcingCube(forcing_cube_path(store.store_path))
+    sources = [store.store_path]
+    assert not cube.can_read(basins, time.values, ["prcp"], sources)
+    cube.build_from_store(store)
+    assert cube.can_read(basins, time.values, ["prcp"], sources)
+    # basins, days or variables not in the cube
+    assert not cube.can_read(["02013000"], time.values, ["prcp"], sources)
+    assert not cube.can_read(
+        basins, pd.date_range("2000-12-01", "2001-01-31").values, ["prcp"], sources
+    )
+    assert not cube.can_read(basins, time.values, ["swe"], sources)
+    # the store is changed in place after the cube was built; each write touches the store's metadata
+    index_file = os.path.join(cube.cube_path, "index.json")
+    built = os.path.getmtime(index_file)
+    os.utime(index_file, (built - 10, built - 10))
+    os.utime(store._metadata_file(), (built - 20, built - 20))
+    assert ForcingCube(cube.cube_path).can_read(basins, time.values, ["prcp"], sources)
+    with store.open() as ds:
+        store.write_camels_frames({basins[0]: store.to_camels_frame(basins[0], ds)})
+    assert store.mtime() > built - 10
+    assert not ForcingCube(cube.cube_path).can_read(
+        basins, time.values, ["prcp"], sources
+    )
+    # an instance checks its sources only once
+    assert cube.can_read(basins, time.values, ["prcp"], sources)
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from catchmentforcings.nldas4basins.basin_nldas_process import (
+    trans_daily_nldas_to_camels_format,
+)
+from catchmentforcings.utils.forcing_store import ForcingStore, forcing_store_path
+
+
+def _camels_frame(year, seed):
+    time = pd.date_range(f"{year}-01-01", f"{year}-12-31")
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "Year": time.year,
+            "Mnth": time.month,
+            "Day": time.day,
+            "Hr": 12,
+            "prcp(mm/day)": rng.uniform(0, 50, time.size),
+            "srad(W/m2)": rng.uniform(0, 400, time.size),
+        }
+    )
+
+
+def test_forcing_store_write_read_export(tmp_path):
+    basins = ["01013500", "01022500"]
+    huc02 = {"01013500": "01", "01022500": "01", "02013000": "02"}
+    store = ForcingStore(forcing_store_path(str(tmp_path), "_lump_test_forcing.txt"))
+    frames_2000 = {b: _camels_frame(2000, i) for i, b in enumerate(basins)}
+    frames_2001 = {b: _camels_frame(2001, i + 10) for i, b in enumerate(basins)}
+    store.write_camels_frames(frames_2000, huc02)
+    # appended, then overwritten in place, then merged with a new basin
+    store.write_camels_frames(frames_2001)
+    store.write_camels_frames(frames_2000)
+    store.write_camels_frames({"02013000": _camels_frame(2001, 20)}, huc02)
+    assert store.variables == ["prcp", "srad"]
+
+    t_range_list = pd.date_range("1999-12-31", "2002-01-01").values
+    data = store.read(["02013000", "01022500"], t_range_list, ["srad", "prcp"])
+    assert data.shape == (2, t_range_list.size, 2)
+    assert data.dtype == np.float32
+    assert (
+        store.read(["01022500"], t_range_list, ["prcp"], dtype="float64").dtype
+        == np.float64
+    )
+    assert np.isnan(data[:, [0, -1]]).all()
+    assert np.isnan(data[0, 1:367]).all()
+    np.testing.assert_allclose(
+        data[1, 1:367, 1], frames_2000["01022500"]["prcp(mm/day)"], rtol=1e-6
+    )
+    np.testing.assert_allclose(
+        data[1, 367:732, 0], frames_2001["01022500"]["srad(W/m2)"], rtol=1e-6
+    )
+
+    # export the text files and import them to another store
+    txt_dir = tmp_path / "txt"
+    store.export_camels_txt(str(txt_dir), "_lump_test_forcing.txt")
+    assert (txt_dir / "02" / "02013000_lump_test_forcing.txt").is_file()
+    df = pd.read_csv(txt_dir / "01" / "01013500_lump_test_forcing.txt", sep=r"\s+")
+    assert df.columns.tolist() == frames_2000["01013500"].columns.tolist()
+    store_again = ForcingStore(str(tmp_path / "again.zarr"))
+    store_again.import_camels_txt(
+        str(txt_dir), "_lump_test_forcing.txt", list(huc02), list(huc02.values())
+    )
+    np.testing.assert_allclose(
+        store_again.read(["02013000", "01022500"], t_range_list, ["srad", "prcp"]),
+        data,
+        rtol=1e-6,
+    )
+
+
+def test_forcing_store_write_some_basins_in_place(tmp_path, monkeypatch):
+    basins = ["01013500", "01022500", "02013000"]
+    huc02 = {"01013500": "01", "01022500": "01", "02013000": "02"}
+    store = ForcingStore(str(tmp_path / "test.zarr"))
+    store.write_camels_frames(
+        {b: _camels_frame(2000, i) for i, b in enumerate(basins)}, huc02
+    )
+
+    def no_rewrite(ds):
+        raise AssertionError("the whole store should not be rewritten")
+
+    monkeypatch.setattr(store, "_write_new", no_rewrite)
+    # a new year of some basins is appended, and the other basins are written to the same days in place
+    frames_2001 = {b: _camels_frame(2001, i + 10) for i, b in enumerate(basins)}
+    store.write_camels_frames({b: frames_2001[b] for b in basins[1:]})
+    t_range_list = pd.date_range("2001-01-01", "2001-12-31").values
+    assert np.isnan(store.read(basins[:1], t_range_list, ["prcp"])).all()
+    store.write_camels_frames({basins[0]: frames_2001[basins[0]]})
+    data = store.read(basins, t_range_list, ["prcp"])
+    for i, basin in enumerate(basins):
+        np.testing.assert_allclose(
+            data[i, :, 0], frames_2001[basin]["prcp(mm/day)"], rtol=1e-6
+        )
+    with store.open() as ds:
+        assert ds["huc02"].values.tolist() == ["01", "01", "02"]
+    # a new basin needs a rewrite
+    with pytest.raises(AssertionError):
+        store.write_camels_frames({"03010655": _camels_frame(2001, 30)})
+
+
+def test_forcing_store_write_batches(tmp_path, monkeypatch):
+    basins = ["01013500", "01022500", "02013000", "03010655"]
+    huc02 = dict(zip(basins, ["01", "01", "02", "03"]))
+    store = ForcingStore(str(tmp_path / "test.zarr"))
+    frames = {
+        year: {b: _camels_frame(year, year + i) for i, b in enumerate(basins)}
+        for year in [2000, 2001]
+    }
+    # the first batch reserves all basins
+    store.write_camels_frames(
+        {b: frames[2000][b] for b in basins[:2]}, huc02, all_basins=basins
+    )
+    with store.open() as ds:
+        assert ds["basin"].values.tolist() == basins
+        assert ds["huc02"].values.tolist() == ["01", "01", "02", "03"]
+
+    def no_rewrite(ds):
+        raise AssertionError("the whole store should not be rewritten")
+
+    monkeypatch.setattr(store, "_write_new", no_rewrite)
+    store.write_camels_frames(
+        {b: frames[2000][b] for b in basins[2:]}, huc02, all_basins=basins
+    )
+    # a new year is reserved by appending it, and basins which are not a block in the store are written too
+    for batch in [basins[1:3], basins[::3]]:
+        store.write_camels_frames(
+            {b: frames[2001][b] for b in batch}, huc02, all_basins=basins
+        )
+    data = store.read(
+        basins, pd.date_range("2000-01-01", "2001-12-31").values, ["prcp"]
+    )
+    for i, basin in enumerate(basins):
+        expected = pd.concat([frames[2000][basin], frames[2001][basin]])
+        np.testing.assert_allclose(data[i, :, 0], expected["prcp(mm/day)"], rtol=1e-6)
+
+
+def test_trans_nldas_to_forcing_store(tmp_path):
+    gage_dict = {"STAID": ["01013500", "01022500"], "HUC02": ["01", "01"]}
+    time = pd.date_range("2000-01-01", "2000-12-31").strftime("%Y-%m-%d")
+    rng = np.random.default_rng(0)
+    avg_cols = [
+        "temperature_mean",
+        "specific_humidity_mean",
+        "pressure_mean",
+        "wind_u_mean",
+        "wind_v_mean",
+        "longwave_radiation_mean",
+        "convective_fraction_mean",
+        "shortwave_radiation_mean",
+    ]
+    sum_cols = [
+        "potential_energy_sum",
+        "potential_evaporation_sum",
+        "total_precipitation_sum",
+    ]
+    for name, cols in [("avg", avg_cols), ("sum", sum_cols)]:
+        df = pd.DataFrame(
+            {
+                "gage_id": np.repeat([1013500, 1022500], time.size),
+                "time_start": np.tile(time, 2),
+            }
+        )
+        for col in cols:
+            df[col] = rng.uniform(0, 10, df.shape[0])
+        df.to_csv(tmp_path / f"nldas_test_{name}_mean_2000.csv", index=False)
+    output_dir = tmp_path / "output"
+    trans_daily_nldas_to_camels_format(
+        str(tmp_path), str(output_dir), gage_dict, "test", 2000, output_format="both"
+    )
+    file_suffix = "_lump_nldas_forcing_leap.txt"
+    store = ForcingStore(forcing_store_path(str(output_dir), file_suffix))
+    txt = pd.read_csv(output_dir / "01" / ("01022500" + file_suffix), sep=" ")
+    data = store.read(
+        ["01022500"],
+        pd.date_range("2000-01-01", "2000-12-31").values,
+        ["temperature", "total_precipitation"],
+    )
+    np.testing.assert_allclose(
+        data[0],
+        txt[["temperature(C)", "total_precipitation(kg/m^2)"]].values,
+        atol=1e-4,
+    )
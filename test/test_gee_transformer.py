@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+
+from catchmentforcings.modis4basins.basin_pmlv2_process import PMLV2_GEE_SPEC
+from catchmentforcings.utils import gee_transformer
+from catchmentforcings.utils.forcing_store import ForcingStore, forcing_store_path
+from catchmentforcings.utils.gee_transformer import (
+    GeeProductSpec,
+    read_gee_year,
+    trans_gee_to_camels_format,
+)
+
+
+def _pmlv2_csv(path, year, gage_ids, seed):
+    # 8-day data, system:time_start is millisecond
+    time = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="8D")
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "hru_id": np.repeat(gage_ids, time.size),
+            "system:time_start": np.tile(time.values.astype(np.int64) // 10**6, 2),
+        }
+    )
+    for col in PMLV2_GEE_SPEC.value_cols[0]:
+        df[col] = rng.uniform(0, 5, df.shape[0])
+    df.to_csv(path, index=False)
+    return time, df
+
+
+def test_trans_gee_years_in_parallel(tmp_path):
+    gage_dict = {"STAID": ["01013500", "01022500"], "HUC02": ["01", "01"]}
+    tables = {}
+    for year in [2001, 2002]:
+        tables[year] = _pmlv2_csv(
+            tmp_path / f"PML_V2_test_mean_{year}.csv", year, [1013500, 1022500], year
+        )
+    output_dir = tmp_path / "output"
+    trans_gee_to_camels_format(
+        PMLV2_GEE_SPEC,
+        str(tmp_path),
+        str(output_dir),
+        gage_dict,
+        "test",
+        [2002, 2001],
+        workers=2,
+    )
+    result = pd.read_csv(output_dir / "01" / "01022500_lump_pmlv2_et.txt")
+    time = tables[2001][0].append(tables[2002][0])
+    # epoch times are UTC days
+    np.testing.assert_array_equal(result["Year"], time.year)
+    np.testing.assert_array_equal(result["Mnth"], time.month)
+    np.testing.assert_array_equal(result["Day"], time.day)
+    expected = pd.concat(
+        [df[df["hru_id"] == 1022500] for _, df in [tables[2001], tables[2002]]]
+    )
+    np.testing.assert_allclose(result["Ec(mm/d)"], expected["Ec"], atol=1e-4)
+
+
+def test_trans_gee_positional_columns_and_missing_basins(tmp_path):
+    # old exports have other names of columns; values follow the id and time columns
+    spec = GeeProductSpec(
+        "test",
+        ["test_{region}_avg_{year}.csv", "test_{region}_sum_{year}.csv"],
+        [["t_mean"], ["p_sum"]],
+        ["t(C)", "p(mm/day)"],
+        "_lump_test.txt",
+        time_zone="Asia/Hong_Kong",
+        skip_missing=True,
+    )
+    time = pd.date_range("2000-01-01", "2000-01-10").strftime("%Y-%m-%dT%H:%M:%S")
+    pd.DataFrame(
+        {"gage_id": "a1", "time_start": time, "temperature": np.arange(10.0)}
+    ).to_csv(tmp_path / "test_r_avg_2000.csv", index=False)
+    pd.DataFrame(
+        {"gage_id": "a1", "time_start": time[::-1], "precipitation": np.arange(10.0)}
+    ).to_csv(tmp_path / "test_r_sum_2000.csv", index=False)
+    output_dir = tmp_path / "output"
+    trans_gee_to_camels_format(
+        spec, str(tmp_path), str(output_dir), {"gage_id": ["a0", "a1"]}, "r", 2000
+    )
+    assert not (output_dir / "a0_lump_test.txt").exists()
+    result = pd.read_csv(output_dir / "a1_lump_test.txt", sep=" ")
+    # 00:00 UTC is 08:00 in Hong Kong, so days are same
+    np.testing.assert_array_equal(result["Day"], np.arange(1, 11))
+    np.testing.assert_array_equal(result["t(C)"], np.arange(10.0))
+    # sum files are joined by time rather than by order
+    np.testing.assert_array_equal(result["p(mm/day)"], np.arange(10.0)[::-1])
+
+
+def test_trans_gee_streaming_same_as_in_memory(tmp_path, monkeypatch):
+    # basins are written to the store in batches of 2, and the store is written in place after its creation
+    monkeypatch.setattr(gee_transformer, "BASIN_CHUNK", 2)
+    new_stores = []
+    write_new = ForcingStore._write_new
+
+    def count_write_new(self, ds):
+        new_stores.append(ds["basin"].values.tolist())
+        write_new(self, ds)
+
+    monkeypatch.setattr(ForcingStore, "_write_new", count_write_new)
+    gage_dict = {"gage_id": ["b1", "b2", "b3"], "huc_02": ["01", "02", "02"]}
+    spec = GeeProductSpec(
+        "test",
+        ["test_{region}_avg_{year}.csv", "test_{region}_sum_{year}.csv"],
+        [["t_mean"], ["p_sum"]],
+        ["t(C)", "p(mm/day)"],
+        "_lump_test.txt",
+        float_format="%.3f",
+    )
+    rng = np.random.default_rng(7)
+    for year in [2000, 2001]:
+        time = pd.date_range(f"{year}-01-01", f"{year}-12-31").strftime("%Y-%m-%d")
+        # rows of GEE exports are ordered by time, so rows of a basin are in all chunks
+        ids = np.tile(gage_dict["gage_id"], time.size)
+        times = np.repeat(time, 3)
+        for name, col in [("avg", "t_mean"), ("sum", "p_sum")]:
+            pd.DataFrame(
+                {"gage_id": ids, "time_start": times, col: rng.uniform(size=ids.size)}
+            ).to_csv(tmp_path / f"test_r_{name}_{year}.csv", index=False)
+    for output, kwargs in [
+        ("in_memory", {}),
+        ("streamed", {"chunksize": 100, "workers": 2, "output_format": "both"}),
+    ]:
+        trans_gee_to_camels_format(
+            spec,
+            str(tmp_path),
+            str(tmp_path / output),
+            gage_dict,
+            "r",
+            [2000, 2001],
+            **kwargs,
+        )
+    assert sorted(p.name for p in (tmp_path / "streamed").iterdir()) == [
+        "01",
+        "02",
+        "lump_test.zarr",
+    ]
+    assert new_stores == [gage_dict["gage_id"]]
+    for huc, basin in [("01", "b1"), ("02", "b3")]:
+        expected = pd.read_csv(
+            tmp_path / "in_memory" / huc / f"{basin}_lump_test.txt", sep=" "
+        )
+        result = pd.read_csv(
+            tmp_path / "streamed" / huc / f"{basin}_lump_test.txt", sep=" "
+        )
+        assert result.shape[0] == 731
+        pd.testing.assert_frame_equal(result, expected)
+    store = ForcingStore(
+        forcing_store_path(str(tmp_path / "streamed"), "_lump_test.txt")
+    )
+    data = store.read(
+        gage_dict["gage_id"], pd.date_range("2000-01-01", "2001-12-31").values, ["p"]
+    )
+    for i, (huc, basin) in enumerate(zip(gage_dict["huc_02"], gage_dict["gage_id"])):
+        expected = pd.read_csv(
+            tmp_path / "in_memory" / huc / f"{basin}_lump_test.txt", sep=" "
+        )
+        np.testing.assert_allclose(data[i, :, 0], expected["p(mm/day)"], atol=1e-3)
+
+
+def test_read_gee_year_dtypes(tmp_path):
+    _pmlv2_csv(tmp_path / "PML_V2_test_mean_2001.csv", 2001, [1013500, 1022500], 0)
+    table = read_gee_year(PMLV2_GEE_SPEC, str(tmp_path), "test", 2001)
+    assert table["hru_id"].dtype == "category"
+    assert (table[["Year", "Mnth", "Day", "Hr"]].dtypes == np.int16).all()
+    assert (table[PMLV2_GEE_SPEC.output_cols].dtypes == np.float32).all()
+    spec_float64 = GeeProductSpec(
+        "test",
+        PMLV2_GEE_SPEC.file_patterns,
+        PMLV2_GEE_SPEC.value_cols,
+        PMLV2_GEE_SPEC.output_cols,
+        PMLV2_GEE_SPEC.file_suffix,
+        id_col=PMLV2_GEE_SPEC.id_col,
+        time_col=PMLV2_GEE_SPEC.time_col,
+        time_unit=PMLV2_GEE_SPEC.time_unit,
+        value_dtype="float64",
+    )
+    table = read_gee_year(spec_float64, str(tmp_path), "test", 2001)
+    assert (table[PMLV2_GEE_SPEC.output_cols].dtypes == np.float64).all()
+
+
+def test_trans_gee_txt_keeps_precision(tmp_path):
+    spec = GeeProductSpec(
+        "test",
+        ["test_{region}_mean_{year}.csv"],
+        [["p_mean"]],
+        ["p(mm/day)"],
+        "_lump_test.txt",
+        float_format="%.4f",
+    )
+    time = pd.date_range("2000-01-01", "2000-01-03").strftime("%Y-%m-%d")
+    pd.DataFrame(
+        {"gage_id": "b1", "time_start": time, "p_mean": [98765.4321, 1.0, 2.5]}
+    ).to_csv(tmp_path / "test_r_mean_2000.csv", index=False)
+    output_dir = tmp_path / "output"
+    trans_gee_to_camels_format(
+        spec,
+        str(tmp_path),
+        str(output_dir),
+        {"gage_id": ["b1"]},
+        "r",
+        2000,
+        output_format="both",
+    )
+    # values are parsed as float64 for text files, and cast to float32 only in the store
+    with open(output_dir / "b1_lump_test.txt") as f:
+        assert f.readlines()[1].split()[-1] == "98765.4321"
+    store = ForcingStore(forcing_store_path(str(output_dir), "_lump_test.txt"))
+    data = store.read(["b1"], pd.to_datetime(time).values, ["p"])
+    assert data.dtype == np.float32
+    np.testing.assert_allclose(data[0, :, 0], [98765.4321, 1.0, 2.5], rtol=1e-6)
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from catchmentforcings.utils.gridded_store import (
+    GriddedStore,
+    gridded_store_path,
+    open_basin_year,
+    valid_store_group,
+)
+
+
+def _basin_year(year, value=None):
+    time = pd.date_range(f"{year}-01-01", f"{year}-12-31")
+    value = float(year) if value is None else value
+    return xr.Dataset(
+        {"prcp": (("time", "y", "x"), np.full((time.size, 2, 3), value))},
+        coords={"time": time, "y": [1.0, 2.0], "x": [1.0, 2.0, 3.0]},
+    )
+
+
+def test_gridded_store_write_and_read(tmp_path):
+    data_dir = os.path.join(str(tmp_path), "daymet_bound")
+    store = GriddedStore(gridded_store_path(data_dir, "2"))
+    assert store.store_path == data_dir + "_2.zarr"
+    assert not store.exists() and store.basins == []
+
+    store.write("01013500", _basin_year(2001))
+    # a later year is appended
+    store.write("01013500", _basin_year(2002))
+    assert store.years("01013500") == [2001, 2002]
+    # an existing year is overwritten in place
+    store.write("01013500", _basin_year(2001, value=-1.0))
+    # an earlier year is merged with the group
+    store.write("01013500", _basin_year(2000))
+    store.write("01022500", _basin_year(2000))
+    assert store.basins == ["01013500", "01022500"]
+    assert "01013500" in store and "01031500" not in store
+    assert store.has_years("01013500", [2000, 2001, 2002])
+    assert not store.has_years("01022500", [2000, 2001])
+
+    ds = store.open_basin("01013500")
+    assert ds["prcp"].sel(time="2000").values.max() == 2000.0
+    assert ds["prcp"].sel(time="2001").values.max() == -1.0
+    assert ds["prcp"].sel(time="2002").values.max() == 2002.0
+    assert ds.sizes["time"] == 366 + 365 + 365
+
+    group_path = store.group_path("01013500")
+    assert valid_store_group(group_path, [2000, 2002])
+    assert not valid_store_group(group_path, [1999])
+    assert not valid_store_group(store.group_path("01031500"))
+
+    # the same function opens a year from a group or from a yearly nc file
+    from_group = open_basin_year(group_path, 2002)
+    nc_file = os.path.join(str(tmp_path), "01013500_2002_boundary.nc")
+    _basin_year(2002).to_netcdf(nc_file)
+    from_file = open_basin_year(nc_file, 2002)
+    np.testing.assert_array_equal(from_group["prcp"].values, from_file["prcp"].values)
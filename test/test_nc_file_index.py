@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from catchmentforcings.utils.nc_file_index import NcFileIndex, open_basin_datasets
+
+
+def _write_basin_year(data_dir, basin_id, year):
+    time = pd.date_range(f"{year}-01-01", f"{year}-12-31")
+    ds = xr.Dataset(
+        {"prcp": (("time", "y", "x"), np.full((time.size, 2, 3), float(year)))},
+        coords={"time": time, "y": [1.0, 2.0], "x": [1.0, 2.0, 3.0]},
+    )
+    basin_dir = os.path.join(data_dir, basin_id)
+    os.makedirs(basin_dir, exist_ok=True)
+    ds.to_netcdf(os.path.join(basin_dir, f"daymet_{year}_{basin_id}.nc"))
+
+
+def test_nc_file_index_and_batched_open(tmp_path):
+    data_dir = str(tmp_path)
+    for basin_id in ["01013500", "01022500"]:
+        for year in [2000, 2001]:
+            _write_basin_year(data_dir, basin_id, year)
+    file_index = NcFileIndex(data_dir)
+    file_index.refresh(["01013500", "01022500"])
+    assert [os.path.basename(p) for p in file_index.paths("01013500")] == [
+        "daymet_2000_01013500.nc",
+        "daymet_2001_01013500.nc",
+    ]
+    # the index is saved, and a new file is found by refreshing the changed directory
+    _write_basin_year(data_dir, "01022500", 2002)
+    file_index = NcFileIndex(data_dir)
+    assert file_index.paths("01022500") == file_index.paths("01022500", [2000, 2001])
+    file_index.refresh(["01013500", "01022500"])
+    assert len(file_index.paths("01022500", [2001, 2002, 2003])) == 2
+
+    basin_datasets = open_basin_datasets(
+        {b: file_index.paths(b, [2000, 2001]) for b in ["01022500", "01013500"]}
+    )
+    assert list(basin_datasets) == ["01022500", "01013500"]
+    prcp = basin_datasets["01013500"]["prcp"]
+    # values are loaded only when they are accessed
+    assert prcp.chunks is not None
+    assert prcp.sizes["time"] == 731
+    np.testing.assert_array_equal(
+        prcp.sel(time="2001-06-01").values, np.full((2, 3), 2001.0)
+    )
+    for ds in basin_datasets.values():
+        ds.close()
+
+
+def test_nc_file_index_not_saved(tmp_path):
+    data_dir = str(tmp_path)
+    _write_basin_year(data_dir, "01013500", 2000)
+    file_index = NcFileIndex(data_dir)
+    # an index file which cannot be written, e.g. in a read-only directory, is not saved but still works
+    file_index.index_file = os.path.join(data_dir, "missing", "nc_file_index.json")
+    file_index.refresh(["01013500"])
+    assert [os.path.basename(p) for p in file_index.paths("01013500")] == [
+        "daymet_2000_01013500.nc"
+    ]
+    assert sorted(os.listdir(data_dir)) == ["01013500"]
@@ -0,0 +1,111 @@
+import dask.array
+import numpy as np
+import xarray as xr
+
+from catchmentforcings.pet.pet4daymet import pm_fao56, priestley_taylor
+from catchmentforcings.pet.pet_engine import pet_fused, pet_fused_xr
+from catchmentforcings.pet.rad_utils import extraterrestrial_r, extraterrestrial_r_lut
+
+
+def _forcings(nt=100, ny=7, nx=9, seed=1234):
+    rng = np.random.default_rng(seed)
+    t_min = rng.uniform(-15, 20, (nt, ny, nx))
+    t_max = t_min + rng.uniform(1, 15, (nt, ny, nx))
+    s_rad = rng.uniform(1, 30, (nt, ny, nx))
+    e_a = rng.uniform(0.1, 2.5, (nt, ny, nx))
+    lat = np.deg2rad(rng.uniform(25, 50, (ny, nx)))
+    elevation = rng.uniform(0, 3000, (ny, nx))
+    doy = np.arange(1, nt + 1) % 366 + 1
+    return t_min, t_max, s_rad, lat, elevation, doy, e_a
+
+
+def test_pet_fused_same_as_separate_methods():
+    t_min, t_max, s_rad, lat, elevation, doy, e_a = _forcings()
+    doy_3d = doy[:, None, None]
+    pt = priestley_taylor(t_min, t_max, s_rad, lat, elevation, doy_3d, e_a=e_a)
+    fao56 = pm_fao56(t_min, t_max, s_rad, lat, elevation, doy_3d, e_a=e_a)
+    pets = pet_fused(t_min, t_max, s_rad, lat, elevation, doy, e_a=e_a, chunk_size=7)
+    np.testing.assert_allclose(pets["priestley_taylor"], pt, rtol=1e-10)
+    np.testing.assert_allclose(pets["pm_fao56"], fao56, rtol=1e-10)
+
+
+def test_pet_fused_one_method_and_preallocated_output():
+    t_min, t_max, s_rad, lat, elevation, doy, _ = _forcings(nt=40)
+    fao56 = pm_fao56(t_min, t_max, s_rad, lat, elevation, doy[:, None, None])
+    out = np.empty(t_min.shape)
+    pets = pet_fused(
+        t_min,
+        t_max,
+        s_rad,
+        lat,
+        elevation,
+        doy,
+        methods=["pm_fao56"],
+        out={"pm_fao56": out},
+    )
+    assert list(pets.keys()) == ["pm_fao56"]
+    assert pets["pm_fao56"] is out
+    np.testing.assert_allclose(out, fao56, rtol=1e-10)
+
+
+def test_extraterrestrial_r_lookup_table():
+    rng = np.random.default_rng(42)
+    lat = np.deg2rad(rng.uniform(20, 55, (30, 40)))
+    lat[0, 0] = np.nan
+    # two years, so some days are taken from the calculated ones
+    doy = np.concatenate([np.arange(1, 367), np.arange(1, 366)])[:, None, None]
+    ra = extraterrestrial_r(doy, lat)
+    ra_lut = extraterrestrial_r_lut(doy, lat)
+    assert np.isnan(ra_lut[:, 0, 0]).all()
+    np.testing.assert_allclose(ra_lut, ra, rtol=1e-6)
+    # not integer doy, calculated directly
+    np.testing.assert_array_equal(
+        extraterrestrial_r_lut(doy + 0.5, lat), extraterrestrial_r(doy + 0.5, lat)
+    )
+
+
+def test_pet_fused_xr_lazy():
+    t_min, t_max, s_rad, lat, elevation, doy, e_a = _forcings()
+    pets = pet_fused(t_min, t_max, s_rad, lat, elevation, doy, e_a=e_a)
+    dims = ("time", "y", "x")
+    chunks = {"time": 30, "y": 4}
+    args = [
+        xr.DataArray(t_min, dims=dims).chunk(chunks),
+        xr.DataArray(t_max, dims=dims).chunk(chunks),
+        xr.DataArray(s_rad, dims=dims).chunk(chunks),
+        xr.DataArray(lat, dims=dims[1:]).chunk({"y": 4}),
+        xr.DataArray(elevation, dims=dims[1:]),
+        xr.DataArray(doy, dims="time"),
+    ]
+    pets_xr = pet_fused_xr(*args, e_a=xr.DataArray(e_a, dims=dims).chunk(chunks))
+    for method, pet in pets_xr.items():
+        assert isinstance(pet.data, dask.array.Array)
+        np.testing.assert_allclose(pet.compute().values, pets[method])
+
+
+def test_pet_with_chunked_lat_and_doy():
+    t_min, t_max, s_rad, lat, elevation, doy, e_a = _forcings()
+    dims = ("time", "y", "x")
+    lat_xr = xr.DataArray(lat, dims=dims[1:]).chunk({"y": 4})
+    doy_xr = xr.DataArray(doy, dims="time").chunk({"time": 30})
+    ra = extraterrestrial_r_lut(doy_xr, lat_xr)
+    assert isinstance(ra.data, dask.array.Array)
+    np.testing.assert_allclose(
+        ra.compute().values,
+        extraterrestrial_r(doy[:, None, None], lat[None, :, :]),
+        rtol=1e-6,
+    )
+    args = [
+        xr.DataArray(t_min, dims=dims).chunk({"time": 30}),
+        xr.DataArray(t_max, dims=dims).chunk({"time": 30}),
+        xr.DataArray(s_rad, dims=dims).chunk({"time": 30}),
+        lat_xr,
+        xr.DataArray(elevation, dims=dims[1:]),
+        doy_xr,
+        xr.DataArray(e_a, dims=dims).chunk({"time": 30}),
+    ]
+    eager = [xr.DataArray(arg.values, dims=arg.dims) for arg in args]
+    for pet_func in [priestley_taylor, pm_fao56]:
+        pet = pet_func(*args)
+        assert isinstance(pet.data, dask.array.Array)
+        np.testing.assert_allclose(pet.compute().values, pet_func(*eager).values)
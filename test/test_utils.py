@@ -1,5 +1,27 @@
+import os
+
 import numpy as np
-from catchmentforcings.utils.hydro_utils import utc_to_local
+import pandas as pd
+import pytest
+
+from catchmentforcings.utils.attr_cache import AttrMatrix
+from catchmentforcings.utils.flow_cache import (
+    FlowCache,
+    best_flow_column,
+    mask_flow_qualifiers,
+)
+from catchmentforcings.utils.gage_splitter import GageSplitter
+from catchmentforcings.utils.hydro_utils import (
+    utc_to_local,
+    utc_to_local_array,
+    year_month_day_hour,
+)
+from catchmentforcings.utils.site_index import SiteIndex, common_rows
+from catchmentforcings.utils.year_manifest import (
+    append_year_to_txt,
+    manifest_path,
+    read_manifest,
+)
 
 
 def test_always_passes():
@@ -17,3 +39,189 @@ def test_tz_np_trans():
     utc_time = np.datetime64("2020-01-01T00:00:00")
     utc_ts = utc_to_local(utc_time)
     assert utc_ts == "2020-01-01T08:00:00"
+
+
+def test_tz_array_trans():
+    utc_times = ["2020-01-01T00:00:00", "2020-06-30T20:00:00"]
+    expected = [utc_to_local(a_time, "America/New_York") for a_time in utc_times]
+    for times in [utc_times, np.array(utc_times, dtype="datetime64[s]")]:
+        local_times = utc_to_local_array(times, "America/New_York")
+        assert local_times.strftime("%Y-%m-%dT%H:%M:%S").tolist() == expected
+
+
+def test_year_month_day_hour():
+    expected = pd.DataFrame(
+        {"Year": [2000, 2001], "Mnth": [2, 1], "Day": [29, 1], "Hr": [12, 12]}
+    )
+    for times, unit in [
+        (["2000-02-29", "2001-01-01"], None),
+        (np.array(["2000-02-29", "2001-01-01"], dtype="datetime64[D]"), None),
+        ([951782400000, 978307200000], "ms"),
+        ([2000060, "2001001"], "julian"),
+    ]:
+        pd.testing.assert_frame_equal(
+            year_month_day_hour(times, unit=unit), expected, check_dtype=False
+        )
+    hours = year_month_day_hour(["2000-01-01T06:00:00"], hour=None)["Hr"]
+    assert hours.tolist() == [6]
+
+
+def _year_df(year):
+    time = pd.date_range(f"{year}-01-01", f"{year}-12-31")
+    return pd.DataFrame(
+        {
+            "Year": time.year,
+            "Mnth": time.month,
+            "Day": time.day,
+            "Hr": 12,
+            "prcp(mm/day)": np.arange(time.size) / 7.0,
+        }
+    )
+
+
+def test_append_year_to_txt(tmp_path):
+    txt_file = str(tmp_path / "01013500_lump_test.txt")
+    assert append_year_to_txt(txt_file, _year_df(2001), 2001, float_format="%.2f")
+    size_2001 = os.path.getsize(txt_file)
+    assert append_year_to_txt(txt_file, _year_df(2002), 2002, float_format="%.2f")
+    with open(txt_file) as f:
+        f.seek(size_2001)
+        # only the new rows are appended
+        assert f.readline().startswith("2002 1 1 12 ")
+    assert not append_year_to_txt(txt_file, _year_df(2002), 2002)
+    # an earlier year is inserted in time order
+    assert append_year_to_txt(txt_file, _year_df(2000), 2000, float_format="%.2f")
+    assert read_manifest(txt_file) == {2000, 2001, 2002}
+    df = pd.read_csv(txt_file, sep=" ")
+    expected = pd.concat([_year_df(y) for y in [2000, 2001, 2002]])
+    np.testing.assert_array_equal(df["Year"].values, expected["Year"].values)
+    np.testing.assert_allclose(
+        df["prcp(mm/day)"].values, expected["prcp(mm/day)"].values, atol=0.005
+    )
+    # the manifest is rebuilt if the file is changed by others
+    df[df["Year"] < 2002].to_csv(txt_file, sep=" ", index=False)
+    assert read_manifest(txt_file) == {2000, 2001}
+    os.remove(manifest_path(txt_file))
+    assert read_manifest(txt_file) == {2000, 2001}
+    # also if it is rewritten with the same size
+    size = os.path.getsize(txt_file)
+    with open(txt_file) as f:
+        text = f.read().replace("\n2001 ", "\n2003 ")
+    with open(txt_file, "w") as f:
+        f.write(text)
+    assert os.path.getsize(txt_file) == size
+    mtime_ns = os.stat(txt_file).st_mtime_ns + 10**9
+    os.utime(txt_file, ns=(mtime_ns, mtime_ns))
+    assert read_manifest(txt_file) == {2000, 2003}
+
+
+def test_gage_splitter():
+    ids = ["01013500", "02000000", "1013500", "01022500", "02000000"]
+    data = pd.DataFrame({"gage_id": ids, "value": np.arange(5)})
+    by_gage = GageSplitter(data, "gage_id")
+    assert len(by_gage) == 3
+    # ids are compared as integers, and rows keep their order
+    np.testing.assert_array_equal(by_gage.get("01013500")["value"].values, [0, 2])
+    np.testing.assert_array_equal(by_gage.get(2000000)["value"].values, [1, 4])
+    assert by_gage.get("09999999").shape == (0, 2)
+    assert "01022500" in by_gage and "abc" not in by_gage
+    # not numeric ids are compared as strings
+    by_name = GageSplitter(pd.DataFrame({"id": ["a", "b ", "a"]}), "id")
+    assert [i[2].shape[0] for i in by_name.split(["a", "b", "c"])] == [2, 1, 0]
+
+
+def test_site_index():
+    index = SiteIndex(["01013500", "01022500", "02013000"], ["01", "01", "02"])
+    assert index.row("02013000") == 2 and index.huc02("02013000") == "02"
+    np.testing.assert_array_equal(index.rows(["02013000", "01013500"]), [2, 0])
+    assert "01022500" in index and "09999999" not in index
+    with pytest.raises(KeyError):
+        index.huc02("09999999")
+    # ids of a file may be in another order and miss some sites
+    rows, file_rows = common_rows(["c", "a", "b"], ["b", "d", "a"])
+    np.testing.assert_array_equal(rows, [1, 2])
+    np.testing.assert_array_equal(file_rows, [2, 0])
+
+
+def test_attr_matrix_cache(tmp_path):
+    source_file = tmp_path / "conterm_test.txt"
+    source_file.write_text("STAID,CLASS,AREA\n")
+    classes = pd.Series(["Ref", "Non-ref", np.nan, "Ref"])
+    codes, ref = pd.factorize(classes, sort=True)
+    attr = AttrMatrix(
+        ["a", "b", "c", "d"],
+        np.column_stack([codes, [1.0, 2.0, 3.0, 4.0]]),
+        ["CLASS", "AREA"],
+        {"test": ["CLASS", "AREA"]},
+        {"CLASS": ref.tolist()},
+    )
+    # str attrs are factorized again over the chosen sites, as pd.factorize does
+    out, f_dict = attr.select(np.array([3, 2, 0]))
+    expected, expected_ref = pd.factorize(classes[[3, 2, 0]], sort=True)
+    np.testing.assert_array_equal(out[:, 0], expected)
+    assert f_dict == {"CLASS": expected_ref.tolist()}
+    out, f_dict = attr.select(np.array([1, 3]), ["AREA"])
+    np.testing.assert_array_equal(out[:, 0], [2.0, 4.0])
+    assert f_dict == {}
+
+    cache_file = str(tmp_path / "attr_cache.npz")
+    attr.save(cache_file, [str(source_file)])
+    cached = AttrMatrix.load(cache_file, [str(source_file)])
+    np.testing.assert_array_equal(cached.data, attr.data)
+    assert cached.var_dict == attr.var_dict and cached.f_dict == attr.f_dict
+    # a changed source file makes the cache stale
+    os.utime(source_file, (0, 0))
+    assert AttrMatrix.load(cache_file, [str(source_file)]) is None
+    # a cache which could not be written raises OSError (Gages.build_attr_cache ignores it) and leaves no file
+    with pytest.raises(OSError):
+        attr.save(str(tmp_path / "missing" / "cache.npz"), [str(source_file)])
+    assert sorted(os.listdir(tmp_path)) == ["attr_cache.npz", "conterm_test.txt"]
+
+
+def test_flow_cache(tmp_path):
+    source_file = tmp_path / "01013500.txt"
+    source_file.write_text("agency_cd\tsite_no\tdatetime\n")
+    time = pd.date_range("2000-01-01", "2000-01-10").values
+    flow = np.arange(20, dtype=np.float32).reshape(2, 10)
+    codes = np.tile(np.array([0, 1, -1, 0, 0, 0, 0, 0, 0, 0], dtype=np.int16), (2, 1))
+    cache = FlowCache(["01013500", "01022500"], time, flow, codes, ["A", "P"])
+    cache_file = str(tmp_path / "flow_cache.npz")
+    cache.save(cache_file, [str(source_file)])
+    cached = FlowCache.load(cache_file, [str(source_file)])
+    assert cached.qualifiers == ["A", "P"]
+    t_lst = pd.date_range("2000-01-02", "2000-01-03").values
+    assert cached.covers(["01022500"], t_lst)
+    assert not cached.covers(["01022500"], pd.date_range("2000-01-09", "2000-01-11"))
+    assert not cached.covers(["02013000"], t_lst)
+    flow_read, codes_read = cached.read(["01022500", "01013500"], t_lst)
+    np.testing.assert_array_equal(flow_read, [[11, 12], [1, 2]])
+    np.testing.assert_array_equal(codes_read, [[1, -1], [1, -1]])
+    os.utime(source_file, (0, 0))
+    assert FlowCache.load(cache_file, [str(source_file)]) is None
+
+
+def test_flow_qualifiers_and_best_flow_column():
+    # like an RDB file read by Gages: the first non-value row is dropped, so the index starts at 1
+    df_flow = pd.DataFrame(
+        {
+            "datetime": ["2000-01-01", "2000-01-02", "2000-01-03", "2000-01-04"],
+            "1_00060_00003": ["1.0", "Ice", np.nan, "4.0"],
+            "1_00060_00003_cd": ["A", "A", np.nan, "P"],
+            "2_00060_00003": ["Eqp", "2.0", "3.0", np.nan],
+            "2_00060_00003_cd": [np.nan, "A", "A", np.nan],
+        },
+        index=range(1, 5),
+    )
+    columns_flow = ["1_00060_00003", "2_00060_00003"]
+    mask_flow_qualifiers(df_flow, columns_flow)
+    assert df_flow["1_00060_00003"].isna().tolist() == [False, True, True, False]
+    assert df_flow["2_00060_00003"].isna().tolist() == [True, False, False, True]
+    # values of other columns are kept
+    assert df_flow["1_00060_00003_cd"].tolist()[:2] == ["A", "A"]
+    t_lst = pd.date_range("2000-01-02", "2000-01-04").values
+    assert best_flow_column(df_flow, t_lst, columns_flow) == 1
+    # a tie goes to the first column
+    t_lst = pd.date_range("2000-01-01", "2000-01-04").values
+    assert best_flow_column(df_flow, t_lst, columns_flow) == 0
+    mask_flow_qualifiers(df_flow, "1_00060_00003", ["4.0"])
+    assert df_flow["1_00060_00003"].notna().sum() == 1